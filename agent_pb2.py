@@ -20,7 +20,7 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   syntax='proto3',
   serialized_options=b'Z\033github.com/syigen/rakun/api',
   create_key=_descriptor._internal_create_key,
-  serialized_pb=b'\n\x0b\x61gent.proto\x12\tapi.agent\x1a\x1fgoogle/protobuf/timestamp.proto\"!\n\x05\x41gent\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\"\"\n\x04\x44\x61ta\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x0c\"&\n\x08InitData\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\x98\x02\n\x07Message\x12\n\n\x02id\x18\x01 \x01(\t\x12 \n\x06sender\x18\x02 \x01(\x0b\x32\x10.api.agent.Agent\x12 \n\x07\x63ontent\x18\x03 \x03(\x0b\x32\x0f.api.agent.Data\x12\x12\n\nrequest_id\x18\x04 \x01(\t\x12*\n\x04type\x18\x06 \x01(\x0e\x32\x17.api.agent.Message.TypeH\x00\x88\x01\x01\x12\x0c\n\x04tags\x18\x07 \x03(\t\x12-\n\ttimestamp\x18\x08 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\"7\n\x04Type\x12\n\n\x06SYSTEM\x10\x00\x12\t\n\x05\x41GENT\x10\x01\x12\x0b\n\x07\x43OMMAND\x10\x02\x12\x0b\n\x07\x44ISPLAY\x10\x03\x42\x07\n\x05_type\"h\n\x07\x43onnect\x12\x1e\n\x04user\x18\x01 \x01(\x0b\x32\x10.api.agent.Agent\x12\x0e\n\x06\x61\x63tive\x18\x02 \x01(\x08\x12-\n\ttimestamp\x18\x03 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\"Y\n\tTimeDelta\x12-\n\ttimestamp\x18\x01 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x1d\n\x04meta\x18\x02 \x03(\x0b\x32\x0f.api.agent.Data\"\x07\n\x05\x43lose\"F\n\x0c\x44ynamicAgent\x12\x0c\n\x04name\x18\x01 \x01(\t\x12(\n\x0binitConfigs\x18\x02 \x03(\x0b\x32\x13.api.agent.InitData2\xf7\x01\n\tBroadcast\x12\x38\n\x0c\x43reateStream\x12\x12.api.agent.Connect\x1a\x12.api.agent.Message0\x01\x12\x36\n\x08SyncTime\x12\x12.api.agent.Connect\x1a\x14.api.agent.TimeDelta0\x01\x12\x38\n\x10\x42roadcastMessage\x12\x12.api.agent.Message\x1a\x10.api.agent.Close\x12>\n\x11StartDynamicAgent\x12\x17.api.agent.DynamicAgent\x1a\x10.api.agent.CloseB\x1dZ\x1bgithub.com/syigen/rakun/apib\x06proto3'
+  serialized_pb=b'\n\x0b\x61gent.proto\x12\tapi.agent\x1a\x1fgoogle/protobuf/timestamp.proto\"!\n\x05\x41gent\x12\n\n\x02id\x18\x01 \x01(\t\x12\x0c\n\x04name\x18\x02 \x01(\t\"\"\n\x04\x44\x61ta\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\x0c\"&\n\x08InitData\x12\x0b\n\x03key\x18\x01 \x01(\t\x12\r\n\x05value\x18\x02 \x01(\t\"\x98\x02\n\x07Message\x12\n\n\x02id\x18\x01 \x01(\t\x12 \n\x06sender\x18\x02 \x01(\x0b\x32\x10.api.agent.Agent\x12 \n\x07\x63ontent\x18\x03 \x03(\x0b\x32\x0f.api.agent.Data\x12\x12\n\nrequest_id\x18\x04 \x01(\t\x12*\n\x04type\x18\x06 \x01(\x0e\x32\x17.api.agent.Message.TypeH\x00\x88\x01\x01\x12\x0c\n\x04tags\x18\x07 \x03(\t\x12-\n\ttimestamp\x18\x08 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\"7\n\x04Type\x12\n\n\x06SYSTEM\x10\x00\x12\t\n\x05\x41GENT\x10\x01\x12\x0b\n\x07\x43OMMAND\x10\x02\x12\x0b\n\x07\x44ISPLAY\x10\x03\x42\x07\n\x05_type\"x\n\x07\x43onnect\x12\x1e\n\x04user\x18\x01 \x01(\x0b\x32\x10.api.agent.Agent\x12\x0e\n\x06\x61\x63tive\x18\x02 \x01(\x08\x12-\n\ttimestamp\x18\x03 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x0e\n\x06topics\x18\x04 \x03(\t\"Y\n\tTimeDelta\x12-\n\ttimestamp\x18\x01 \x01(\x0b\x32\x1a.google.protobuf.Timestamp\x12\x1d\n\x04meta\x18\x02 \x03(\x0b\x32\x0f.api.agent.Data\"\x07\n\x05\x43lose\"F\n\x0c\x44ynamicAgent\x12\x0c\n\x04name\x18\x01 \x01(\t\x12(\n\x0binitConfigs\x18\x02 \x03(\x0b\x32\x13.api.agent.InitData2\xb0\x02\n\tBroadcast\x12\x38\n\x0c\x43reateStream\x12\x12.api.agent.Connect\x1a\x12.api.agent.Message0\x01\x12\x36\n\x08SyncTime\x12\x12.api.agent.Connect\x1a\x14.api.agent.TimeDelta0\x01\x12\x38\n\x10\x42roadcastMessage\x12\x12.api.agent.Message\x1a\x10.api.agent.Close\x12\x37\n\rPublishStream\x12\x12.api.agent.Message\x1a\x10.api.agent.Close(\x01\x12>\n\x11StartDynamicAgent\x12\x17.api.agent.DynamicAgent\x1a\x10.api.agent.CloseB\x1dZ\x1bgithub.com/syigen/rakun/apib\x06proto3'
   ,
   dependencies=[google_dot_protobuf_dot_timestamp__pb2.DESCRIPTOR,])
 
@@ -288,6 +288,13 @@ _CONNECT = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='topics', full_name='api.agent.Connect.topics', index=3,
+      number=4, type=9, cpp_type=9, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
   ],
   extensions=[
   ],
@@ -301,7 +308,7 @@ _CONNECT = _descriptor.Descriptor(
   oneofs=[
   ],
   serialized_start=453,
-  serialized_end=557,
+  serialized_end=573,
 )
 
 
@@ -339,8 +346,8 @@ _TIMEDELTA = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=559,
-  serialized_end=648,
+  serialized_start=575,
+  serialized_end=664,
 )
 
 
@@ -364,8 +371,8 @@ _CLOSE = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=650,
-  serialized_end=657,
+  serialized_start=666,
+  serialized_end=673,
 )
 
 
@@ -403,8 +410,8 @@ _DYNAMICAGENT = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=659,
-  serialized_end=729,
+  serialized_start=675,
+  serialized_end=745,
 )
 
 _MESSAGE.fields_by_name['sender'].message_type = _AGENT
@@ -496,8 +503,8 @@ _BROADCAST = _descriptor.ServiceDescriptor(
   index=0,
   serialized_options=None,
   create_key=_descriptor._internal_create_key,
-  serialized_start=732,
-  serialized_end=979,
+  serialized_start=748,
+  serialized_end=1052,
   methods=[
   _descriptor.MethodDescriptor(
     name='CreateStream',
@@ -529,10 +536,20 @@ _BROADCAST = _descriptor.ServiceDescriptor(
     serialized_options=None,
     create_key=_descriptor._internal_create_key,
   ),
+  _descriptor.MethodDescriptor(
+    name='PublishStream',
+    full_name='api.agent.Broadcast.PublishStream',
+    index=3,
+    containing_service=None,
+    input_type=_MESSAGE,
+    output_type=_CLOSE,
+    serialized_options=None,
+    create_key=_descriptor._internal_create_key,
+  ),
   _descriptor.MethodDescriptor(
     name='StartDynamicAgent',
     full_name='api.agent.Broadcast.StartDynamicAgent',
-    index=3,
+    index=4,
     containing_service=None,
     input_type=_DYNAMICAGENT,
     output_type=_CLOSE,
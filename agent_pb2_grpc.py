@@ -29,6 +29,11 @@ class BroadcastStub(object):
                 request_serializer=agent__pb2.Message.SerializeToString,
                 response_deserializer=agent__pb2.Close.FromString,
                 )
+        self.PublishStream = channel.stream_unary(
+                '/api.agent.Broadcast/PublishStream',
+                request_serializer=agent__pb2.Message.SerializeToString,
+                response_deserializer=agent__pb2.Close.FromString,
+                )
         self.StartDynamicAgent = channel.unary_unary(
                 '/api.agent.Broadcast/StartDynamicAgent',
                 request_serializer=agent__pb2.DynamicAgent.SerializeToString,
@@ -57,6 +62,12 @@ class BroadcastServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def PublishStream(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
     def StartDynamicAgent(self, request, context):
         """Missing associated documentation comment in .proto file."""
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
@@ -81,6 +92,11 @@ def add_BroadcastServicer_to_server(servicer, server):
                     request_deserializer=agent__pb2.Message.FromString,
                     response_serializer=agent__pb2.Close.SerializeToString,
             ),
+            'PublishStream': grpc.stream_unary_rpc_method_handler(
+                    servicer.PublishStream,
+                    request_deserializer=agent__pb2.Message.FromString,
+                    response_serializer=agent__pb2.Close.SerializeToString,
+            ),
             'StartDynamicAgent': grpc.unary_unary_rpc_method_handler(
                     servicer.StartDynamicAgent,
                     request_deserializer=agent__pb2.DynamicAgent.FromString,
@@ -147,6 +163,23 @@ class Broadcast(object):
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
 
+    @staticmethod
+    def PublishStream(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(request_iterator, target, '/api.agent.Broadcast/PublishStream',
+            agent__pb2.Message.SerializeToString,
+            agent__pb2.Close.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
     @staticmethod
     def StartDynamicAgent(request,
             target,
@@ -34,6 +34,8 @@ def message_filter(message_type, message_sender=None):
                 log.exception(e)
                 raise e
 
+        # picked up by rakun to subscribe this agent to the topic
+        wrapped.message_topic = message_type
         return wrapped
 
     return wrapper
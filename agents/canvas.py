@@ -0,0 +1,27 @@
+import numpy as np
+
+
+class Canvas:
+    # an (H, W, 3) uint8 image painted one whole cell at a time
+
+    def __init__(self, width, height, cell_size, array=None):
+        if width % cell_size or height % cell_size:
+            raise ValueError(f"canvas {width}x{height} is not a whole number of {cell_size}px cells")
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.columns = width // cell_size
+        self.rows = height // cell_size
+        # array lets the canvas live in memory owned by someone else, e.g. shared memory
+        self.array = np.zeros((height, width, 3), dtype=np.uint8) if array is None else array
+        # (rows, cell, columns, cell, 3) view over the same memory, one index pair per cell
+        self.blocks = self.array.reshape(self.rows, cell_size, self.columns, cell_size, 3)
+
+    @property
+    def cells(self):
+        # one pixel per cell, a (rows, columns, 3) view
+        return self.blocks[:, 0, :, 0, :]
+
+    def paint(self, cells, colors):
+        cy, cx = np.divmod(np.asarray(cells), self.columns)
+        self.blocks[cy, :, cx, :, :] = np.asarray(colors, dtype=np.uint8)[:, None, None, :]
@@ -0,0 +1,103 @@
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+
+log = logging.getLogger("Agent Checkpoint")
+
+
+class Checkpoint:
+    # a drawing run on disk: two memmapped slots of canvas + coverage and a meta.json naming the newest complete
+    # slot and the one before. A save writes the slot meta.json does not point at and then swaps meta.json, so a
+    # crash mid write leaves the previous checkpoint intact. The run directory only appears with the first save
+
+    def __init__(self, root, run_id, width, height, cell_size, config=None):
+        self.path = os.path.join(root, str(run_id))
+        self.run_id = str(run_id)
+        self.shape = (height, width, 3)
+        self.cells = (height // cell_size) * (width // cell_size)
+        self.config = {"width": width, "height": height, "cell_size": cell_size, **(config or {})}
+        self.meta = None
+        self.saves = 0
+        self.save_time = 0.0
+
+    def _slot(self, slot, mode):
+        canvas = np.memmap(os.path.join(self.path, f"canvas.{slot}"), dtype=np.uint8, mode=mode, shape=self.shape)
+        covered = np.memmap(os.path.join(self.path, f"covered.{slot}"), dtype=bool, mode=mode, shape=(self.cells,))
+        return canvas, covered
+
+    @staticmethod
+    def read_meta(path):
+        with open(os.path.join(path, "meta.json")) as f:
+            return json.load(f)
+
+    @classmethod
+    def latest(cls, root, config):
+        # the most recent unfinished run drawn with the same settings
+        if not os.path.isdir(root):
+            return None
+        runs = []
+        for name in os.listdir(root):
+            try:
+                meta = cls.read_meta(os.path.join(root, name))
+            except (OSError, ValueError):
+                continue
+            if all(meta["config"].get(k) == v for k, v in config.items()):
+                runs.append((meta["saved_at"], name))
+        return max(runs)[1] if runs else None
+
+    def load(self):
+        # (canvas, covered, consumed) of the last complete save, or of the one before when its slot is missing or
+        # truncated. None if there is none
+        try:
+            self.meta = self.read_meta(self.path)
+        except (OSError, ValueError):
+            return None
+        saves = [self.meta] + ([self.meta["previous"]] if self.meta.get("previous") else [])
+        for save in saves:
+            try:
+                canvas, covered = self._slot(save["slot"], "r")
+                canvas, covered = np.array(canvas), np.array(covered)
+            except (OSError, ValueError) as e:
+                log.warning(f"{self.run_id} checkpoint slot {save['slot']} unreadable: {e}")
+                continue
+            # the next save goes to the slot that was not read
+            self.meta = {**self.meta, **save, "previous": None} if save is not self.meta else self.meta
+            return canvas, covered, save["consumed"]
+        return None
+
+    def _write_meta(self, meta):
+        scratch = os.path.join(self.path, "meta.json.tmp")
+        with open(scratch, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(scratch, os.path.join(self.path, "meta.json"))
+        self.meta = meta
+
+    def save(self, canvas, covered, consumed):
+        # blocking, meant for an executor thread. canvas and covered are private copies
+        start = time.monotonic()
+        os.makedirs(self.path, exist_ok=True)
+        slot = 1 - self.meta["slot"] if self.meta else 0
+        if self.meta and self.meta.get("previous"):
+            # the slot about to be written stops being a fallback first
+            self._write_meta({**self.meta, "previous": None})
+        canvas_file, covered_file = self._slot(slot, "w+")
+        canvas_file[...] = canvas
+        covered_file[...] = covered
+        canvas_file.flush()
+        covered_file.flush()
+        del canvas_file, covered_file
+
+        previous = {"slot": self.meta["slot"], "consumed": self.meta["consumed"]} if self.meta else None
+        self._write_meta({"run_id": self.run_id, "slot": slot, "consumed": consumed, "covered": int(covered.sum()),
+                          "saved_at": time.time(), "config": self.config, "previous": previous})
+        self.saves += 1
+        self.save_time += time.monotonic() - start
+
+    def remove(self):
+        shutil.rmtree(self.path, ignore_errors=True)
@@ -1,8 +1,9 @@
 import logging
-import random
+import zlib
 
 from agents import Agent
 from agents.agent_messages import create_message
+from agents.palette import make_colors
 
 log = logging.getLogger(Agent.ColorAgent)
 
@@ -13,6 +14,16 @@ class ColorAgent:
     def __init__(self,sender_id, *args, **kwargs):
         self.id = sender_id
         self.is_running = True
+        # colors per message, more than one publishes them together as a (batch_size, 3) uint8 array
+        self.batch_size = int(kwargs.get("batch_size", 1))
+        # let rakun micro-batch the messages, receivers then get them in batch envelopes. Off by default
+        self.batch_publish = f"{kwargs.get('batch_publish', False)}".lower() in ("true", "1", "yes")
+        seed = kwargs.get("seed")
+        # senders started with the same seed still draw different colors
+        seed = (int(seed), zlib.crc32(f"{sender_id}".encode())) if seed not in (None, "") else None
+        # uniform, normal (mean, std) or palette (palette), see agents.palette
+        self.colors = make_colors(kwargs.get("distribution", "uniform"), seed=seed,
+                                  **{k: v for k, v in kwargs.items() if k != "seed"})
         log.info(f"{self} Start {args} {kwargs}")
 
     async def start(self):
@@ -26,9 +37,13 @@ class ColorAgent:
 
     async def execute(self, *args, **kwargs):
         while self.is_running:
-            rectangle_red = random.randint(0, 255)
-            rectangle_green = random.randint(0, 255)
-            rectangle_blue = random.randint(0, 255)
+            if self.batch_size > 1:
+                await self.publish(create_message("colors", {
+                    'sender_id': self.id,
+                    "colors": self.colors.draw(self.batch_size),
+                }))
+                continue
+            rectangle_red, rectangle_green, rectangle_blue = self.colors.draw(1)[0].tolist()
 
             await self.publish(create_message("colors", {
                 'sender_id': self.id,
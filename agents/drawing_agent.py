@@ -1,16 +1,23 @@
 import asyncio
+import contextlib
 import json
 import logging
+import time
 
 from agents import Agent
-import random
 import uuid
-from PIL import Image, ImageDraw
-from sewar.full_ref import uqi
 import numpy as np
 import matplotlib.pyplot as plt
 
 from agents.agent_messages import message_filter, filter_message_
+from agents.canvas import Canvas
+from agents.checkpoint import Checkpoint
+from agents.export import save_comparison, save_image
+from agents.flow import WatermarkQueue
+from agents.metrics import make_fitness, uqi
+from agents.parallel import TileWorkers
+from agents.scheduler import make_scheduler
+from agents.target import PreparedTarget, TargetCache, TargetPyramid, area_downsample
 
 log = logging.getLogger(Agent.DrawingAgent)
 
@@ -20,43 +27,114 @@ class DrawingAgent:
 
     def __init__(self, *args, **kwargs):
         self.basic_colors = None
+        # the queue bounds count messages, a batched message of many colors is one entry
+        self.queue_high = int(kwargs.get("queue_high", 2048))
+        self.queue_low = int(kwargs.get("queue_low", 512))
+        self.queue_max = int(kwargs.get("queue_max", 4096))
+        self.scheduler = kwargs.get("scheduler", "permutation")
+        self.seed = int(kwargs["seed"]) if kwargs.get("seed") not in (None, "") else None
+        # colors the gated scheduler tries before it stops, 10 per cell by default
+        self.max_messages = int(kwargs["max_messages"]) if kwargs.get("max_messages") not in (None, "") else None
+        self.output = kwargs.get("output")
+        # target and drawing side by side, saved here when set
+        self.comparison = kwargs.get("comparison")
+        # the pyplot window at the end, it holds the event loop until it is closed. Off by default when hosted,
+        # where that loop runs the other agents too
+        self.show = f"{kwargs['show']}".lower() not in ("false", "0", "no") if "show" in kwargs else None
+        self.image = kwargs.get("image", "./data/sample_1.jpg")
+        self.image_width = int(kwargs.get("image_width", 1600))
+        self.image_height = int(kwargs.get("image_height", 1600))
+        self.pixel_size = int(kwargs.get("pixel_size", 8))
+        self.resample = kwargs.get("resample", "bicubic")
+        # prepared targets are kept here between runs, nothing is cached without it
+        self.cache_dir = kwargs.get("cache_dir")
+        self.cache_max_mb = float(kwargs.get("cache_max_mb", 512))
+        # with a checkpoint_dir, draw_image saves its progress every checkpoint_interval_s and a restarted agent
+        # resumes run_id, or the latest unfinished run drawn with the same settings
+        self.checkpoint_dir = kwargs.get("checkpoint_dir")
+        self.checkpoint_interval_s = float(kwargs.get("checkpoint_interval_s", 10.0))
+        self.run_id = kwargs.get("run_id")
+        self.fitness = kwargs.get("fitness", "incremental")
+        # progress is scored on this pyramid level, "grid" or a level number, 0 is full resolution
+        self.score_level = kwargs.get("score_level", TargetPyramid.GRID)
+        # colors drained from the queue per paint step, and the longest a step may hold the event loop
+        self.draw_batch = int(kwargs.get("draw_batch", 1024))
+        self.draw_time_slice_ms = float(kwargs.get("draw_time_slice_ms", 5.0))
+        # more than one splits the canvas into bands painted and scored by that many processes, each keeping an
+        # incremental uqi of its band. benchmarks/tiles.py shows whether that pays off on a machine
+        self.workers = int(kwargs.get("workers", 1))
+        if self.workers > 1 and self.fitness != "incremental":
+            raise ValueError(f"workers={self.workers} scores with the incremental fitness, not {self.fitness!r}")
+        # color_* options go to the ColorAgents this agent starts, e.g. color_batch_size=256 as batch_size=256
+        self.color_options = {k[len("color_"):]: f"{v}" for k, v in kwargs.items() if k.startswith("color_")}
+
+    async def pause_colors(self, paused):
+        if getattr(self, "flow_control", None) is not None:
+            await self.flow_control("colors", paused)
 
     async def start(self):
-        self.basic_colors = asyncio.queues.Queue()
+        self.basic_colors = WatermarkQueue(self.queue_high, self.queue_low, self.pause_colors, maxsize=self.queue_max)
         for r in range(4):
             await self.dynamic_agent(Agent.ColorAgent, {
                 "sender_id": f"{r}",
+                **self.color_options,
             })
 
     async def accept_message(self, message):
         await self.get_colors(message)
 
     @message_filter(message_type="colors", message_sender=Agent.ColorAgent)
-    async def get_colors(self, sender_id, r, g, b):
-        await self.basic_colors.put([r, g, b])
+    async def get_colors(self, sender_id, r=None, g=None, b=None, colors=None):
+        # one color, or a batched (n, 3) array that stays one queue entry
+        if colors is not None:
+            await self.basic_colors.put(np.asarray(colors, dtype=np.uint8).reshape(-1, 3))
+        else:
+            await self.basic_colors.put([r, g, b])
 
     async def stop(self, *args, **kwargs):
         log.info("Agent AgentOne Stopping...")
 
-    async def execute(self, *args, **kwargs):
-        image_width = 1600
-        image_height = 1600
-        pixel_size = 8
-
-        original_image = Image.open('./data/sample_1.jpg').resize((image_width, image_height))
-        original_image = np.array(original_image)
+    async def offload(self, fn, *args, process=False):
+        # CPU bound work goes to the runtime's executor, or to the loop's default one when run without it
+        if getattr(self, "executor", None) is not None:
+            return await self.executor.run(fn, *args, process=process)
+        return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
 
-        def error_fun(generated_image):
-            generated_image = np.array(generated_image)
-            return uqi(original_image, generated_image)
-
-        run_id, gen_image = await self.draw_image(image_width, image_height, pixel_size, error_fun)
-        gen_image = np.array(gen_image)
+    async def execute(self, *args, **kwargs):
+        image_width = self.image_width
+        image_height = self.image_height
+        pixel_size = self.pixel_size
+
+        if self.cache_dir:
+            cache = TargetCache(self.cache_dir, max_bytes=int(self.cache_max_mb * 1024 * 1024))
+            target = await self.offload(cache.get, self.image, image_width, image_height, pixel_size, self.resample)
+        else:
+            target = await self.offload(PreparedTarget.build, self.image, image_width, image_height, pixel_size,
+                                        self.resample)
+        original_image = target.image
+
+        pyramid = target.pyramid
+        level = pyramid.level(self.score_level)
+        fitness = make_fitness(self.fitness, pyramid.image(level))
+        log.info(f"scoring progress at level {level}, 1/{pyramid.factor(level)} of full resolution")
+
+        run_id, canvas = await self.draw_image(image_width, image_height, pixel_size, fitness,
+                                               score_factor=pyramid.factor(level), target_cells=target.cell_mean)
+        gen_image = canvas.array
+        # the images go to pool processes through shared memory
+        if self.output:
+            await self.offload(save_image, gen_image, self.output, process=True)
 
         log.info(f"image shape: {original_image.shape} {gen_image.shape}")
 
-        uqi_score = uqi(gen_image, original_image)
+        uqi_score = await self.offload(uqi, gen_image, original_image, process=True)
         log.info(f"{run_id} MSE score: {uqi_score}")
+        if self.comparison:
+            await self.offload(save_comparison, original_image, gen_image, self.comparison, process=True)
+        if getattr(self, "executor", None) is not None:
+            log.info(f"{run_id} executor {self.executor.stats()}")
+        if not (self.show if self.show is not None else not getattr(self, "hosted", False)):
+            return
 
         plt.imshow(gen_image)
 
@@ -67,63 +145,136 @@ class DrawingAgent:
         plt.imshow(gen_image)
         plt.show()
 
-    async def draw_image(self, image_width, image_height, pixel_size, error_fun):
-        run_id = uuid.uuid1()
+    async def draw_image(self, image_width, image_height, pixel_size, fitness, score_factor=1, target_cells=None):
+        checkpoint = None
+        if self.checkpoint_dir:
+            config = {"width": image_width, "height": image_height, "cell_size": pixel_size,
+                      "scheduler": self.scheduler, "seed": self.seed, "image": self.image}
+            run_id = self.run_id or Checkpoint.latest(self.checkpoint_dir, config) or str(uuid.uuid1())
+            checkpoint = Checkpoint(self.checkpoint_dir, run_id, image_width, image_height, pixel_size, config)
+            # running execute() again in this process picks the same run up
+            self.run_id = run_id
+        else:
+            run_id = uuid.uuid1()
 
         log.info(f'Processing run_id: {run_id}')
 
-        image = Image.new('RGB', (image_width, image_height))
-
-        rectangle_width = pixel_size
-        rectangle_height = pixel_size
-
-        number_of_squares = int(
-            image_width * image_height / rectangle_width / rectangle_height)
-
-        log.info(f'Number of squares: {number_of_squares}')
-
-        draw_image = ImageDraw.Draw(image)
-
-        all_points = {}
-        iteration = 1
-
-        x_points = [i for i in range(int(image_width // rectangle_width))]
-        y_points = [i for i in range(int(image_height // rectangle_height))]
-
-        while len(all_points) != number_of_squares:
-            rectangle_x = random.choice(x_points) * rectangle_width
-            rectangle_y = random.choice(y_points) * rectangle_height
-            # rectangle_red = random.randint(0, 255)
-            # rectangle_green = random.randint(0, 255)
-            # rectangle_blue = random.randint(0, 255)
-            colors = await self.basic_colors.get()
-            if colors is not None:
-                rectangle_red = colors[0]
-                rectangle_green = colors[1]
-                rectangle_blue = colors[2]
-
-                point = (rectangle_x, rectangle_y)
-                point_key = f'{rectangle_x}_{rectangle_y}'
-
-                rectangle_shape = [
-                    point,
-                    (rectangle_x + rectangle_width,
-                     rectangle_y + rectangle_height)]
-
-                if point_key not in all_points:
-                    all_points[point_key] = (
-                        *point, rectangle_red, rectangle_green, rectangle_blue)
-
-                    draw_image.rectangle(
-                        rectangle_shape,
-                        fill=(
-                            rectangle_red,
-                            rectangle_green,
-                            rectangle_blue)
-                    )
-                await asyncio.sleep(0.001)
-            if iteration % 1000 == 0:
-                error = error_fun(image)
-                log.info(f"{iteration=} {len(all_points)=} {error=}")
-            iteration += 1
-        return run_id, image
+        loop = asyncio.get_running_loop()
+        if target_cells is None:
+            # mean target color of every cell, whatever level the fitness scores at
+            target_cells = area_downsample(fitness.target, pixel_size // score_factor)
+        if self.workers > 1:
+            tile_workers = TileWorkers(image_width, image_height, pixel_size, fitness.target, self.workers,
+                                       score_factor=score_factor, ws=fitness.ws)
+        else:
+            tile_workers = contextlib.nullcontext()
+        # the workers and their shared memory go away when this block is left, however early
+        with tile_workers as tiles:
+            if tiles is not None:
+                await loop.run_in_executor(None, tiles.attach)
+                canvas = tiles.canvas
+                fitness = tiles
+            else:
+                canvas = Canvas(image_width, image_height, pixel_size)
+                # cells are flat colors, so a canvas painted with cells shrunk by score_factor is exactly
+                # the area downsample of the real one
+                if score_factor == 1:
+                    score_canvas = canvas
+                else:
+                    score_canvas = Canvas(image_width // score_factor, image_height // score_factor,
+                                          pixel_size // score_factor)
+                fitness.attach(score_canvas)
+
+            log.info(f'Number of squares: {canvas.rows * canvas.columns}')
+
+            iteration = 0
+            covered = np.zeros(canvas.rows * canvas.columns, dtype=bool)
+
+            scheduler = make_scheduler(self.scheduler, canvas.columns, canvas.rows, seed=self.seed,
+                                       target_cells=target_cells, max_messages=self.max_messages)
+            log.info(f'Scheduler: {self.scheduler} seed={self.seed}')
+
+            async def paint(cells, cell_colors):
+                covered[cells] = True
+                if tiles is not None:
+                    await loop.run_in_executor(None, tiles.paint, cells, cell_colors)
+                else:
+                    canvas.paint(cells, cell_colors)
+                    if score_canvas is not canvas:
+                        score_canvas.paint(cells, cell_colors)
+                    fitness.painted(cells)
+
+            state = checkpoint.load() if checkpoint is not None else None
+            if state is not None:
+                saved, saved_covered, iteration = state
+                saved_colors = Canvas(image_width, image_height, pixel_size, array=saved).cells.reshape(-1, 3)
+                await paint(np.flatnonzero(saved_covered), saved_colors[saved_covered])
+                scheduler.restore(saved_covered, saved_colors, iteration)
+                log.info(f"{run_id} resumed at {iteration} colors, scheduler={scheduler.stats()}")
+
+            next_log = 1000 * (iteration // 1000 + 1)
+            saving = None
+            last_save = time.monotonic()
+
+            while not scheduler.done:
+                batch = await self.drain_colors()
+                iteration += len(batch)
+                if len(batch):
+                    await paint(*scheduler.assign(batch))
+                if iteration >= next_log:
+                    if tiles is not None:
+                        # the band totals are already in, and the workers' pipes are only used from the loop
+                        error = fitness.score()
+                    else:
+                        # painting waits for the score, so the fitness is never scored and painted at once
+                        error = await self.offload(fitness.score)
+                    log.info(f"{iteration=} {error=} scheduler={scheduler.stats()} queue={self.basic_colors.stats()}")
+                    next_log += 1000 * (1 + (iteration - next_log) // 1000)
+                if checkpoint is not None and (saving is None or saving.done()) and \
+                        time.monotonic() - last_save >= self.checkpoint_interval_s:
+                    if saving is not None and saving.exception() is not None:
+                        log.warning(f"{run_id} checkpoint failed: {saving.exception()}")
+                    # copies taken here so painting can go on while the thread writes them
+                    saving = loop.run_in_executor(None, checkpoint.save, canvas.array.copy(), covered.copy(),
+                                                  iteration)
+                    last_save = time.monotonic()
+                # let the producers and the transport run between batches
+                await asyncio.sleep(0)
+            if checkpoint is not None:
+                if saving is not None:
+                    await asyncio.wait([saving])
+                log.info(f"{run_id} finished, {checkpoint.saves} checkpoints in {checkpoint.save_time:.2f}s")
+                checkpoint.remove()
+                self.run_id = None
+            if tiles is not None:
+                # the shared memory goes away with the workers, keep a private copy of the picture
+                canvas = Canvas(image_width, image_height, pixel_size, array=canvas.array.copy())
+        log.info(f"{run_id} done after {iteration} colors, scheduler={scheduler.stats()}")
+        return run_id, canvas
+
+    async def drain_colors(self):
+        # waits for one message, then takes whatever else is already queued up to draw_batch colors or the time
+        # slice. Single colors and batched arrays come back together as one (n, 3) uint8 array
+        singles = []
+        arrays = []
+        count = 0
+        item = await self.basic_colors.get()
+        deadline = time.monotonic() + self.draw_time_slice_ms / 1000
+        while True:
+            if isinstance(item, np.ndarray):
+                arrays.append(item)
+                count += len(item)
+            elif item is not None:
+                singles.append(item)
+                count += 1
+            if count >= self.draw_batch or time.monotonic() >= deadline:
+                break
+            try:
+                item = self.basic_colors.get_nowait()
+            except asyncio.QueueEmpty:
+                break
+        if singles:
+            arrays.append(np.array(singles, dtype=np.uint8))
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.concatenate(arrays) if arrays else np.empty((0, 3), dtype=np.uint8)
@@ -0,0 +1,17 @@
+from matplotlib.figure import Figure
+from PIL import Image
+
+
+def save_image(array, path):
+    Image.fromarray(array).save(path)
+
+
+def save_comparison(target, image, path):
+    # target and drawing side by side. No pyplot, so it runs on any thread or in a pool process
+    figure = Figure(figsize=(10, 5))
+    for column, (title, array) in enumerate((("target", target), ("drawing", image))):
+        axes = figure.add_subplot(1, 2, column + 1)
+        axes.imshow(array)
+        axes.set_title(title)
+        axes.axis("off")
+    figure.savefig(path)
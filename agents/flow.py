@@ -0,0 +1,76 @@
+import asyncio
+import functools
+import logging
+import time
+
+log = logging.getLogger("Agent Flow Control")
+
+
+class WatermarkQueue(asyncio.Queue):
+    # pauses producers once the queue reaches high and resumes them at low,
+    # maxsize stays a hard bound so memory is capped even if producers ignore the pause.
+    # Producers give up on a pause nobody repeats, so it is sent again every repause_s until the resume.
+    # A signal that fails to go out is sent again after retry_s, unless another one replaced it
+
+    def __init__(self, high, low, on_pause, maxsize=0, repause_s=2.0, retry_s=1.0):
+        super().__init__(maxsize=maxsize)
+        self.high = high
+        self.low = low
+        self.on_pause = on_pause
+        self.repause_s = repause_s
+        self.retry_s = retry_s
+        self.paused = False
+        self.failed_signals = 0
+        self._resend = None
+        self._sending = None
+        self.max_depth = 0
+        self.stalls = 0
+        self.stall_time = 0.0
+
+    def _signal(self, paused):
+        self.paused = paused
+        if self._resend is not None:
+            self._resend.cancel()
+            self._resend = None
+        if self.on_pause is not None:
+            self._sending = asyncio.ensure_future(self.on_pause(paused))
+            self._sending.add_done_callback(functools.partial(self._sent, paused))
+            if paused and self.repause_s:
+                self._resend = asyncio.get_event_loop().call_later(self.repause_s, self._signal, True)
+
+    def _sent(self, paused, task):
+        if task.cancelled() or task.exception() is None:
+            return
+        self.failed_signals += 1
+        log.warning(f"{'pause' if paused else 'resume'} signal failed, {self.failed_signals} failed: "
+                    f"{task.exception()!r}")
+        # a repeated pause is already due, anything else goes out again unless a newer signal replaced it
+        if paused == self.paused and self._resend is None:
+            self._resend = asyncio.get_event_loop().call_later(self.retry_s, self._signal, paused)
+
+    async def put(self, item):
+        if self.full():
+            start = time.monotonic()
+            self.stalls += 1
+            await super().put(item)
+            self.stall_time += time.monotonic() - start
+        else:
+            self.put_nowait(item)
+
+    def put_nowait(self, item):
+        super().put_nowait(item)
+        depth = self.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        if not self.paused and depth >= self.high:
+            self._signal(True)
+
+    def get_nowait(self):
+        item = super().get_nowait()
+        if self.paused and self.qsize() <= self.low:
+            self._signal(False)
+        return item
+
+    def stats(self):
+        return {"depth": self.qsize(), "max_depth": self.max_depth, "stalls": self.stalls,
+                "stall_time": round(self.stall_time, 3), "failed_signals": self.failed_signals}
@@ -0,0 +1,212 @@
+import numpy as np
+
+try:
+    from sewar import full_ref as sewar_full_ref
+except ImportError:
+    sewar_full_ref = None
+
+
+def window_geometry(size, ws):
+    # sewar scores every pixel i in [s, size - s) by the window starting at i - ws // 2,
+    # those are exactly the windows that fit inside the image
+    s = int(np.round(ws / 2))
+    return s - ws // 2, size - 2 * s
+
+
+def window_means(x, ws):
+    # box means of every ws x ws window of (..., H, W, C) images through a summed-area table,
+    # integer valued pixels keep every partial sum below 2 ** 53 so float64 stays exact
+    sat = np.zeros(x.shape[:-3] + (x.shape[-3] + 1, x.shape[-2] + 1, x.shape[-1]), dtype=np.float64)
+    np.cumsum(x, axis=-3, out=sat[..., 1:, 1:, :])
+    np.cumsum(sat[..., 1:, 1:, :], axis=-2, out=sat[..., 1:, 1:, :])
+    box = sat[..., ws:, ws:, :] - sat[..., :-ws, ws:, :]
+    box -= sat[..., ws:, :-ws, :]
+    box += sat[..., :-ws, :-ws, :]
+    box *= 1.0 / (ws * ws)
+    return box
+
+
+def _as_channels(x):
+    x = np.asarray(x)
+    return x[:, :, np.newaxis] if x.ndim == 2 else x
+
+
+def _check(GT, P):
+    if GT.shape != P.shape:
+        raise ValueError(f"Supplied images have different sizes {GT.shape} and {P.shape}")
+    return _as_channels(GT), _as_channels(P)
+
+
+def q_map(x, y, ws, dtype=np.float64):
+    # sewar's uqi map: it feeds box means into the box-sum formula, kept as is so scores match
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    n = ws * ws
+    mx = window_means(x, ws).astype(dtype, copy=False)
+    my = window_means(y, ws).astype(dtype, copy=False)
+    # only ever used as a sum, one table instead of two
+    mxx_yy = window_means(x * x + y * y, ws).astype(dtype, copy=False)
+    mxy = window_means(x * y, ws).astype(dtype, copy=False)
+
+    xy = mx * my
+    sq = mx * mx + my * my
+    numerator = 4 * (n * mxy - xy) * xy
+    denominator1 = n * mxx_yy - sq
+    denominator = denominator1 * sq
+
+    q = np.ones(denominator.shape, dtype=dtype)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        q = np.where((denominator1 == 0) & (sq != 0), 2 * xy / sq, q)
+        q = np.where(denominator != 0, numerator / denominator, q)
+    return q
+
+
+def uqi(GT, P, ws=8, dtype=np.float32):
+    # same value as sewar.full_ref.uqi, all channels in one pass
+    GT, P = _check(GT, P)
+    row_offset, rows = window_geometry(GT.shape[0], ws)
+    col_offset, cols = window_geometry(GT.shape[1], ws)
+    q = q_map(GT, P, ws, dtype=dtype)[row_offset:row_offset + rows, col_offset:col_offset + cols]
+    return float(q.mean(dtype=np.float64))
+
+
+def ssim(GT, P, ws=11, K1=0.01, K2=0.03, MAX=None, dtype=np.float32):
+    # sewar's default ssim: uniform ws x ws window over the valid region, returns (ssim, cs)
+    if MAX is None:
+        MAX = np.iinfo(GT.dtype).max
+    GT, P = _check(GT, P)
+    C1 = (K1 * MAX) ** 2
+    C2 = (K2 * MAX) ** 2
+    x = GT.astype(np.float64)
+    y = P.astype(np.float64)
+    mx = window_means(x, ws).astype(dtype, copy=False)
+    my = window_means(y, ws).astype(dtype, copy=False)
+    sigma_x_y = window_means(x * x + y * y, ws).astype(dtype, copy=False) - mx * mx - my * my
+    sigma_xy = window_means(x * y, ws).astype(dtype, copy=False) - mx * my
+
+    cs_map = (2 * sigma_xy + C2) / (sigma_x_y + C2)
+    ssim_map = (2 * mx * my + C1) / (mx * mx + my * my + C1) * cs_map
+    return float(ssim_map.mean(dtype=np.float64)), float(cs_map.mean(dtype=np.float64))
+
+
+def mse(GT, P):
+    GT, P = _check(GT, P)
+    diff = GT.astype(np.float32) - P.astype(np.float32)
+    return float(np.mean(diff * diff, dtype=np.float64))
+
+
+def psnr(GT, P, MAX=None):
+    if MAX is None:
+        MAX = np.iinfo(GT.dtype).max
+    mse_value = mse(GT, P)
+    if mse_value == 0.:
+        return np.inf
+    return 10 * np.log10(MAX ** 2 / mse_value)
+
+
+class FullUQI:
+    # rescores the whole canvas on every call
+
+    def __init__(self, target, ws=8):
+        self.target = target
+        self.ws = ws
+        self.canvas = None
+
+    def attach(self, canvas):
+        self.canvas = canvas
+
+    def painted(self, cells):
+        pass
+
+    def score(self):
+        return uqi(self.target, self.canvas.array, ws=self.ws)
+
+
+class SewarUQI(FullUQI):
+    # the reference implementation, slow but handy to cross check
+
+    def __init__(self, target, ws=8):
+        if sewar_full_ref is None:
+            raise ValueError("the sewar fitness needs the sewar package, pip install -r dev-requirements.txt")
+        super().__init__(target, ws=ws)
+
+    def score(self):
+        return sewar_full_ref.uqi(self.target, self.canvas.array, ws=self.ws)
+
+
+class IncrementalUQI:
+    # keeps the uqi map of every window and recomputes only the windows a painted cell touches.
+    # window_rows=(first, last) limits it to a band of window rows, the tiles of a parallel run
+    # each own one band and their totals add up to the whole map
+
+    def __init__(self, target, ws=8, window_rows=None):
+        self.target = target
+        self.ws = ws
+        self.row_offset, rows = window_geometry(target.shape[0], ws)
+        self.col_offset, self.cols = window_geometry(target.shape[1], ws)
+        self.first_row, self.last_row = (0, rows) if window_rows is None else window_rows
+        self.canvas = None
+        self.q = None
+        self.total = 0.0
+        self.updated_windows = 0
+
+    def attach(self, canvas):
+        self.canvas = canvas
+        self.q = self._q_region(self.first_row, self.last_row, 0, self.cols)
+        self.total = float(self.q.sum())
+
+    def _q_region(self, r0, r1, c0, c1):
+        y0, y1 = r0 + self.row_offset, r1 + self.row_offset + self.ws - 1
+        x0, x1 = c0 + self.col_offset, c1 + self.col_offset + self.ws - 1
+        return q_map(self.target[y0:y1, x0:x1], self.canvas.array[y0:y1, x0:x1], self.ws)
+
+    def painted(self, cells):
+        size = self.canvas.cell_size
+        span = size + self.ws - 1
+        cy, cx = np.divmod(np.asarray(cells), self.canvas.columns)
+        # a cell at row cy touches the window rows [cy * size - ws + 1, cy * size + size) before the offset
+        touches = (cy * size + size - self.row_offset > self.first_row) & \
+                  (cy * size - self.ws + 1 - self.row_offset < self.last_row)
+        cy, cx = cy[touches], cx[touches]
+        if len(cy) == 0:
+            return
+        if len(cy) * span * span >= self.q.size // self.q.shape[-1]:
+            # a batch this big is cheaper to rescore in one pass
+            self.attach(self.canvas)
+            return
+        # every window a cell touches, for all cells at once: gather (n, L, L, C) patches around the cells,
+        # score their span x span windows and keep the ones inside the band
+        wr = (cy * size - self.ws + 1 - self.row_offset)[:, None] + np.arange(span)
+        wc = (cx * size - self.ws + 1 - self.col_offset)[:, None] + np.arange(span)
+        pixels = np.arange(span + self.ws - 1)
+        py = np.clip(wr[:, :1] + self.row_offset + pixels, 0, self.target.shape[0] - 1)[:, :, None]
+        px = np.clip(wc[:, :1] + self.col_offset + pixels, 0, self.target.shape[1] - 1)[:, None, :]
+        q = q_map(self.target[py, px], self.canvas.array[py, px], self.ws)
+
+        valid = ((wr >= self.first_row) & (wr < self.last_row))[:, :, None] & \
+                ((wc >= 0) & (wc < self.cols))[:, None, :]
+        windows, first = np.unique(((wr - self.first_row)[:, :, None] * self.cols + wc[:, None, :])[valid],
+                                   return_index=True)
+        q = q[valid][first]
+        flat = self.q.reshape(-1, self.q.shape[-1])
+        self.total += float(q.sum() - flat[windows].sum())
+        flat[windows] = q
+        self.updated_windows += q.size
+
+    def score(self):
+        return self.total / self.q.size
+
+
+FITNESS = {
+    "full": FullUQI,
+    "incremental": IncrementalUQI,
+    "sewar": SewarUQI,
+}
+
+
+def make_fitness(name, target, ws=8):
+    try:
+        fitness = FITNESS[name]
+    except KeyError:
+        raise ValueError(f"unknown fitness {name!r}, choose one of {sorted(FITNESS)}")
+    return fitness(target, ws=ws)
@@ -0,0 +1,101 @@
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+# the corners of the RGB cube
+BASIC = np.array([[r, g, b] for r in (0, 255) for g in (0, 255) for b in (0, 255)], dtype=np.uint8)
+# 6 levels per channel
+WEB = np.array([[r, g, b] for r in range(0, 256, 51) for g in range(0, 256, 51) for b in range(0, 256, 51)],
+               dtype=np.uint8)
+GRAY = np.repeat(np.arange(256, dtype=np.uint8)[:, None], 3, axis=1)
+
+PALETTES = {
+    "basic": BASIC,
+    "web": WEB,
+    "gray": GRAY,
+}
+
+
+def parse_color(spec):
+    # "#rrggbb", "r,g,b" or one number for all channels
+    spec = f"{spec}".strip()
+    if spec.startswith("#"):
+        return np.array([int(spec[i:i + 2], 16) for i in (1, 3, 5)], dtype=np.float64)
+    channels = [float(c) for c in spec.split(",")]
+    return np.array(channels * 3 if len(channels) == 1 else channels, dtype=np.float64)
+
+
+def parse_palette(spec):
+    # a palette name, or comma separated "#rrggbb" colors
+    if isinstance(spec, np.ndarray):
+        return spec.astype(np.uint8)
+    if spec in PALETTES:
+        return PALETTES[spec]
+    try:
+        return np.array([parse_color(c) for c in spec.split(",")], dtype=np.uint8)
+    except ValueError:
+        raise ValueError(f"unknown palette {spec!r}, choose one of {sorted(PALETTES)} or list #rrggbb colors")
+
+
+class ColorSource(ABC):
+    # draws (n, 3) uint8 colors from its own numpy Generator
+
+    # extra make_colors options this source takes
+    options = ()
+
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+
+    @abstractmethod
+    def draw(self, n):
+        pass
+
+
+class UniformColors(ColorSource):
+    # every RGB color equally likely, what ColorAgent always published
+
+    def draw(self, n):
+        return self.rng.integers(0, 256, size=(n, 3), dtype=np.uint8)
+
+
+class NormalColors(ColorSource):
+    # around mean, std apart on every channel
+
+    options = ("mean", "std")
+
+    def __init__(self, seed=None, mean="#808080", std=48.0):
+        super().__init__(seed)
+        self.mean = parse_color(mean)
+        self.std = float(std)
+
+    def draw(self, n):
+        return np.clip(np.rint(self.rng.normal(self.mean, self.std, size=(n, 3))), 0, 255).astype(np.uint8)
+
+
+class PaletteColors(ColorSource):
+    # only the colors of a palette, each equally likely
+
+    options = ("palette",)
+
+    def __init__(self, seed=None, palette="web"):
+        super().__init__(seed)
+        self.palette = parse_palette(palette)
+
+    def draw(self, n):
+        return self.palette[self.rng.integers(len(self.palette), size=n)]
+
+
+DISTRIBUTIONS = {
+    "uniform": UniformColors,
+    "normal": NormalColors,
+    "palette": PaletteColors,
+}
+
+
+def make_colors(name, seed=None, **options):
+    # each source gets the options it lists, the rest are ignored
+    try:
+        source = DISTRIBUTIONS[name]
+    except KeyError:
+        raise ValueError(f"unknown color distribution {name!r}, choose one of {sorted(DISTRIBUTIONS)}")
+    return source(seed=seed, **{k: v for k, v in options.items() if k in source.options})
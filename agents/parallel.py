@@ -0,0 +1,177 @@
+import logging
+import multiprocessing
+import threading
+
+import numpy as np
+
+from agents.canvas import Canvas
+from agents.metrics import IncrementalUQI, window_geometry
+from agents.shared import SharedArray
+
+log = logging.getLogger("Agent Tiles")
+
+
+def split_rows(rows, tiles):
+    # contiguous bands of cell rows, as even as possible
+    edges = np.linspace(0, rows, tiles + 1).round().astype(int)
+    return [(int(a), int(b)) for a, b in zip(edges[:-1], edges[1:]) if b > a]
+
+
+def _run_tile(conn, canvas, score_canvas, fitness):
+    while True:
+        command, *args = conn.recv()
+        if command == "attach":
+            fitness.attach(score_canvas)
+            conn.send((fitness.total, fitness.q.size))
+        elif command == "paint":
+            cells, colors = args
+            canvas.paint(cells, colors)
+            if score_canvas is not canvas:
+                score_canvas.paint(cells, colors)
+            conn.send(None)
+        elif command == "update":
+            fitness.painted(args[0])
+            conn.send((fitness.total, fitness.q.size))
+        elif command == "close":
+            return
+
+
+def _tile_worker(conn, canvas_spec, score_spec, target_spec, cell_size, score_cell_size, window_rows, ws):
+    # runs in the worker process: paints the cells of its band and scores its band of windows
+    shared = [SharedArray.open(canvas_spec), SharedArray.open(target_spec)]
+    height, width = shared[0].shape[:2]
+    canvas = Canvas(width, height, cell_size, array=shared[0].array)
+    score_canvas = canvas
+    if score_spec is not None:
+        shared.append(SharedArray.open(score_spec))
+        height, width = shared[2].shape[:2]
+        score_canvas = Canvas(width, height, score_cell_size, array=shared[2].array)
+    try:
+        _run_tile(conn, canvas, score_canvas, IncrementalUQI(shared[1].array, ws=ws, window_rows=window_rows))
+    finally:
+        del canvas, score_canvas
+        for memory in shared:
+            memory.close()
+        conn.close()
+
+
+class TileWorkers:
+    # splits the canvas into bands of cell rows, one worker process per band. The canvas and the target live
+    # in shared memory, paint() routes each cell to the worker owning its band, then each worker whose windows
+    # the step touched rescores them. Painting and scoring are separate rounds so a window on a
+    # band edge never sees half of a step
+
+    def __init__(self, width, height, cell_size, target, workers, score_factor=1, ws=8):
+        # attach and paint run on executor threads, close may come from the loop while one is in flight
+        self._pipes = threading.Lock()
+        self.processes = []
+        self.connections = []
+        self.canvas_memory = self.score_memory = self.target_memory = None
+        try:
+            self._start(width, height, cell_size, target, workers, score_factor, ws)
+        except BaseException:
+            # whatever was started before the failure goes again
+            self.close()
+            raise
+        log.info(f"{len(self.bands)} tile workers, bands {self.bands}")
+
+    def _start(self, width, height, cell_size, target, workers, score_factor, ws):
+        self.canvas_memory = SharedArray((height, width, 3), np.uint8)
+        self.canvas = Canvas(width, height, cell_size, array=self.canvas_memory.array)
+        score_cell_size = cell_size // score_factor
+        if score_factor != 1:
+            self.score_memory = SharedArray((height // score_factor, width // score_factor, 3), np.uint8)
+        self.target_memory = SharedArray.copy_of(np.ascontiguousarray(target))
+
+        self.bands = split_rows(self.canvas.rows, workers)
+        self.band_starts = np.array([a for a, _ in self.bands])
+        self.row_offset, window_rows = window_geometry(target.shape[0], ws)
+        self.score_cell_size = score_cell_size
+        self.ws = ws
+        self.window_bands = []
+        context = multiprocessing.get_context("spawn")
+        for index, (first, last) in enumerate(self.bands):
+            # the windows starting in the band's pixel rows, the last band takes the rest
+            first = min(first * score_cell_size, window_rows)
+            last = window_rows if index == len(self.bands) - 1 else min(last * score_cell_size, window_rows)
+            self.window_bands.append((first, last))
+            parent, child = context.Pipe()
+            process = context.Process(
+                target=_tile_worker, daemon=True,
+                args=(child, self.canvas_memory.spec(),
+                      self.score_memory.spec() if self.score_memory is not None else None,
+                      self.target_memory.spec(), cell_size, score_cell_size, (first, last), ws))
+            self.connections.append(parent)
+            try:
+                process.start()
+            finally:
+                child.close()
+            self.processes.append(process)
+        self.totals = [0.0] * len(self.bands)
+        self.sizes = [0] * len(self.bands)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _gather(self, connections):
+        return [connection.recv() for connection in connections]
+
+    def _scores(self, indices):
+        for index, (total, size) in zip(indices, self._gather([self.connections[i] for i in indices])):
+            self.totals[index] = total
+            self.sizes[index] = size
+
+    def attach(self):
+        with self._pipes:
+            for connection in self.connections:
+                connection.send(("attach",))
+            self._scores(range(len(self.connections)))
+
+    def paint(self, cells, colors):
+        # blocking, run it off the event loop
+        cells = np.asarray(cells)
+        colors = np.asarray(colors, dtype=np.uint8)
+        tile = np.searchsorted(self.band_starts, cells // self.canvas.columns, side="right") - 1
+        with self._pipes:
+            busy = []
+            for index, connection in enumerate(self.connections):
+                mine = tile == index
+                if mine.any():
+                    connection.send(("paint", cells[mine], colors[mine]))
+                    busy.append(connection)
+            self._gather(busy)
+            # a cell changes the windows up to ws - 1 pixel rows above it, those may belong to the band before
+            top = (cells // self.canvas.columns) * self.score_cell_size - self.row_offset
+            updated = []
+            for index, (first, last) in enumerate(self.window_bands):
+                mine = (top + self.score_cell_size > first) & (top - self.ws + 1 < last)
+                if mine.any():
+                    self.connections[index].send(("update", cells[mine]))
+                    updated.append(index)
+            self._scores(updated)
+
+    def score(self):
+        return sum(self.totals) / sum(self.sizes)
+
+    def close(self):
+        with self._pipes:
+            for connection in self.connections:
+                try:
+                    connection.send(("close",))
+                except (BrokenPipeError, OSError):
+                    pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for connection in self.connections:
+            connection.close()
+        self.processes, self.connections = [], []
+        self.canvas = None
+        for memory in (self.canvas_memory, self.score_memory, self.target_memory):
+            if memory is not None:
+                memory.close()
+        self.canvas_memory = self.score_memory = self.target_memory = None
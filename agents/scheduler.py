@@ -0,0 +1,244 @@
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class CellScheduler(ABC):
+    # cells are numbered row major, cell = cy * columns + cx
+
+    # extra make_scheduler options this scheduler takes
+    options = ()
+
+    def __init__(self, columns, rows, seed=None):
+        self.columns = columns
+        self.rows = rows
+        self.cells = columns * rows
+        self.rng = np.random.default_rng(seed)
+        self.covered = 0
+
+    @property
+    def done(self):
+        return self.covered >= self.cells
+
+    @abstractmethod
+    def assign(self, colors):
+        # returns the cells to paint and the colors that go on them
+        pass
+
+    def restore(self, covered, colors, consumed):
+        # picks up a resumed run: covered is the painted cell mask, colors the (cells, 3) colors on them
+        # and consumed the colors used so far
+        self.covered = int(covered.sum())
+        # replaying the stream the run started with would draw the same cells again
+        self.rng = np.random.default_rng((int(self.rng.integers(2 ** 63)), consumed))
+
+    def stats(self):
+        return {"covered": self.covered}
+
+
+class RandomScheduler(CellScheduler):
+    # the original behaviour: pick any cell and throw the color away if it is already painted
+
+    def __init__(self, columns, rows, seed=None):
+        super().__init__(columns, rows, seed)
+        self.painted = np.zeros(self.cells, dtype=bool)
+
+    def assign(self, colors):
+        cells = self.rng.integers(self.cells, size=len(colors))
+        cells, first = np.unique(cells, return_index=True)
+        keep = ~self.painted[cells]
+        cells, colors = cells[keep], colors[first[keep]]
+        self.painted[cells] = True
+        self.covered += len(cells)
+        return cells, colors
+
+    def restore(self, covered, colors, consumed):
+        super().restore(covered, colors, consumed)
+        self.painted = covered.copy()
+
+
+class OrderedScheduler(CellScheduler):
+    # visits every cell exactly once in a precomputed order, so each color paints a new cell
+
+    def __init__(self, columns, rows, seed=None):
+        super().__init__(columns, rows, seed)
+        self.order = self.build_order()
+
+    @abstractmethod
+    def build_order(self):
+        pass
+
+    def assign(self, colors):
+        cells = self.order[self.covered:self.covered + len(colors)]
+        self.covered += len(cells)
+        return cells, colors[:len(cells)]
+
+    def restore(self, covered, colors, consumed):
+        # painted cells first, the rest keep their order
+        super().restore(covered, colors, consumed)
+        done = covered[self.order]
+        self.order = np.concatenate([self.order[done], self.order[~done]])
+
+
+class PermutationScheduler(OrderedScheduler):
+
+    def build_order(self):
+        return self.rng.permutation(self.cells)
+
+
+class StratifiedScheduler(OrderedScheduler):
+    # one random cell from every stratum x stratum block per round, so coverage spreads evenly
+
+    def __init__(self, columns, rows, seed=None, stratum=8):
+        self.stratum = stratum
+        super().__init__(columns, rows, seed)
+
+    def build_order(self):
+        cell = np.arange(self.cells)
+        block_columns = -(-self.columns // self.stratum)
+        block = (cell // self.columns // self.stratum) * block_columns + (cell % self.columns) // self.stratum
+
+        perm = self.rng.permutation(self.cells)
+        blocks = block[perm]
+        by_block = np.argsort(blocks, kind="stable")
+        sorted_blocks = blocks[by_block]
+        rank = np.empty(self.cells, dtype=np.int64)
+        rank[by_block] = np.arange(self.cells) - np.searchsorted(sorted_blocks, sorted_blocks)
+        block_priority = self.rng.permutation(block.max() + 1)[blocks]
+        return perm[np.lexsort((block_priority, rank))]
+
+
+class NearestColorScheduler(CellScheduler):
+    # sends every color to the unpainted cell whose mean target color is closest to it.
+    # the search is a brute force distance over the remaining cells, done for a chunk of colors at once
+
+    options = ("target_cells",)
+    chunk = 64
+
+    def __init__(self, columns, rows, seed=None, target_cells=None):
+        super().__init__(columns, rows, seed)
+        if target_cells is None:
+            raise ValueError("the nearest scheduler needs the mean target color of every cell")
+        means = np.asarray(target_cells, dtype=np.float32).reshape(self.cells, -1)
+        # shuffled so ties between equally good cells do not always fill the image top down
+        self.remaining = self.rng.permutation(self.cells)
+        self.means = means[self.remaining]
+        self.norms = (self.means * self.means).sum(axis=1)
+        self.alive = np.ones(self.cells, dtype=bool)
+
+    def restore(self, covered, colors, consumed):
+        super().restore(covered, colors, consumed)
+        self.alive &= ~covered[self.remaining]
+        self._compact()
+
+    def _compact(self):
+        self.remaining = self.remaining[self.alive]
+        self.means = self.means[self.alive]
+        self.norms = self.norms[self.alive]
+        self.alive = np.ones(len(self.remaining), dtype=bool)
+
+    def _nearest(self, colors):
+        # |c - m|^2 without the |c|^2 term, which does not change the argmin
+        distance = self.norms[None, :] - 2 * colors @ self.means.T
+        distance[:, ~self.alive] = np.inf
+        picks = distance.argmin(axis=1)
+        # two colors of the chunk can want the same cell, the later ones take their next best
+        _, first = np.unique(picks, return_index=True)
+        clash = np.setdiff1d(np.arange(len(colors)), first)
+        for index in clash:
+            distance[:, picks[first]] = np.inf
+            picks[index] = distance[index].argmin()
+            first = np.append(first, index)
+        return picks
+
+    def assign(self, colors):
+        colors = colors[:self.cells - self.covered]
+        cells = np.empty(len(colors), dtype=np.int64)
+        for start in range(0, len(colors), self.chunk):
+            chunk = colors[start:start + self.chunk].astype(np.float32)
+            picks = self._nearest(chunk)
+            cells[start:start + len(chunk)] = self.remaining[picks]
+            self.alive[picks] = False
+            self.covered += len(chunk)
+            if self.alive.sum() * 2 < len(self.alive):
+                self._compact()
+        return cells, colors
+
+
+class GatedScheduler(CellScheduler):
+    # optimizes instead of just covering: every color is tried on a random cell, painted or not, and kept only
+    # if it brings the cell closer to the target. A flat cell's squared error is constant + n * |c - m|^2 with m
+    # the mean target color of the cell, so comparing |c - m|^2 decides it without scoring any pixels
+
+    options = ("target_cells", "max_messages")
+
+    def __init__(self, columns, rows, seed=None, target_cells=None, max_messages=None):
+        super().__init__(columns, rows, seed)
+        if target_cells is None:
+            raise ValueError("the gated scheduler needs the mean target color of every cell")
+        self.means = np.asarray(target_cells, dtype=np.float32).reshape(self.cells, -1)
+        self.max_messages = int(max_messages) if max_messages else 10 * self.cells
+        # |c - m|^2 of the color on each cell, unpainted cells take anything
+        self.error = np.full(self.cells, np.inf, dtype=np.float32)
+        self.evaluated = 0
+        self.accepted = 0
+        self.elapsed = 0.0
+
+    @property
+    def done(self):
+        return self.evaluated >= self.max_messages
+
+    def assign(self, colors):
+        start = time.perf_counter()
+        colors = colors[:self.max_messages - self.evaluated]
+        self.evaluated += len(colors)
+        cells = self.rng.integers(self.cells, size=len(colors))
+        # a cell drawn twice in one batch keeps its first candidate
+        cells, first = np.unique(cells, return_index=True)
+        colors = colors[first]
+        diff = colors.astype(np.float32) - self.means[cells]
+        error = (diff * diff).sum(axis=1)
+        keep = error < self.error[cells]
+        cells, colors, error = cells[keep], colors[keep], error[keep]
+        self.covered += int(np.isinf(self.error[cells]).sum())
+        self.error[cells] = error
+        self.accepted += len(cells)
+        self.elapsed += time.perf_counter() - start
+        return cells, colors
+
+    def restore(self, covered, colors, consumed):
+        super().restore(covered, colors, consumed)
+        diff = colors[covered].astype(np.float32) - self.means[covered]
+        self.error[covered] = (diff * diff).sum(axis=1)
+        self.evaluated = consumed
+
+    def stats(self):
+        painted = np.isfinite(self.error)
+        return {
+            "covered": self.covered,
+            "evaluated": self.evaluated,
+            "acceptance_rate": round(self.accepted / max(self.evaluated, 1), 4),
+            "evaluated_per_s": round(self.evaluated / self.elapsed) if self.elapsed else None,
+            # mean squared distance of the painted cells from their best flat color, per channel
+            "cell_error": round(float(self.error[painted].mean()) / self.means.shape[1], 2) if painted.any() else None,
+        }
+
+
+SCHEDULERS = {
+    "random": RandomScheduler,
+    "permutation": PermutationScheduler,
+    "stratified": StratifiedScheduler,
+    "nearest": NearestColorScheduler,
+    "gated": GatedScheduler,
+}
+
+
+def make_scheduler(name, columns, rows, seed=None, **options):
+    # options: target_cells, the (rows, columns, 3) mean target color per cell, and max_messages.
+    # each scheduler gets the ones it lists in its options
+    try:
+        scheduler = SCHEDULERS[name]
+    except KeyError:
+        raise ValueError(f"unknown scheduler {name!r}, choose one of {sorted(SCHEDULERS)}")
+    return scheduler(columns, rows, seed=seed, **{k: v for k, v in options.items() if k in scheduler.options})
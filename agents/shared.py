@@ -0,0 +1,36 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+
+
+class SharedArray:
+    # an ndarray in a named shared memory block, workers open it again by name
+
+    def __init__(self, shape, dtype, name=None):
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.owner = name is None
+        size = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+        self.memory = shared_memory.SharedMemory(name=name, create=self.owner, size=size)
+        self.array = np.ndarray(self.shape, dtype=self.dtype, buffer=self.memory.buf)
+
+    @classmethod
+    def copy_of(cls, array):
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @classmethod
+    def open(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape, dtype, name=name)
+
+    def spec(self):
+        return self.memory.name, self.shape, self.dtype.str
+
+    def close(self):
+        # every view on the buffer has to be gone before this
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+from PIL import Image
+
+log = logging.getLogger("Agent Target")
+
+# bump when the files written for an entry change
+CACHE_FORMAT = 1
+
+
+def area_downsample(image, factor):
+    # mean of every factor x factor block, the exact downsample of an image made of whole cells
+    if factor == 1:
+        return image
+    height, width = image.shape[:2]
+    if height % factor or width % factor:
+        raise ValueError(f"{width}x{height} image does not split into {factor}px blocks")
+    blocks = image.reshape(height // factor, factor, width // factor, factor, *image.shape[2:])
+    return blocks.mean(axis=(1, 3), dtype=np.float64)
+
+
+def cell_stats(image, cell_size):
+    # float32 (rows, columns, C) mean and variance of every cell
+    pixels = image.astype(np.float64)
+    mean = area_downsample(pixels, cell_size)
+    variance = area_downsample(pixels * pixels, cell_size) - mean * mean
+    return mean.astype(np.float32), np.maximum(variance, 0).astype(np.float32)
+
+
+def load_image(path, width, height, resample="bicubic"):
+    with Image.open(path) as image:
+        return np.array(image.convert("RGB").resize((width, height), resample=getattr(Image, resample.upper())))
+
+
+class PreparedTarget:
+    # everything a drawing run needs from its target image
+
+    def __init__(self, image, pyramid, cell_mean, cell_variance):
+        self.image = image
+        self.pyramid = pyramid
+        self.cell_mean = cell_mean
+        self.cell_variance = cell_variance
+
+    @classmethod
+    def build(cls, path, width, height, cell_size, resample="bicubic"):
+        image = load_image(path, width, height, resample)
+        return cls(image, TargetPyramid(image, cell_size), *cell_stats(image, cell_size))
+
+
+class TargetPyramid:
+    # area pyramid of the target, level k is 1 / 2 ** k of the full size, the last level is the paint grid.
+    # levels are built once, each from the float level above so rounding does not accumulate
+
+    GRID = "grid"
+
+    def __init__(self, image, cell_size):
+        self.cell_size = cell_size
+        self.factors = [1]
+        self.levels = [np.asarray(image)]
+        level = self.levels[0].astype(np.float64)
+        while self.factors[-1] * 2 <= cell_size and cell_size % (self.factors[-1] * 2) == 0:
+            level = area_downsample(level, 2)
+            self.factors.append(self.factors[-1] * 2)
+            self.levels.append(self._to_pixels(level))
+        if self.factors[-1] != cell_size:
+            # cells that are not a power of two still get their grid level
+            self.factors.append(cell_size)
+            self.levels.append(self._to_pixels(area_downsample(self.levels[0].astype(np.float64), cell_size)))
+
+    @classmethod
+    def from_levels(cls, levels, factors, cell_size):
+        pyramid = cls.__new__(cls)
+        pyramid.cell_size = cell_size
+        pyramid.levels = list(levels)
+        pyramid.factors = list(factors)
+        return pyramid
+
+    def _to_pixels(self, level):
+        return np.rint(level).astype(self.levels[0].dtype)
+
+    def level(self, name):
+        # "grid", or a level number counted from full resolution
+        if name in (None, "", self.GRID):
+            return len(self.levels) - 1
+        level = int(name)
+        if not 0 <= level < len(self.levels):
+            raise ValueError(f"pyramid level {level} out of range, the target has levels 0..{len(self.levels) - 1}")
+        return level
+
+    def factor(self, level):
+        return self.factors[level]
+
+    def image(self, level):
+        return self.levels[level]
+
+
+class TargetCache:
+    # prepared targets on disk, one directory per (file hash, size, cell size, resample) holding .npy files
+    # that warm starts map read only instead of decoding and resizing the image again.
+    # the least recently used entries go once the directory grows past max_bytes
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def file_hash(path):
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def key(self, path, width, height, cell_size, resample="bicubic"):
+        params = f"v{CACHE_FORMAT}:{self.file_hash(path)}:{width}x{height}:{cell_size}:{resample}"
+        return hashlib.sha256(params.encode()).hexdigest()
+
+    def get(self, path, width, height, cell_size, resample="bicubic"):
+        key = self.key(path, width, height, cell_size, resample)
+        entry = os.path.join(self.cache_dir, key)
+        try:
+            target = self._load(entry)
+        except (OSError, ValueError, KeyError):
+            target = None
+        if target is not None:
+            self.hits += 1
+            log.info(f"target cache hit {key[:12]} for {path}")
+            return target
+
+        self.misses += 1
+        start = time.monotonic()
+        target = PreparedTarget.build(path, width, height, cell_size, resample)
+        self._store(entry, target, {"path": os.path.abspath(path), "width": width, "height": height,
+                                    "cell_size": cell_size, "resample": resample})
+        log.info(f"target cache miss {key[:12]} for {path}, prepared in {time.monotonic() - start:.2f}s")
+        self.evict()
+        return target
+
+    def _load(self, entry):
+        with open(os.path.join(entry, "meta.json")) as f:
+            meta = json.load(f)
+
+        def array(name):
+            return np.load(os.path.join(entry, f"{name}.npy"), mmap_mode="r")
+
+        levels = [array(f"level_{level}") for level in range(len(meta["factors"]))]
+        # the access time drives eviction
+        os.utime(os.path.join(entry, "meta.json"))
+        return PreparedTarget(levels[0], TargetPyramid.from_levels(levels, meta["factors"], meta["cell_size"]),
+                              array("cell_mean"), array("cell_variance"))
+
+    def _store(self, entry, target, meta):
+        # written next to the entry and renamed into place, readers never see half an entry
+        scratch = os.path.join(self.cache_dir, f".{uuid.uuid4().hex}")
+        os.makedirs(scratch)
+        try:
+            for level, image in enumerate(target.pyramid.levels):
+                np.save(os.path.join(scratch, f"level_{level}.npy"), image)
+            np.save(os.path.join(scratch, "cell_mean.npy"), target.cell_mean)
+            np.save(os.path.join(scratch, "cell_variance.npy"), target.cell_variance)
+            with open(os.path.join(scratch, "meta.json"), "w") as f:
+                json.dump({**meta, "factors": target.pyramid.factors}, f)
+            if os.path.exists(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.replace(scratch, entry)
+        except OSError as e:
+            log.warning(f"could not cache target in {entry}: {e}")
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    def entries(self):
+        # (last used, bytes, path) of every entry
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+                entries.append((os.path.getmtime(os.path.join(path, "meta.json")), size, path))
+            except OSError:
+                continue
+        return sorted(entries)
+
+    def evict(self):
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        # the newest entry stays even if it alone is over the limit
+        for _, size, path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            log.info(f"target cache evicted {os.path.basename(path)[:12]}")
@@ -0,0 +1,68 @@
+import asyncio
+import logging
+
+log = logging.getLogger("RAKUN-MAS")
+
+BATCH_TAG = "batch"
+
+
+class MessageBatcher:
+
+    def __init__(self, send, batch_size=64, linger_ms=5.0, max_pending=None):
+        self.send = send
+        self.batch_size = max(1, int(batch_size))
+        self.linger = float(linger_ms) / 1000
+        # failed batches are kept up to this many messages, the oldest are dropped past it
+        self.max_pending = max(self.batch_size, int(max_pending or 16 * self.batch_size))
+        self.pending = []
+        self.dropped = 0
+        self._timer = None
+        self._flushing = None
+        self._failed = None
+
+    async def add(self, message):
+        if self._failed is not None:
+            # a linger flush failed, its batch is still pending and goes out with this one
+            self._failed = None
+            await self.flush()
+        self.pending.append(message)
+        if len(self.pending) >= self.batch_size:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(self.linger, self._on_linger)
+
+    def _on_linger(self):
+        self._timer = None
+        self._flushing = asyncio.ensure_future(self._flush_logged())
+
+    async def _flush_logged(self):
+        try:
+            await self.flush()
+        except Exception as e:
+            log.warning(f"batch flush error, {len(self.pending)} messages kept for the next flush: {e}")
+            self._failed = e
+
+    async def flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            await self.send(batch)
+        except BaseException:
+            # kept for the next flush, in front of what was added meanwhile
+            self.pending[:0] = batch
+            excess = len(self.pending) - self.max_pending
+            if excess > 0:
+                # the broker stays down, memory must not grow with it
+                del self.pending[:excess]
+                self.dropped += excess
+                log.warning(f"{excess} unsent messages dropped, {self.dropped} in total")
+            raise
+
+    async def close(self):
+        await self.flush()
+        if self._flushing is not None:
+            await self._flushing
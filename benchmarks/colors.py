@@ -0,0 +1,92 @@
+import asyncio
+import json
+import os
+import time
+
+import click
+
+import broker
+from agents.color_agent import ColorAgent
+from agents.drawing_agent import DrawingAgent
+from agents.flow import WatermarkQueue
+from run import AgentManager, AgentWrapper
+from transport import LoopbackBroker, LoopbackTransport
+
+
+async def run_case(transport, batch_size, producers, colors, timeout):
+    server = None
+    if transport == "loopback":
+        address = "loopback"
+        loopback = LoopbackBroker(queue_size=4096, policy=broker.BLOCK)
+    else:
+        server, port = await broker.serve("127.0.0.1:0", broker.Broker(queue_size=4096, policy=broker.BLOCK))
+        address = f"127.0.0.1:{port}"
+    managers = []
+    tasks = []
+
+    def wrap(name, agent_obj):
+        kwargs = {"transport": LoopbackTransport(loopback)} if transport == "loopback" else {}
+        agm = AgentManager(address, agent_id=f"{name}-{len(managers)}", agent_name=name, **kwargs)
+        managers.append(agm)
+        return agm, AgentWrapper(id=agm.agent.id, agent=agent_obj, publish=agm.publish,
+                                 dynamic_agent=agm.dynamic_agent, publish_stream=agm.publish_stream,
+                                 flow_control=agm.flow_control, exit=None)
+
+    # the drawing side as execute() runs it: get_colors fills the queue, drain_colors empties it
+    drawing = DrawingAgent()
+    agm, agent = wrap("DrawingAgent", drawing)
+    drawing.basic_colors = WatermarkQueue(drawing.queue_high, drawing.queue_low, drawing.pause_colors,
+                                          maxsize=drawing.queue_max)
+    tasks.append(asyncio.ensure_future(agm.subscribe_for_manager(agent.accept_message, topics=agent.topics())))
+    await asyncio.sleep(0.5)
+
+    color_agents = [ColorAgent(f"{n}", batch_size=batch_size, seed=0, batch_publish=True) for n in range(producers)]
+    wrapped = [wrap("ColorAgent", color_agent) for color_agent in color_agents]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    tasks.extend(asyncio.ensure_future(agent.execute_agent()) for _, agent in wrapped)
+    drawn = 0
+    try:
+        while drawn < colors and time.perf_counter() - start < timeout:
+            drawn += len(await asyncio.wait_for(drawing.drain_colors(), timeout))
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    for color_agent in color_agents:
+        color_agent.is_running = False
+    for task in tasks:
+        task.cancel()
+    await asyncio.wait(tasks)
+    for agm in managers:
+        await agm.close()
+    if server is not None:
+        await server.stop(None)
+    return {
+        "transport": transport,
+        "batch_size": batch_size,
+        "producers": producers,
+        "colors": drawn,
+        "colors_per_sec": drawn / elapsed,
+        "cpu_us_per_color": cpu / drawn * 1e6 if drawn else None,
+        "queue": drawing.basic_colors.stats(),
+    }
+
+
+@click.command()
+@click.option('--transports', default="grpc,loopback", help='Comma separated: grpc, loopback')
+@click.option('--batch-sizes', default="1,64,1024", help='Comma separated colors per ColorAgent message')
+@click.option('--producers', default=4, help='ColorAgents per case, DrawingAgent starts 4')
+@click.option('--colors', default=200000, help='Colors drained per case')
+@click.option('--timeout', default=60.0, help='Seconds per case at most')
+def main(transports, batch_sizes, producers, colors, timeout):
+    cases = []
+    for transport in transports.split(","):
+        for batch_size in [int(b) for b in batch_sizes.split(",")]:
+            cases.append(asyncio.run(run_case(transport, batch_size, producers, colors, timeout)))
+    print(json.dumps({"cpu_count": os.cpu_count(), "cases": cases}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
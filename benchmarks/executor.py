@@ -0,0 +1,73 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import click
+import numpy as np
+
+from agents.export import save_comparison, save_image
+from agents.metrics import uqi
+from executor import AgentExecutor
+
+
+async def ticker(interval, lags, stop):
+    # what a stream reader sees: how late it gets to run after a short sleep
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, loop.time() - start - interval) * 1000)
+
+
+async def run_case(mode, target, image, out_dir, executor):
+    # the end of DrawingAgent.execute: final score, image export and the comparison figure
+    jobs = [(uqi, image, target), (save_image, image, os.path.join(out_dir, "drawing.png")),
+            (save_comparison, target, image, os.path.join(out_dir, "comparison.png"))]
+    lags = []
+    stop = asyncio.Event()
+    tick = asyncio.ensure_future(ticker(0.005, lags, stop))
+    await asyncio.sleep(0.05)
+    start = time.perf_counter()
+    for fn, *args in jobs:
+        if mode == "inline":
+            fn(*args)
+        else:
+            await executor.run(fn, *args, process=mode == "process")
+        # the ticker only gets a turn between jobs when they run inline
+        await asyncio.sleep(0)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.05)
+    stop.set()
+    await tick
+    lags = np.array(lags)
+    return {"mode": mode, "seconds": elapsed, "ticks": len(lags), "lag_ms_max": float(lags.max()),
+            "lag_ms_p99": float(np.percentile(lags, 99))}
+
+
+async def bench(size, seed):
+    rng = np.random.default_rng(seed)
+    target = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    image = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    executor = AgentExecutor(threads=2, processes=1)
+    executor.start()
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            # spawn the pool process before timing anything
+            await executor.run(np.add, 1, 1, process=True)
+            cases = [await run_case(mode, target, image, out_dir, executor) for mode in ("inline", "thread", "process")]
+    finally:
+        await executor.close()
+    return {"cpu_count": os.cpu_count(), "size": size, "cases": cases, "executor": executor.stats()}
+
+
+@click.command()
+@click.option('--size', default=1600, help='Image width and height')
+@click.option('--seed', default=0)
+def main(size, seed):
+    print(json.dumps(asyncio.run(bench(size, seed)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
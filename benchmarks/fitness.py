@@ -0,0 +1,53 @@
+import json
+import time
+
+import click
+import numpy as np
+from sewar.full_ref import uqi
+
+from agents.canvas import Canvas
+from agents.metrics import IncrementalUQI
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+@click.command()
+@click.option('--size', default=1600, help='Canvas width and height')
+@click.option('--pixel-size', default=8, help='Cell size')
+@click.option('--cells-per-step', default=1000, help='Cells painted between two scores')
+@click.option('--steps', default=5, help='Scores to compare')
+@click.option('--tolerance', default=1e-9, help='Largest allowed difference from sewar')
+@click.option('--seed', default=0)
+def main(size, pixel_size, cells_per_step, steps, tolerance, seed):
+    rng = np.random.default_rng(seed)
+    target = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    canvas = Canvas(size, size, pixel_size)
+    tracker = IncrementalUQI(target)
+    _, attach_s = timed(tracker.attach, canvas)
+
+    rows = []
+    for step in range(steps):
+        cells = rng.choice(canvas.rows * canvas.columns, cells_per_step, replace=False)
+        canvas.paint(cells, rng.integers(0, 256, (cells_per_step, 3)))
+        _, update_s = timed(tracker.painted, cells)
+        expected, full_s = timed(uqi, target, canvas.array)
+        diff = abs(tracker.score() - expected)
+        rows.append({"step": step, "incremental": tracker.score(), "sewar": expected, "diff": diff,
+                     "incremental_s": update_s, "sewar_s": full_s})
+        if diff > tolerance:
+            raise click.ClickException(f"incremental uqi drifted {diff} from sewar at step {step}")
+
+    print(json.dumps({
+        "attach_s": attach_s,
+        "mean_incremental_s": float(np.mean([r["incremental_s"] for r in rows])),
+        "mean_sewar_s": float(np.mean([r["sewar_s"] for r in rows])),
+        "steps": rows,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
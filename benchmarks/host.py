@@ -0,0 +1,114 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import click
+import yaml
+
+from broker import Broker, serve
+from topics import message_topics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# a stand-in for a ColorAgent that says it is up and then idles, so agents do not compete for the CPU
+IDLE_AGENT = '''import asyncio
+
+import numpy
+
+
+class IdleAgent:
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    async def start(self):
+        pass
+
+    async def accept_message(self, message):
+        pass
+
+    async def stop(self, *args, **kwargs):
+        pass
+
+    async def execute(self, *args, **kwargs):
+        await self.publish({"agent": "ready"})
+        await asyncio.Event().wait()
+'''
+
+
+class ReadyBroker(Broker):
+    # counts the agents that have published to the ready topic
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.ready = set()
+
+    async def route(self, raw_message):
+        if "ready" in message_topics(raw_message.message.tags):
+            self.ready.add(raw_message.message.sender.id)
+        await super().route(raw_message)
+
+
+def rss_kb(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def measure(commands, agents, address, timeout_s):
+    broker = ReadyBroker()
+    server, _ = await serve(address, broker)
+    start = time.perf_counter()
+    processes = [subprocess.Popen(command, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                 for command in commands]
+    try:
+        while len(broker.ready) < agents:
+            if time.perf_counter() - start > timeout_s:
+                raise click.ClickException(f"only {len(broker.ready)} of {agents} agents came up")
+            await asyncio.sleep(0.01)
+        startup = time.perf_counter() - start
+        # give the agents a moment to settle before reading their memory
+        await asyncio.sleep(1.0)
+        rss = sum(rss_kb(p.pid) for p in processes)
+        return {"processes": len(processes), "startup_s": startup, "rss_mb": rss / 1024,
+                "rss_mb_per_agent": rss / 1024 / agents}
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+        await server.stop(0)
+
+
+@click.command()
+@click.option('--agents', 'agent_counts', default='1,8,32', help='Comma separated agent counts')
+@click.option('--address', default='127.0.0.1:50941', help='Address of the benchmark broker')
+@click.option('--timeout-s', default=120.0, help='Give up when the agents are not up by then')
+def main(agent_counts, address, timeout_s):
+    results = []
+    with tempfile.TemporaryDirectory() as stack:
+        with open(os.path.join(stack, "idle_agent.py"), "w") as f:
+            f.write(IDLE_AGENT)
+        for agents in [int(n) for n in agent_counts.split(",")]:
+            config = os.path.join(stack, f"RakunConfig.{agents}")
+            with open(config, "w") as f:
+                yaml.safe_dump({"name": "host benchmark", "agents": {
+                    f"idle_{n}": {"name": "IdleAgent", "code": "idle_agent.py", "type": "static"}
+                    for n in range(agents)}}, f)
+            run = [sys.executable, os.path.join(ROOT, "run.py"), "--host", address]
+            per_process = [run + ["--id", f"idle-{n}", "--name", "IdleAgent",
+                                  "--source", os.path.join(stack, "idle_agent.py")] for n in range(agents)]
+            results.append({"agents": agents,
+                            "process_per_agent": asyncio.run(measure(per_process, agents, address, timeout_s)),
+                            "host": asyncio.run(measure([run + ["--config", config]], agents, address, timeout_s))})
+    print(json.dumps({"cpu_count": os.cpu_count(), "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
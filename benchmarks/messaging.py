@@ -0,0 +1,165 @@
+import asyncio
+import json
+import os
+import subprocess
+import time
+
+import click
+import numpy as np
+
+import broker
+from agents.agent_messages import create_message
+from run import AgentManager, AgentWrapper
+from transport import LoopbackBroker, LoopbackTransport
+
+TOPIC = "bench"
+
+
+class Producer:
+
+    def __init__(self, payload_size, rate, count):
+        self.payload = os.urandom(payload_size)
+        self.rate = rate
+        self.count = count
+
+    async def execute(self):
+        start = time.perf_counter()
+        for seq in range(self.count):
+            await self.publish(create_message(TOPIC, {"seq": seq, "payload": self.payload}))
+            if self.rate:
+                delay = start + (seq + 1) / self.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+
+class Consumer:
+    topics = [TOPIC]
+
+    def __init__(self, expected):
+        self.expected = expected
+        self.latencies = []
+        self.bytes = 0
+        self.done = asyncio.Event()
+
+    async def accept_message(self, message):
+        content = message["content"]
+        if content.get("agent") != TOPIC:
+            return
+        ts = message["timestamp"]
+        self.latencies.append(time.time() - (ts.seconds + ts.nanos / 1e9))
+        self.bytes += len(content["data"]["payload"])
+        if len(self.latencies) >= self.expected:
+            self.done.set()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+async def run_case(transport, payload_size, fanout, rate, producers, messages, batch, timeout):
+    server = None
+    if transport == "loopback":
+        address = "loopback"
+        loopback = LoopbackBroker(queue_size=4096, policy=broker.BLOCK)
+    else:
+        server, port = await broker.serve("127.0.0.1:0", broker.Broker(queue_size=4096, policy=broker.BLOCK))
+        address = f"127.0.0.1:{port}"
+    managers = []
+    tasks = []
+
+    def wrap(name, agent_obj, **kwargs):
+        if transport == "loopback":
+            kwargs["transport"] = LoopbackTransport(loopback)
+        agm = AgentManager(address, agent_id=f"{name}-{len(managers)}", agent_name=name, **kwargs)
+        managers.append(agm)
+        return agm, AgentWrapper(id=agm.agent.id, agent=agent_obj, publish=agm.publish,
+                                 dynamic_agent=agm.dynamic_agent, publish_stream=agm.publish_stream, exit=None)
+
+    consumers = [Consumer(producers * messages) for _ in range(fanout)]
+    for consumer in consumers:
+        agm, agent = wrap("Consumer", consumer)
+        tasks.append(asyncio.ensure_future(agm.subscribe_for_manager(agent.accept_message, topics=agent.topics())))
+    await asyncio.sleep(0.5)
+
+    wrapped_producers = [wrap("Producer", Producer(payload_size, rate, messages), batch=batch)
+                         for _ in range(producers)]
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await asyncio.gather(*[agent.execute_agent() for _, agent in wrapped_producers])
+    for agm, _ in wrapped_producers:
+        await agm.batcher.flush()
+    try:
+        await asyncio.wait_for(asyncio.gather(*[c.done.wait() for c in consumers]), timeout)
+    except asyncio.TimeoutError:
+        pass
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    for task in tasks:
+        task.cancel()
+    for agm in managers:
+        await agm.close()
+    if server is not None:
+        await server.stop(None)
+
+    latencies = np.array([x for c in consumers for x in c.latencies]) * 1000
+    delivered = len(latencies)
+    return {
+        "transport": transport,
+        "payload_size": payload_size,
+        "fanout": fanout,
+        "rate": rate,
+        "producers": producers,
+        "messages": producers * messages,
+        "batch": batch,
+        "delivered": delivered,
+        "msgs_per_sec": delivered / elapsed,
+        "bytes_per_sec": sum(c.bytes for c in consumers) / elapsed,
+        "latency_ms": {
+            "p50": float(np.percentile(latencies, 50)) if delivered else None,
+            "p95": float(np.percentile(latencies, 95)) if delivered else None,
+            "p99": float(np.percentile(latencies, 99)) if delivered else None,
+        },
+        "cpu_us_per_msg": cpu / delivered * 1e6 if delivered else None,
+    }
+
+
+def int_list(ctx, param, value):
+    return [int(v) for v in value.split(",")]
+
+
+def str_list(ctx, param, value):
+    return value.split(",")
+
+
+@click.command()
+@click.option('--transports', default="grpc,loopback", callback=str_list, help='Comma separated: grpc, loopback')
+@click.option('--payload-sizes', default="16,1024,65536", callback=int_list, help='Comma separated payload bytes')
+@click.option('--fanouts', default="1,4", callback=int_list, help='Comma separated consumer counts')
+@click.option('--rates', default="0", callback=int_list, help='Comma separated msgs/sec per producer, 0 = unpaced')
+@click.option('--producers', default=1, help='Producer agents per case')
+@click.option('--messages', default=2000, help='Messages per producer per case')
+@click.option('--batch/--no-batch', default=False, help='Use micro-batched publish on producers')
+@click.option('--timeout', default=60.0, help='Seconds to wait for delivery per case')
+@click.option('--output', default=None, help='Write results JSON here instead of stdout')
+def main(transports, payload_sizes, fanouts, rates, producers, messages, batch, timeout, output):
+    cases = []
+    for transport in transports:
+        for payload_size in payload_sizes:
+            for fanout in fanouts:
+                for rate in rates:
+                    cases.append(asyncio.run(run_case(transport, payload_size, fanout, rate, producers, messages,
+                                                      batch, timeout)))
+    result = json.dumps({"commit": git_commit(), "cases": cases}, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(result)
+    else:
+        print(result)
+
+
+if __name__ == '__main__':
+    main()
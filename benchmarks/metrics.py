@@ -0,0 +1,58 @@
+import json
+import time
+
+import click
+import numpy as np
+from sewar import full_ref
+
+from agents import metrics
+
+
+def timed(fn, *args, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def first(value):
+    # sewar's ssim returns (ssim, cs)
+    return value[0] if isinstance(value, tuple) else value
+
+
+@click.command()
+@click.option('--size', default=1600, help='Image width and height')
+@click.option('--repeat', default=3, help='Runs per metric, the best one is reported')
+@click.option('--tolerance', default=1e-5, help='Largest allowed relative difference from sewar')
+@click.option('--seed', default=0)
+def main(size, repeat, tolerance, seed):
+    rng = np.random.default_rng(seed)
+    target = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    # a blurred copy, closer to what a painted canvas looks like than plain noise
+    painted = ((target.astype(np.int32) + np.roll(target, 3, axis=(0, 1))) // 2).astype(np.uint8)
+
+    cases = {
+        "uqi": (metrics.uqi, full_ref.uqi),
+        "ssim": (metrics.ssim, full_ref.ssim),
+        "mse": (metrics.mse, full_ref.mse),
+        "psnr": (metrics.psnr, full_ref.psnr),
+    }
+    results = {}
+    for name, (ours, reference) in cases.items():
+        value, ours_s = timed(ours, target, painted, repeat=repeat)
+        expected, sewar_s = timed(reference, target, painted, repeat=repeat)
+        value, expected = first(value), first(expected)
+        diff = abs(value - expected) / max(abs(expected), 1e-12)
+        results[name] = {"value": value, "sewar": expected, "relative_diff": diff,
+                         "seconds": ours_s, "sewar_seconds": sewar_s, "speedup": sewar_s / ours_s}
+        if diff > tolerance:
+            raise click.ClickException(f"{name} is {diff} away from sewar")
+
+    print(json.dumps({"size": size, "metrics": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import json
+import time
+
+import click
+import numpy as np
+from PIL import Image
+
+from agents.canvas import Canvas
+from agents.metrics import IncrementalUQI, uqi
+from agents.scheduler import SCHEDULERS, make_scheduler
+from agents.target import TargetPyramid
+
+
+def load_target(image, size, seed):
+    if image:
+        return np.array(Image.open(image).convert("RGB").resize((size, size)))
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    target = np.stack([np.sin(6 * xx) * 127 + 128, np.cos(4 * yy) * 127 + 128, (xx + yy) * 127], axis=-1)
+    return np.clip(target + rng.normal(0, 10, target.shape), 0, 255).astype(np.uint8)
+
+
+def run_scheduler(name, pyramid, size, pixel_size, batch, every, max_messages, seed):
+    grid = pyramid.image(pyramid.level("grid"))
+    canvas = Canvas(size, size, pixel_size)
+    grid_canvas = Canvas(grid.shape[1], grid.shape[0], 1)
+    fitness = IncrementalUQI(grid)
+    fitness.attach(grid_canvas)
+    scheduler = make_scheduler(name, canvas.columns, canvas.rows, seed=seed, target_cells=grid)
+    # every scheduler sees the same stream of colors, like ColorAgent's uniform random ones
+    colors = np.random.default_rng(seed)
+
+    messages = 0
+    curve = []
+    elapsed = 0.0
+    while not scheduler.done and messages < max_messages:
+        incoming = colors.integers(0, 256, (batch, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        cells, cell_colors = scheduler.assign(incoming)
+        elapsed += time.perf_counter() - start
+        canvas.paint(cells, cell_colors)
+        grid_canvas.paint(cells, cell_colors)
+        fitness.painted(cells)
+        messages += batch
+        if messages % every < batch or scheduler.done:
+            curve.append({"messages": messages, "grid_uqi": fitness.score(), **scheduler.stats()})
+    return {"scheduler": name, "messages": messages, "covered": scheduler.covered, "assign_s": elapsed,
+            "final_uqi": uqi(pyramid.image(0), canvas.array), "stats": scheduler.stats(), "curve": curve}
+
+
+def messages_to_reach(curve, score):
+    for point in curve:
+        if point["grid_uqi"] >= score:
+            return point["messages"]
+    return None
+
+
+@click.command()
+@click.option('--image', default=None, help='Target image, a synthetic gradient if not given')
+@click.option('--size', default=1600, help='Canvas width and height')
+@click.option('--pixel-size', default=8, help='Cell size')
+@click.option('--batch', default=1024, help='Colors per step')
+@click.option('--every', default=4096, help='Messages between two points of the curve')
+@click.option('--max-messages-factor', default=20, help='Give up after this many messages per cell')
+@click.option('--schedulers', default=",".join(SCHEDULERS), help='Comma separated schedulers to compare')
+@click.option('--seed', default=0)
+def main(image, size, pixel_size, batch, every, max_messages_factor, schedulers, seed):
+    target = load_target(image, size, seed)
+    pyramid = TargetPyramid(target, pixel_size)
+    max_messages = max_messages_factor * (size // pixel_size) ** 2
+
+    results = [run_scheduler(name, pyramid, size, pixel_size, batch, every, max_messages, seed)
+               for name in schedulers.split(",")]
+    # messages each scheduler needed to reach fractions of the best final grid score
+    best = max(r["curve"][-1]["grid_uqi"] for r in results)
+    for result in results:
+        result["messages_to_reach"] = {f"{fraction:.2f}": messages_to_reach(result["curve"], fraction * best)
+                                       for fraction in (0.25, 0.5, 0.75, 0.9)}
+    print(json.dumps({"size": size, "pixel_size": pixel_size, "best_grid_uqi": best, "results": results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
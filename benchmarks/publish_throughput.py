@@ -0,0 +1,92 @@
+import asyncio
+import json
+import time
+
+import click
+import grpc
+
+import agent_pb2 as agent_pb2
+import agent_pb2_grpc as agent_pb2_grpc
+from run import AgentManager
+from transport import PUBLISH_STREAM_ACCEPTED
+
+
+class CountingServicer(agent_pb2_grpc.BroadcastServicer):
+
+    def __init__(self):
+        self.received = 0
+
+    async def BroadcastMessage(self, request, context):
+        self.received += 1
+        return agent_pb2.Close()
+
+    async def PublishStream(self, request_iterator, context):
+        await context.send_initial_metadata((PUBLISH_STREAM_ACCEPTED,))
+        async for _ in request_iterator:
+            self.received += 1
+        return agent_pb2.Close()
+
+
+async def publish_per_message_channel(address, message):
+    async with grpc.aio.insecure_channel(address) as channel:
+        stub = agent_pb2_grpc.BroadcastStub(channel)
+        await stub.BroadcastMessage(agent_pb2.Message(
+            content=[agent_pb2.Data(key=k, value=str(v).encode()) for k, v in message.items()]
+        ))
+
+
+async def measure(publish, message, count, concurrency):
+    async def worker(n):
+        for _ in range(n):
+            await publish(message)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker(count // concurrency) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    return (count // concurrency) * concurrency / elapsed
+
+
+async def bench(count, concurrency, pool_size, batch_size, batch_linger_ms):
+    server = grpc.aio.server()
+    servicer = CountingServicer()
+    agent_pb2_grpc.add_BroadcastServicer_to_server(servicer, server)
+    port = server.add_insecure_port("127.0.0.1:0")
+    await server.start()
+    address = f"127.0.0.1:{port}"
+
+    message = {"agent": "colors", "data": {"sender_id": "0", "r": 1, "g": 2, "b": 3}}
+    results = {
+        "per_message_channel": await measure(lambda m: publish_per_message_channel(address, m), message, count,
+                                             concurrency),
+    }
+    agm = AgentManager(address, agent_id="bench", agent_name="Bench", pool_size=pool_size)
+    results["pooled_channel"] = await measure(agm.publish, message, count, concurrency)
+    await agm.close()
+    agm = AgentManager(address, agent_id="bench", agent_name="Bench", pool_size=pool_size, batch=True,
+                       batch_size=batch_size, batch_linger_ms=batch_linger_ms)
+    results["batched"] = await measure(agm.publish, message, count, concurrency)
+    await agm.close()
+    agm = AgentManager(address, agent_id="bench", agent_name="Bench", pool_size=pool_size)
+    async with agm.publish_stream() as stream:
+        results["stream"] = await measure(stream.send, message, count, 1)
+    await agm.close()
+    await server.stop(None)
+    return results
+
+
+@click.command()
+@click.option('--count', default=5000, help='Messages per mode')
+@click.option('--concurrency', default=8, help='Concurrent publishers')
+@click.option('--pool-size', default=2, help='Channel pool size for the pooled mode')
+@click.option('--batch-size', default=64, help='Batch size for the batched mode')
+@click.option('--batch-linger-ms', default=5.0, help='Batch linger for the batched mode')
+def main(count, concurrency, pool_size, batch_size, batch_linger_ms):
+    results = asyncio.run(bench(count, concurrency, pool_size, batch_size, batch_linger_ms))
+    results["speedup"] = results["pooled_channel"] / results["per_message_channel"]
+    results["batched_speedup"] = results["batched"] / results["per_message_channel"]
+    results["stream_speedup"] = results["stream"] / results["per_message_channel"]
+    print(json.dumps({k: round(v, 2) for k, v in results.items()}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
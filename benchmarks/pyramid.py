@@ -0,0 +1,77 @@
+import json
+import time
+
+import click
+import numpy as np
+
+from agents.canvas import Canvas
+from agents.metrics import make_fitness, uqi
+from agents.target import TargetPyramid, area_downsample
+
+
+def run_level(pyramid, level, fitness_name, size, pixel_size, steps, cells_per_step, seed):
+    rng = np.random.default_rng(seed)
+    factor = pyramid.factor(level)
+    canvas = Canvas(size, size, pixel_size)
+    score_canvas = canvas if factor == 1 else Canvas(size // factor, size // factor, pixel_size // factor)
+    fitness = make_fitness(fitness_name, pyramid.image(level))
+
+    start = time.perf_counter()
+    fitness.attach(score_canvas)
+    attach_s = time.perf_counter() - start
+
+    order = rng.permutation(canvas.rows * canvas.columns)
+    step_s = []
+    for step in range(steps):
+        cells = order[step * cells_per_step:(step + 1) * cells_per_step]
+        colors = rng.integers(0, 256, (len(cells), 3), dtype=np.uint8)
+        canvas.paint(cells, colors)
+        start = time.perf_counter()
+        if score_canvas is not canvas:
+            score_canvas.paint(cells, colors)
+        fitness.painted(cells)
+        score = fitness.score()
+        step_s.append(time.perf_counter() - start)
+
+    if score_canvas is not canvas and not np.array_equal(area_downsample(canvas.array, factor), score_canvas.array):
+        raise click.ClickException(f"level {level} canvas is not the area downsample of the full canvas")
+    return canvas, {"level": level, "factor": factor, "shape": list(pyramid.image(level).shape),
+                    "attach_s": attach_s, "mean_step_s": float(np.mean(step_s)), "last_score": score}
+
+
+@click.command()
+@click.option('--size', default=1600, help='Canvas width and height')
+@click.option('--pixel-size', default=8, help='Cell size')
+@click.option('--fitness', 'fitness_name', default='full', help='Fitness used for the progress score')
+@click.option('--cells-per-step', default=1000, help='Cells painted between two progress scores')
+@click.option('--steps', default=5)
+@click.option('--seed', default=0)
+def main(size, pixel_size, fitness_name, cells_per_step, steps, seed):
+    rng = np.random.default_rng(seed)
+    # smooth target, noise has no structure left to keep at the coarse levels
+    yy, xx = np.mgrid[0:size, 0:size] / size
+    target = np.stack([np.sin(6 * xx) * 127 + 128, np.cos(4 * yy) * 127 + 128, (xx + yy) * 127], axis=-1)
+    target = np.clip(target + rng.normal(0, 10, target.shape), 0, 255).astype(np.uint8)
+
+    start = time.perf_counter()
+    pyramid = TargetPyramid(target, pixel_size)
+    build_s = time.perf_counter() - start
+
+    levels = []
+    for level in range(len(pyramid.levels)):
+        canvas, result = run_level(pyramid, level, fitness_name, size, pixel_size, steps, cells_per_step, seed)
+        levels.append(result)
+    for result in levels:
+        result["speedup"] = levels[0]["mean_step_s"] / result["mean_step_s"]
+
+    print(json.dumps({
+        "fitness": fitness_name,
+        "pyramid_build_s": build_s,
+        # the score the run reports at the end, always full resolution
+        "final_full_resolution_score": uqi(target, canvas.array),
+        "levels": levels,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+import json
+import os
+import time
+
+import click
+import numpy as np
+
+from agents.canvas import Canvas
+from agents.metrics import IncrementalUQI
+from agents.parallel import TileWorkers
+
+
+def paint_all(paint, order, batch, rng):
+    start = time.perf_counter()
+    for first in range(0, len(order), batch):
+        cells = order[first:first + batch]
+        paint(cells, rng.integers(0, 256, (len(cells), 3), dtype=np.uint8))
+    return time.perf_counter() - start
+
+
+def in_process(target, size, pixel_size, order, batch, seed):
+    canvas = Canvas(size, size, pixel_size)
+    fitness = IncrementalUQI(target)
+    fitness.attach(canvas)
+
+    def paint(cells, colors):
+        canvas.paint(cells, colors)
+        fitness.painted(cells)
+
+    elapsed = paint_all(paint, order, batch, np.random.default_rng(seed))
+    return elapsed, fitness.score()
+
+
+def tiled(target, size, pixel_size, order, batch, seed, workers):
+    tiles = TileWorkers(size, size, pixel_size, target, workers)
+    try:
+        tiles.attach()
+        elapsed = paint_all(tiles.paint, order, batch, np.random.default_rng(seed))
+        return elapsed, tiles.score()
+    finally:
+        tiles.close()
+
+
+@click.command()
+@click.option('--size', default=1600, help='Canvas width and height')
+@click.option('--pixel-size', default=8, help='Cell size')
+@click.option('--batch', default=1024, help='Cells painted per step')
+@click.option('--workers', 'worker_counts', default='1,2,4,8', help='Comma separated worker counts')
+@click.option('--seed', default=0)
+def main(size, pixel_size, batch, worker_counts, seed):
+    rng = np.random.default_rng(seed)
+    target = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    order = rng.permutation((size // pixel_size) ** 2)
+
+    elapsed, score = in_process(target, size, pixel_size, order, batch, seed)
+    cases = [{"workers": 0, "seconds": elapsed, "cells_per_s": len(order) / elapsed, "score": score}]
+    for workers in [int(w) for w in worker_counts.split(",")]:
+        elapsed, score = tiled(target, size, pixel_size, order, batch, seed, workers)
+        cases.append({"workers": workers, "seconds": elapsed, "cells_per_s": len(order) / elapsed, "score": score})
+    # the same colors land on the same cells in every case, so the scores have to agree
+    if not np.allclose([c["score"] for c in cases], cases[0]["score"], rtol=0, atol=1e-9):
+        raise click.ClickException(f"tiled scores disagree: {[c['score'] for c in cases]}")
+    for case in cases:
+        case["speedup"] = cases[0]["seconds"] / case["seconds"]
+
+    print(json.dumps({"cpu_count": os.cpu_count(), "cells": len(order), "cases": cases}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
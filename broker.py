@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+import uuid
+
+import click
+import grpc
+from google.protobuf.timestamp_pb2 import Timestamp
+
+import agent_pb2 as agent_pb2
+import agent_pb2_grpc as agent_pb2_grpc
+from stack import AgentStack
+from subscription import BLOCK, DROP, Subscription, route
+from topics import message_topics
+from transport import PUBLISH_STREAM_ACCEPTED
+
+logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
+log = logging.getLogger("RAKUN-BROKER")
+
+
+class RawMessage:
+    # keeps the bytes a message arrived as, so fan-out never serializes it again
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.message = agent_pb2.Message.FromString(raw)
+
+
+class AgentLauncher(AgentStack):
+
+    def __init__(self, config_path, address):
+        super().__init__(config_path)
+        host, _, port = address.rpartition(":")
+        self.address = f"{'127.0.0.1' if host in ('', '0.0.0.0', '[::]') else host}:{port}"
+        self.processes = []
+
+    async def launch(self, name, params):
+        agent = self.find(name)
+        agent_id = f"{uuid.uuid4()}"
+        args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "run.py"),
+                "--stack-name", self.name,
+                "--id", agent_id,
+                "--host", self.address,
+                "--name", name,
+                "--source", agent["code"]]
+        for k, v in params.items():
+            args += ["--init-params", k, v]
+        process = await asyncio.create_subprocess_exec(*args, cwd=self.workdir)
+        self.processes.append(process)
+        log.info(f"launched {name} {agent_id} pid={process.pid}")
+        return process
+
+    async def stop(self):
+        for process in self.processes:
+            if process.returncode is None:
+                process.terminate()
+        for process in self.processes:
+            await process.wait()
+        self.processes = []
+
+
+class Broker(agent_pb2_grpc.BroadcastServicer):
+
+    def __init__(self, queue_size=1024, policy=DROP, sync_interval_s=1.0, launcher=None):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.sync_interval_s = sync_interval_s
+        self.launcher = launcher
+        self.subscriptions = set()
+        self.routed = 0
+        self.dropped = 0
+
+    async def route(self, raw_message):
+        topics = message_topics(raw_message.message.tags)
+        routed, dropped = await route(self.subscriptions, raw_message.raw, topics)
+        self.routed += routed
+        self.dropped += dropped
+
+    async def CreateStream(self, request, context):
+        sub = Subscription(request.user, request.topics, self.queue_size, self.policy)
+        self.subscriptions.add(sub)
+        log.info(f"{request.user.name} {request.user.id} subscribed to {sorted(sub.topics) or 'everything'}")
+        try:
+            while True:
+                yield await sub.queue.get()
+        finally:
+            self.subscriptions.discard(sub)
+            sub.close()
+            log.info(f"{request.user.name} {request.user.id} unsubscribed, dropped={sub.dropped}")
+
+    async def SyncTime(self, request, context):
+        while True:
+            now = time.time()
+            seconds = int(now)
+            yield agent_pb2.TimeDelta(timestamp=Timestamp(seconds=seconds, nanos=int((now - seconds) * 10 ** 9)))
+            await asyncio.sleep(self.sync_interval_s)
+
+    async def BroadcastMessage(self, request, context):
+        await self.route(request)
+        return agent_pb2.Close()
+
+    async def PublishStream(self, request_iterator, context):
+        await context.send_initial_metadata((PUBLISH_STREAM_ACCEPTED,))
+        async for message in request_iterator:
+            await self.route(message)
+        return agent_pb2.Close()
+
+    async def StartDynamicAgent(self, request, context):
+        if self.launcher is None:
+            log.warning(f"dynamic agent {request.name} requested, no agent config loaded")
+            return agent_pb2.Close()
+        try:
+            await self.launcher.launch(request.name, {c.key: c.value for c in request.initConfigs})
+        except Exception as e:
+            log.exception(e)
+            await context.abort(grpc.StatusCode.FAILED_PRECONDITION, f"{e}")
+        return agent_pb2.Close()
+
+
+def add_broker_to_server(broker, server):
+    # same methods as agent_pb2_grpc.add_BroadcastServicer_to_server, but published messages
+    # stay raw bytes and CreateStream sends those bytes to every subscriber as they are
+    rpc_method_handlers = {
+        'CreateStream': grpc.unary_stream_rpc_method_handler(
+            broker.CreateStream,
+            request_deserializer=agent_pb2.Connect.FromString,
+            response_serializer=None,
+        ),
+        'SyncTime': grpc.unary_stream_rpc_method_handler(
+            broker.SyncTime,
+            request_deserializer=agent_pb2.Connect.FromString,
+            response_serializer=agent_pb2.TimeDelta.SerializeToString,
+        ),
+        'BroadcastMessage': grpc.unary_unary_rpc_method_handler(
+            broker.BroadcastMessage,
+            request_deserializer=RawMessage,
+            response_serializer=agent_pb2.Close.SerializeToString,
+        ),
+        'PublishStream': grpc.stream_unary_rpc_method_handler(
+            broker.PublishStream,
+            request_deserializer=RawMessage,
+            response_serializer=agent_pb2.Close.SerializeToString,
+        ),
+        'StartDynamicAgent': grpc.unary_unary_rpc_method_handler(
+            broker.StartDynamicAgent,
+            request_deserializer=agent_pb2.DynamicAgent.FromString,
+            response_serializer=agent_pb2.Close.SerializeToString,
+        ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler('api.agent.Broadcast', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+
+
+async def serve(address, broker):
+    server = grpc.aio.server()
+    add_broker_to_server(broker, server)
+    port = server.add_insecure_port(address)
+    await server.start()
+    log.info(f"broker listening on {address}")
+    return server, port
+
+
+@click.command()
+@click.option('--host', default="127.0.0.1:9536", help='Address to listen on')
+@click.option('--config', default=None, help='RakunConfig file used to launch dynamic agents')
+@click.option('--queue-size', default=1024, help='Messages buffered per subscriber')
+@click.option('--policy', default=DROP, type=click.Choice([DROP, BLOCK]),
+              help='What a full subscriber queue does: drop the message or block the publisher')
+@click.option('--start-static/--no-start-static', default=True, help='Launch the static agents listed in --config')
+def main(host, config, queue_size, policy, start_static):
+    async def run_broker():
+        launcher = AgentLauncher(config, host) if config else None
+        server, _ = await serve(host, Broker(queue_size=queue_size, policy=policy, launcher=launcher))
+        try:
+            if launcher is not None and start_static:
+                await launcher.start_static()
+            await server.wait_for_termination()
+        finally:
+            if launcher is not None:
+                await launcher.stop()
+
+    asyncio.run(run_broker())
+
+
+if __name__ == '__main__':
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nExiting...")
@@ -0,0 +1,114 @@
+import asyncio
+import itertools
+import logging
+import weakref
+
+import grpc
+
+import agent_pb2_grpc as agent_pb2_grpc
+
+log = logging.getLogger("RAKUN-MAS")
+
+UNHEALTHY = (grpc.ChannelConnectivity.TRANSIENT_FAILURE, grpc.ChannelConnectivity.SHUTDOWN)
+
+
+class ChannelPool:
+
+    def __init__(self, address, size=1, keepalive_ms=30000, keepalive_timeout_ms=10000, health_check_s=5.0):
+        self.address = address
+        self.size = max(1, int(size))
+        self.health_check_s = health_check_s
+        self.options = [
+            ("grpc.keepalive_time_ms", int(keepalive_ms)),
+            ("grpc.keepalive_timeout_ms", int(keepalive_timeout_ms)),
+            ("grpc.keepalive_permit_without_calls", 1),
+            ("grpc.http2.max_pings_without_data", 0),
+        ]
+        self.reconnects = 0
+        self._channels = [None] * self.size
+        self._stubs = [None] * self.size
+        self._next = itertools.count()
+        # stubs whose channel the pool closed, the calls on them end in a CancelledError
+        self._retired = weakref.WeakSet()
+        self._health_task = None
+
+    def _open(self, index):
+        channel = grpc.aio.insecure_channel(self.address, options=self.options)
+        self._channels[index] = channel
+        self._stubs[index] = None
+        return channel
+
+    def _channel(self, index):
+        channel = self._channels[index]
+        if channel is None:
+            return self._open(index)
+        if channel.get_state(try_to_connect=False) == grpc.ChannelConnectivity.SHUTDOWN:
+            self.reconnects += 1
+            log.warning(f"channel {index} to {self.address} was shut down, reconnecting")
+            self._retire([self._stubs[index]])
+            return self._open(index)
+        return channel
+
+    def stub(self):
+        if self.health_check_s and self._health_task is None:
+            self._health_task = asyncio.get_event_loop().create_task(self._health_check())
+        index = next(self._next) % self.size
+        channel = self._channel(index)
+        stub = self._stubs[index]
+        if stub is None:
+            stub = agent_pb2_grpc.BroadcastStub(channel)
+            self._stubs[index] = stub
+        return stub
+
+    async def reset(self, stub):
+        # after a failed call on stub. Streams share its channel, so it is only replaced when it is down
+        for index, s in enumerate(self._stubs):
+            if s is stub:
+                channel = self._channels[index]
+                if channel is None or channel.get_state(try_to_connect=False) in UNHEALTHY:
+                    await self._reset(index)
+                return
+
+    def closed(self, stub):
+        # True once the pool closed the channel under stub
+        return stub in self._retired
+
+    def _retire(self, stubs):
+        self._retired.update(s for s in stubs if s is not None)
+
+    async def _reset(self, index):
+        channel = self._channels[index]
+        self._retire([self._stubs[index]])
+        self._channels[index] = None
+        self._stubs[index] = None
+        self.reconnects += 1
+        log.warning(f"resetting channel {index} to {self.address}")
+        if channel is not None:
+            await channel.close()
+
+    async def _health_check(self):
+        failing = {}
+        while True:
+            await asyncio.sleep(self.health_check_s)
+            for index, channel in enumerate(self._channels):
+                if channel is None:
+                    continue
+                state = channel.get_state(try_to_connect=True)
+                if state == grpc.ChannelConnectivity.TRANSIENT_FAILURE:
+                    failing[index] = failing.get(index, 0) + 1
+                    if failing[index] >= 2:
+                        failing.pop(index)
+                        await self._reset(index)
+                else:
+                    failing.pop(index, None)
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        channels = [c for c in self._channels if c is not None]
+        self._retire(self._stubs)
+        self._channels = [None] * self.size
+        self._stubs = [None] * self.size
+        for channel in channels:
+            await channel.close()
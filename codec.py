@@ -0,0 +1,242 @@
+import pickle
+import struct
+from collections.abc import Mapping
+
+import numpy as np
+from google.protobuf import wrappers_pb2
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+CODEC_TAG_PREFIX = "codec:"
+DEFAULT_CODEC = "pickle"
+
+CODECS = {}
+
+
+def register_codec(codec):
+    CODECS[codec.name] = codec
+    return codec
+
+
+def get_codec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError(f"unknown payload codec {name!r}, registered: {sorted(CODECS)}")
+
+
+class PickleCodec:
+    name = "pickle"
+
+    def accepts(self, value):
+        return True
+
+    def encode(self, value):
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def decode(self, data):
+        return pickle.loads(data)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+
+    def accepts(self, value):
+        # the whole value: packb fails on any member it has no type for, and would turn a tuple into a list
+        if value is None or isinstance(value, (str, bytes, float, bool)):
+            return True
+        if isinstance(value, int):
+            return -2 ** 63 <= value < 2 ** 64
+        if isinstance(value, list):
+            return all(self.accepts(v) for v in value)
+        if isinstance(value, dict):
+            return all(isinstance(k, (str, bytes, int)) and self.accepts(k) and self.accepts(v)
+                       for k, v in value.items())
+        return False
+
+    def encode(self, value):
+        return msgpack.packb(value, use_bin_type=True)
+
+    def decode(self, data):
+        # keys are not only str, accepts lets int and bytes keys through as well
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+class NdarrayCodec:
+    # <dtype len><ndim> dtype shape... followed by the raw C-ordered buffer
+    name = "ndarray"
+    header = struct.Struct("<BB")
+
+    def accepts(self, value):
+        return isinstance(value, np.ndarray) and not value.dtype.hasobject
+
+    def encode(self, value):
+        value = np.ascontiguousarray(value)
+        dtype = value.dtype.str.encode()
+        return b"".join([
+            self.header.pack(len(dtype), value.ndim),
+            dtype,
+            struct.pack(f"<{value.ndim}q", *value.shape),
+            value.data,
+        ])
+
+    def decode(self, data):
+        dtype_len, ndim = self.header.unpack_from(data)
+        offset = self.header.size
+        dtype = np.dtype(bytes(data[offset:offset + dtype_len]).decode())
+        offset += dtype_len
+        shape = struct.unpack_from(f"<{ndim}q", data, offset)
+        offset += 8 * ndim
+        # a read-only view over the received bytes, no copy
+        return np.frombuffer(data, dtype=dtype, count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+
+class FieldsCodec:
+    # a dict with str keys, each value under the codec auto picks for it. create_message() nests the payload under
+    # data, this is what lets its arrays and scalars skip pickle.
+    # <count> then per value <key len> key <codec len> codec <value len> value
+    name = "fields"
+    count = struct.Struct("<I")
+    entry = struct.Struct("<HBQ")
+
+    def accepts(self, value):
+        # a dict pickle would encode as well gains nothing from being split up
+        return isinstance(value, dict) and all(isinstance(k, str) for k in value) and \
+            any(select_codec(v).name != DEFAULT_CODEC for v in value.values())
+
+    def encode(self, value):
+        parts = [self.count.pack(len(value))]
+        for k, v in value.items():
+            c = select_codec(v)
+            key, name, data = k.encode(), c.name.encode(), c.encode(v)
+            parts += [self.entry.pack(len(key), len(name), len(data)), key, name, data]
+        return b"".join(parts)
+
+    def decode(self, data):
+        data = memoryview(data)
+        (count,), offset = self.count.unpack_from(data), self.count.size
+        value = {}
+        for _ in range(count):
+            key_len, name_len, data_len = self.entry.unpack_from(data, offset)
+            offset += self.entry.size
+            key = bytes(data[offset:offset + key_len]).decode()
+            offset += key_len
+            name = bytes(data[offset:offset + name_len]).decode()
+            offset += name_len
+            value[key] = get_codec(name).decode(data[offset:offset + data_len])
+            offset += data_len
+        return value
+
+
+class ScalarCodec:
+
+    def __init__(self, name, wrapper, kind, limits=None):
+        self.name = name
+        self.wrapper = wrapper
+        self.kind = kind
+        self.limits = limits
+
+    def accepts(self, value):
+        # bool is an int subclass, keep them apart
+        if type(value) is not self.kind:
+            return False
+        return self.limits is None or self.limits[0] <= value <= self.limits[1]
+
+    def encode(self, value):
+        return self.wrapper(value=value).SerializeToString()
+
+    def decode(self, data):
+        return self.wrapper.FromString(data).value
+
+
+register_codec(PickleCodec())
+register_codec(NdarrayCodec())
+register_codec(FieldsCodec())
+register_codec(ScalarCodec("pb-bool", wrappers_pb2.BoolValue, bool))
+register_codec(ScalarCodec("pb-int", wrappers_pb2.Int64Value, int, limits=(-2 ** 63, 2 ** 63 - 1)))
+register_codec(ScalarCodec("pb-float", wrappers_pb2.DoubleValue, float))
+register_codec(ScalarCodec("pb-str", wrappers_pb2.StringValue, str))
+register_codec(ScalarCodec("pb-bytes", wrappers_pb2.BytesValue, bytes))
+if msgpack is not None:
+    register_codec(MsgpackCodec())
+
+AUTO_CODECS = ["ndarray", "pb-bool", "pb-int", "pb-float", "pb-str", "pb-bytes", "fields"]
+
+
+def select_codec(value, codec="auto"):
+    # a named codec that cannot encode the value, e.g. ndarray for a dict, leaves it to pickle
+    if codec != "auto":
+        named = get_codec(codec)
+        return named if named.accepts(value) else CODECS[DEFAULT_CODEC]
+    for name in AUTO_CODECS:
+        if CODECS[name].accepts(value):
+            return CODECS[name]
+    return CODECS[DEFAULT_CODEC]
+
+
+def encode_fields(message, codec="auto"):
+    # codec is one name for every field or a dict of per-key names, "auto" picks by value type.
+    # pickled fields carry no tag so receivers without codec support can still read them
+    fields = []
+    tags = []
+    for k in message.keys():
+        val = message[k]
+        c = select_codec(val, codec.get(k, "auto") if isinstance(codec, dict) else codec)
+        fields.append((k, c.encode(val)))
+        if c.name != DEFAULT_CODEC:
+            tags.append(f"{CODEC_TAG_PREFIX}{k}={c.name}")
+    return fields, tags
+
+
+def field_codecs(tags):
+    codecs = {}
+    for tag in tags:
+        if tag.startswith(CODEC_TAG_PREFIX):
+            key, _, name = tag[len(CODEC_TAG_PREFIX):].rpartition("=")
+            codecs[key] = name
+    return codecs
+
+
+def decode_field(codecs, key, data):
+    return get_codec(codecs.get(key, DEFAULT_CODEC)).decode(data)
+
+
+class LazyContent(Mapping):
+    # decodes a message field on first access, so filters can drop a message after reading only its routing keys
+
+    def __init__(self, message):
+        self._fields = {c.key: c for c in message.content}
+        self._codecs = field_codecs(message.tags)
+        self._decoded = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._decoded[key]
+        except KeyError:
+            pass
+        value = decode_field(self._codecs, key, self._fields[key].value)
+        self._decoded[key] = value
+        return value
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __repr__(self):
+        return repr({k: self._decoded[k] if k in self._decoded else "<not decoded>" for k in self._fields})
+
+    @property
+    def decoded(self):
+        return len(self._decoded)
+
+    @property
+    def skipped(self):
+        return len(self._fields) - len(self._decoded)
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from agents.shared import SharedArray
+
+log = logging.getLogger("RAKUN-MAS")
+
+
+def _call_shared(fn, args, shared):
+    # runs in a pool process, shared maps argument positions to the shared memory the arrays were put in
+    opened = {i: SharedArray.open(spec) for i, spec in shared.items()}
+    try:
+        result = fn(*[opened[i].array if i in opened else a for i, a in enumerate(args)])
+        if isinstance(result, np.ndarray) and any(np.shares_memory(result, s.array) for s in opened.values()):
+            result = result.copy()
+        return result
+    finally:
+        for s in opened.values():
+            s.close()
+
+
+class PoolStats:
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def as_dict(self):
+        return {"submitted": self.submitted, "completed": self.completed, "failed": self.failed,
+                "running": self.running, "wait_s": round(self.wait_time, 3), "run_s": round(self.run_time, 3)}
+
+
+class AgentExecutor:
+    # CPU bound work for the agents, off the event loop. run() uses a thread pool, which suits callables on shared
+    # state and numpy code that releases the GIL. run(..., process=True) uses a pool of spawned processes, the
+    # callable has to be importable and ndarray arguments of at least shm_min_bytes go through shared memory.
+    # At most threads / processes calls run at once, the others wait before anything is copied.
+    # A monitor measures how late the loop wakes up from a sleep and reports when it lags by more than lag_warn_ms
+
+    def __init__(self, threads=2, processes=1, shm_min_bytes=1 << 16, lag_interval_ms=100.0, lag_warn_ms=50.0,
+                 lag_report_s=10.0):
+        self.threads = max(1, int(threads))
+        self.processes = max(1, int(processes))
+        self.shm_min_bytes = shm_min_bytes
+        self.lag_interval = lag_interval_ms / 1000
+        self.lag_warn = lag_warn_ms / 1000
+        self.lag_report_s = lag_report_s
+        self.thread_pool = ThreadPoolExecutor(self.threads, thread_name_prefix="rakun-executor")
+        # spawned on first use, most agents never need it
+        self.process_pool = None
+        self.thread_stats = PoolStats()
+        self.process_stats = PoolStats()
+        self.lag = 0.0
+        self.max_lag = 0.0
+        self.lag_total = 0.0
+        self.lag_samples = 0
+        self.lagged = 0
+        self._thread_slots = None
+        self._process_slots = None
+        self._monitor = None
+
+    def start(self):
+        if self._monitor is None:
+            self._thread_slots = asyncio.Semaphore(self.threads)
+            self._process_slots = asyncio.Semaphore(self.processes)
+            self._monitor = asyncio.ensure_future(self._watch_lag())
+
+    async def _watch_lag(self):
+        loop = asyncio.get_running_loop()
+        next_report = loop.time() + self.lag_report_s
+        reported = 0
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            now = loop.time()
+            self.lag = max(0.0, now - start - self.lag_interval)
+            self.max_lag = max(self.max_lag, self.lag)
+            self.lag_total += self.lag
+            self.lag_samples += 1
+            if self.lag > self.lag_warn:
+                self.lagged += 1
+            if now >= next_report:
+                if self.lagged > reported:
+                    log.warning(f"event loop lagged over {self.lag_warn * 1000:.0f}ms {self.lagged - reported} "
+                                f"times in {self.lag_report_s:.0f}s, max {self.max_lag * 1000:.1f}ms")
+                reported = self.lagged
+                next_report = now + self.lag_report_s
+
+    async def run(self, fn, *args, process=False):
+        self.start()
+        stats = self.process_stats if process else self.thread_stats
+        stats.submitted += 1
+        queued = time.monotonic()
+        async with (self._process_slots if process else self._thread_slots):
+            started = time.monotonic()
+            stats.wait_time += started - queued
+            stats.running += 1
+            shared = {}
+            try:
+                loop = asyncio.get_running_loop()
+                if process:
+                    if self.process_pool is None:
+                        self.process_pool = ProcessPoolExecutor(self.processes,
+                                                                mp_context=multiprocessing.get_context("spawn"))
+                    for i, a in enumerate(args):
+                        if isinstance(a, np.ndarray) and not a.dtype.hasobject and a.nbytes >= self.shm_min_bytes:
+                            shared[i] = SharedArray.copy_of(a)
+                    plain = [None if i in shared else a for i, a in enumerate(args)]
+                    result = await loop.run_in_executor(self.process_pool, _call_shared, fn, plain,
+                                                        {i: s.spec() for i, s in shared.items()})
+                else:
+                    result = await loop.run_in_executor(self.thread_pool, fn, *args)
+                stats.completed += 1
+                return result
+            except Exception:
+                stats.failed += 1
+                raise
+            finally:
+                stats.running -= 1
+                stats.run_time += time.monotonic() - started
+                for s in shared.values():
+                    s.close()
+
+    def stats(self):
+        return {"threads": self.thread_stats.as_dict(), "processes": self.process_stats.as_dict(),
+                "lag_ms": {"last": round(self.lag * 1000, 2), "max": round(self.max_lag * 1000, 2),
+                           "mean": round(self.lag_total / self.lag_samples * 1000, 2) if self.lag_samples else 0.0,
+                           "over_warn": self.lagged}}
+
+    async def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            self._monitor = None
+        self.thread_pool.shutdown(wait=False)
+        if self.process_pool is not None:
+            # waited for off the loop, a pool left behind at exit breaks its queue feeder
+            pool, self.process_pool = self.process_pool, None
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
@@ -1,168 +1,326 @@
 import asyncio
-import datetime
+import functools
 import logging
 import os
-import pickle
 import time
+import uuid
 from importlib.machinery import SourceFileLoader
 
 import click
-import grpc
-from google.protobuf.timestamp_pb2 import Timestamp
 
 import agent_pb2 as agent_pb2
-import agent_pb2_grpc as agent_pb2_grpc
+from batching import MessageBatcher
+from channel_pool import ChannelPool
+from codec import CODECS
+from executor import AgentExecutor
+from stack import AgentStack
+from subscription import BLOCK, DROP, Subscription, route
+from supervisor import Backoff, StreamSupervisor
+from topics import agent_topic, message_topics, topic_matches
+from transport import GrpcTransport, LoopbackBroker, LoopbackTransport, timestamp
 
 logging.basicConfig(level=os.environ.get("LOGLEVEL", "INFO"))
 log = logging.getLogger("RAKUN-MAS")
 
+FLOW = "FLOW"
+
 
 class AgentManager:
 
-    def __init__(self, address, agent_id, agent_name, retry):
-        self.retry = retry
+    def __init__(self, address, agent_id, agent_name, pool_size=1, keepalive_ms=30000, health_check_s=5.0,
+                 batch=False, batch_size=64, batch_linger_ms=5.0, codec="pickle", flow_timeout_s=10.0,
+                 reconnect_initial_s=0.1, reconnect_max_s=30.0, pool=None, transport=None, publish_timeout_s=30.0):
         self.address = address
+        self.transport = transport or GrpcTransport(address, pool_size=pool_size, keepalive_ms=keepalive_ms,
+                                                    health_check_s=health_check_s, pool=pool,
+                                                    publish_timeout_s=publish_timeout_s)
+        self.codec = codec
+        self.lost = 0
+        self.decodes = 0
+        self.skipped_decodes = 0
+        self.topics = set()
+        self.dropped = 0
+        self.flow_timeout_s = flow_timeout_s
+        self.flow_holds = {}
+        self.flow_open = {}
+        self.flow_renewed = {}
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.batch = batch
+        self.batcher = MessageBatcher(self._send_batch, batch_size=batch_size, linger_ms=batch_linger_ms)
+        self.reconnect_initial_s = reconnect_initial_s
+        self.reconnect_max_s = reconnect_max_s
+        self.supervisors = {}
         self.agent = agent_pb2.Agent(
             id=agent_id,
             name=agent_name
         )
 
+    async def close(self):
+        if self.supervisors:
+            log.info(f"{self.agent.name} {self.agent.id} streams {self.stream_stats()}")
+        log.info(f"{self.agent.name} {self.agent.id} messages {self.message_stats()}")
+        await self.batcher.close()
+        await self.transport.close()
+
+    async def _send_batch(self, messages):
+        batch = self.transport.batch(self.agent, messages) if len(messages) > 1 else None
+        if batch is not None:
+            await self.transport.broadcast(batch)
+            return
+        for m in messages:
+            await self.transport.broadcast(m)
+
     async def dynamic_agent(self, agent, params):
         try:
-            async with grpc.aio.insecure_channel(self.address) as channel:
-                stub = agent_pb2_grpc.BroadcastStub(channel)
-                content = []
-                for k in params.keys():
-                    val = params[k]
-                    data = agent_pb2.InitData(
-                        key=k,
-                        value=val
-                    )
-                    content.append(data)
-
-                await stub.StartDynamicAgent(agent_pb2.DynamicAgent(
-                    name=agent,
-                    initConfigs=content
-                ))
+            await self.transport.start_agent(agent, params)
         except Exception as e:
             log.error(e)
             return
 
-    async def publish(self, message, msg_type="AGENT", id=None, request_id=None, tags=[]):
+    def _build_message(self, message, msg_type="AGENT", id=None, request_id=None, tags=[], codec=None):
+        return self.transport.message(self.agent, message, msg_type, id, request_id, tags,
+                                      self.codec if codec is None else codec)
+
+    async def flow_control(self, topic, paused):
+        sent = await self.publish({
+            "type": FLOW,
+            "topic": topic,
+            "paused": paused,
+        }, batch=False)
+        if not sent:
+            # the caller sends it again, a lost resume would hold the producers until their timeout
+            raise ConnectionError(f"{'pause' if paused else 'resume'} of {topic} was lost")
+
+    def _on_flow(self, sender, content):
+        topic = content["topic"]
+        holds = self.flow_holds.setdefault(topic, set())
+        gate = self.flow_open.setdefault(topic, asyncio.Event())
+        if content["paused"]:
+            holds.add(sender.id)
+            gate.clear()
+            self.flow_renewed[topic] = time.monotonic()
+        else:
+            holds.discard(sender.id)
+            if not holds:
+                gate.set()
+
+    async def _wait_for_flow(self, topic):
+        start = time.monotonic()
+        self.stalls += 1
+        gate = self.flow_open[topic]
+        while not gate.is_set():
+            # consumers repeat their pause while it lasts, each one pushes the timeout back
+            remaining = self.flow_renewed.get(topic, start) + self.flow_timeout_s - time.monotonic()
+            if remaining <= 0:
+                # a consumer that paused us and went away must not stall producers forever
+                log.warning(f"no resume for {topic} from {sorted(self.flow_holds[topic])} in {self.flow_timeout_s}s")
+                self.flow_holds[topic].clear()
+                gate.set()
+                break
+            try:
+                await asyncio.wait_for(gate.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        stalled = time.monotonic() - start
+        self.stall_time += stalled
+        log.debug(f"publish on {topic} stalled {stalled:.3f}s, total {self.stall_time:.3f}s in {self.stalls} stalls")
+
+    async def publish(self, message, msg_type="AGENT", id=None, request_id=None, tags=[], batch=None, codec=None):
+        batched = self.batch if batch is None else batch
         try:
-            async with grpc.aio.insecure_channel(self.address) as channel:
-                stub = agent_pb2_grpc.BroadcastStub(channel)
-                content = []
-                for k in message.keys():
-                    val = message[k]
-                    data = agent_pb2.Data(
-                        key=k,
-                        value=pickle.dumps(val)
-                    )
-                    content.append(data)
-
-                now = time.time()
-                seconds = int(now)
-                nanos = int((now - seconds) * 10 ** 9)
-                msg_obj = agent_pb2.Message(
-                    id=id if id else f"{datetime.datetime.utcnow().timestamp()}",
-                    sender=self.agent,
-                    content=content,
-                    type=msg_type,
-                    timestamp=Timestamp(seconds=seconds, nanos=nanos),
-                    request_id=request_id if request_id else f"{datetime.datetime.utcnow().timestamp()}",
-                    tags=tags
-                )
-                await stub.BroadcastMessage(msg_obj)
+            topic = message.get("agent")
+            if topic in self.flow_open and not self.flow_open[topic].is_set():
+                await self._wait_for_flow(topic)
+            msg_obj = self._build_message(message, msg_type=msg_type, id=id, request_id=request_id, tags=tags,
+                                          codec=codec)
+            if batched:
+                await self.batcher.add(msg_obj)
                 return True
+            if self.batcher.pending:
+                await self.batcher.flush()
+            await self.transport.broadcast(msg_obj)
+            return True
+        except ConnectionError as e:
+            # the broker went away, agent work goes on through it. A failed batch stays pending for the next
+            # flush, a single message may have reached the broker and is not sent twice
+            if not batched:
+                self.lost += 1
+            log.warning(f"publish failed, {self.lost} lost: {e}")
+            return False
         except Exception as e:
             log.exception("error: {}".format(e), e)
             raise e
 
-    async def subscribe_for_manager(self, message_processor):
-        try:
-            async with grpc.aio.insecure_channel(self.address) as channel:
-                stub = agent_pb2_grpc.BroadcastStub(channel)
+    def publish_stream(self):
+        return PublishStream(self)
+
+    async def supervise(self, name, connect):
+        # runs connect until cancelled, reopening only this stream when it drops
+        supervisor = StreamSupervisor(name, connect,
+                                      Backoff(initial_s=self.reconnect_initial_s, max_s=self.reconnect_max_s))
+        self.supervisors[name] = supervisor
+        await supervisor.run()
+
+    def stream_stats(self):
+        return {name: supervisor.stats() for name, supervisor in self.supervisors.items()}
+
+    def message_stats(self):
+        # decodes and skipped_decodes count fields, dropped counts messages off our topics, lost and batch_dropped
+        # publishes given up on while the broker was down
+        return {"decodes": self.decodes, "skipped_decodes": self.skipped_decodes, "dropped": self.dropped,
+                "lost": self.lost, "batch_dropped": self.batcher.dropped}
+
+    @staticmethod
+    def _guard(on_item):
+        async def guarded(item):
+            try:
+                await on_item(item)
+            except Exception as e:
+                # a message the agent cannot handle is its problem, the stream stays up
+                log.exception("error: {}".format(e), e)
 
-                now = time.time()
-                seconds = int(now)
-                nanos = int((now - seconds) * 10 ** 9)
+        return guarded
 
-                connect = agent_pb2.Connect(
-                    user=self.agent,
-                    active=True,
-                    timestamp=Timestamp(seconds=seconds, nanos=nanos)
-                )
+    def _connect(self):
+        return agent_pb2.Connect(
+            user=self.agent,
+            active=True,
+            timestamp=timestamp(),
+            topics=sorted(self.topics)
+        )
 
-                stream = stub.CreateStream(connect)
+    async def subscribe(self, on_message):
+        # the supervised CreateStream for self.topics, on_message gets every raw message
+        async def connect(up):
+            async def opened():
+                # the broker answering the CONNECT publish means it is back
                 await self.publish({
                     "type": "CONNECT",
                 })
-                async for message in stream:
-                    try:
-                        await self.__process_message(message, message_processor)
-                    except Exception as e:
-                        log.exception("error: {}".format(e), e)
-                        raise e
+                up()
 
-        except Exception as e:
-            log.exception("error: {}".format(e), e)
-            await self.retry(self)
+            await self.transport.messages(self._connect(), self._guard(on_message), opened)
 
-    async def subscribe_for_sync_time(self, time_subscriber):
-        try:
-            async with grpc.aio.insecure_channel(self.address) as channel:
-                stub = agent_pb2_grpc.BroadcastStub(channel)
-
-                now = time.time()
-                seconds = int(now)
-                nanos = int((now - seconds) * 10 ** 9)
-
-                connect = agent_pb2.Connect(
-                    user=self.agent,
-                    active=True,
-                    timestamp=Timestamp(seconds=seconds, nanos=nanos)
-                )
-
-                stream = stub.SyncTime(connect)
-                async for td in stream:
-                    try:
-                        timestamp_dt = datetime.datetime.fromtimestamp(td.timestamp.seconds + td.timestamp.nanos / 1e9)
-                        await time_subscriber(timestamp_dt)
-                    except Exception as e:
-                        log.exception("error: {}".format(e), e)
-                        raise e
+        await self.supervise("messages", connect)
 
-        except Exception as e:
-            log.exception("error: {}".format(e), e)
-            await self.retry(self)
-
-    async def __process_message(self, message: agent_pb2.Message, message_processor):
-        content = {}
-        for c in message.content:
-            key = c.key
-            value = pickle.loads(c.value)
-            content[key] = value
+    async def subscribe_for_manager(self, message_processor, topics=()):
+        self.topics = {agent_topic(self.agent.id), *topics}
+        await self.subscribe(lambda message: self.process_message(message, message_processor))
+
+    async def subscribe_for_sync_time(self, time_subscriber):
+        async def connect(up):
+            first = True
+
+            async def on_time(timestamp_dt):
+                nonlocal first
+                if first:
+                    # the first tick means it is back
+                    first = False
+                    up()
+                await time_subscriber(timestamp_dt)
+
+            await self.transport.sync_time(self._connect(), self._guard(on_time))
+
+        await self.supervise("sync-time", connect)
+
+    async def process_message(self, message: agent_pb2.Message, message_processor):
+        if not topic_matches(self.topics, message_topics(message.tags)):
+            # brokers without topic routing still deliver everything, drop it before decoding
+            self.dropped += 1
+            self.skipped_decodes += getattr(self.transport.content(message), "skipped", 0)
+            return
+        parts = self.transport.unbatch(message)
+        if parts is not None:
+            for part in parts:
+                await self.process_message(part, message_processor)
+            return
+        content = self.transport.content(message)
+        if "type" in content and content["type"] == FLOW:
+            self._on_flow(message.sender, content)
+            return
         await message_processor({
             "content": content,
             "sender": message.sender,
-            "type": message.type
+            "type": message.type,
+            "timestamp": message.timestamp
         })
+        # loopback content is the published dict, nothing to decode
+        self.decodes += getattr(content, "decoded", 0)
+        self.skipped_decodes += getattr(content, "skipped", 0)
+
+
+class PublishStream:
+
+    def __init__(self, manager: AgentManager):
+        self.manager = manager
+        self.call = None
+        self.sent = 0
+
+    async def __aenter__(self):
+        if self.manager.batcher.pending:
+            await self.manager.batcher.flush()
+        self.call = await self.manager.transport.open_publish_stream()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.call is None:
+            return
+        call, self.call = self.call, None
+        if exc_type is None:
+            await call.done_writing()
+            await call
+        else:
+            call.cancel()
+
+    async def send(self, message, msg_type="AGENT", id=None, request_id=None, tags=[], codec=None):
+        msg_obj = self.manager._build_message(message, msg_type=msg_type, id=id, request_id=request_id, tags=tags,
+                                              codec=codec)
+        if self.call is not None:
+            # write() only returns once HTTP/2 flow control lets the message out
+            await self.call.write(msg_obj)
+            self.sent += 1
+            return True
+        await self.manager.transport.broadcast(msg_obj)
+        self.sent += 1
+        return True
+
+    async def pipe(self, messages):
+        async for message in messages:
+            await self.send(message)
+        return self.sent
 
 
 class AgentWrapper:
 
-    def __init__(self, id, agent, publish, dynamic_agent, exit):
+    def __init__(self, id, agent, publish, dynamic_agent, exit, publish_stream=None, flow_control=None,
+                 executor=None, hosted=False):
         self.id = id
         self.publish = publish
         self.exit = exit
         self._agent_ = agent
         self._agent_.event_loop = asyncio.get_event_loop()
+        if getattr(agent, "batch_publish", False):
+            publish = functools.partial(publish, batch=True)
         self._agent_.publish = publish
         self._agent_.dynamic_agent = dynamic_agent
+        self._agent_.publish_stream = publish_stream
+        self._agent_.flow_control = flow_control
+        # await executor.run(fn, *args) keeps CPU bound work off the event loop
+        self._agent_.executor = executor
+        # run by an AgentHost, next to other agents on the same event loop
+        self._agent_.hosted = hosted
         self._agent_.time_delta = 0
         self._agent_.exit = self.exit
 
+    def topics(self):
+        topics = set(getattr(self._agent_, "topics", ()))
+        for name in dir(type(self._agent_)):
+            topic = getattr(getattr(type(self._agent_), name, None), "message_topic", None)
+            if topic is not None:
+                topics.add(topic)
+        return topics
+
     async def start_agent(self):
         if hasattr(self._agent_, "start"):
             try:
@@ -207,31 +365,210 @@ class AgentWrapper:
     # async def dynamic_agent(self, name, params):
 
 
-async def run(comm_server_url, agent_obj, agent_id, agent_name) -> None:
+class AgentHost(AgentStack):
+    # runs the agents of a RakunConfig stack on one event loop. They share one channel pool, one message subscription
+    # for the union of their topics and one time sync, each message is handed to the agents locally and dynamic
+    # agents are started in this process instead of by the broker. Every agent takes its messages from its own
+    # inbox, so one that is busy only holds up itself. With loopback there is no broker at all, the agents hand
+    # each other their messages by reference
+
+    def __init__(self, address, config_path, pool_size=1, keepalive_ms=30000, health_check_s=5.0, loopback=False,
+                 executor=None, inbox_size=1024, **manager_options):
+        super().__init__(config_path)
+        self.address = address
+        self.pool = None
+        self.loopback = None
+        # inboxes fill and overflow like the broker's queues would for agents in their own processes
+        self.inbox_size = inbox_size
+        self.inbox_policy = DROP
+        if loopback:
+            # publishers wait for room instead of losing messages, a dropped flow resume would stall the producers
+            self.loopback = LoopbackBroker(policy=BLOCK, launcher=self.launch)
+            self.inbox_policy = BLOCK
+        else:
+            self.pool = ChannelPool(address, size=pool_size, keepalive_ms=keepalive_ms,
+                                    health_check_s=health_check_s)
+        self.manager_options = manager_options
+        # one pool for all hosted agents, so together they stay within its limits
+        self.executor = executor or AgentExecutor()
+        # the host's own identity, used for the shared streams
+        self.manager = AgentManager(address, agent_id=f"host-{uuid.uuid4()}", agent_name=f"host:{self.name}",
+                                    transport=self.transport(), **manager_options)
+        self.agents = {}
+        self.inboxes = {}
+        self.classes = {}
+        self.tasks = set()
+        self._resubscribe = None
+
+    def transport(self):
+        if self.loopback is not None:
+            return LoopbackTransport(self.loopback)
+        return GrpcTransport(self.address, pool=self.pool)
+
+    def agent_class(self, name):
+        source = os.path.join(self.workdir, self.find(name)["code"])
+        if source not in self.classes:
+            # every source file is loaded once, however many agents run it
+            module_name = f"rakun_{os.path.splitext(os.path.basename(source))[0]}"
+            self.classes[source] = SourceFileLoader(module_name, source).load_module()
+        return getattr(self.classes[source], name)
+
+    async def launch(self, name, params):
+        agent_id = f"{uuid.uuid4()}"
+        agent_obj = self.agent_class(name)(**params)
+        manager = AgentManager(self.address, agent_id=agent_id, agent_name=name, transport=self.transport(),
+                               **self.manager_options)
+        agent = AgentWrapper(id=agent_id, agent=agent_obj,
+                             publish=manager.publish,
+                             dynamic_agent=self.launch,
+                             publish_stream=manager.publish_stream,
+                             flow_control=manager.flow_control,
+                             executor=self.executor,
+                             hosted=True,
+                             exit=exit)
+        manager.topics = {agent_topic(agent_id), *agent.topics()}
+        inbox = Subscription(manager.agent, manager.topics, self.inbox_size, self.inbox_policy)
+        self.agents[agent_id] = (manager, agent)
+        self.inboxes[agent_id] = inbox
+        for task in (asyncio.ensure_future(agent.run()), asyncio.ensure_future(self._deliver(manager, agent, inbox))):
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        self._topics_changed()
+        log.info(f"hosting {name} {agent_id}, {len(self.agents)} agents")
+        return agent_id
+
+    def _topics_changed(self):
+        topics = set().union(*(manager.topics for manager, _ in self.agents.values()))
+        if topics <= self.manager.topics:
+            return
+        self.manager.topics |= topics
+        if "messages" in self.manager.supervisors and self._resubscribe is None:
+            # agents started together resubscribe once
+            self._resubscribe = asyncio.get_event_loop().call_later(0.05, self._restart_messages)
+
+    def _restart_messages(self):
+        self._resubscribe = None
+        self.manager.supervisors["messages"].restart()
+
+    async def _demux(self, message):
+        await route(self.inboxes.values(), message, message_topics(message.tags))
+
+    @staticmethod
+    async def _deliver(manager, agent, inbox):
+        while True:
+            message = await inbox.queue.get()
+            try:
+                await manager.process_message(message, agent.accept_message)
+            except Exception as e:
+                log.exception(f"agent {manager.agent.name} {manager.agent.id} failed on a message: {e}")
+
+    async def _sync_time(self, timestamp):
+        for _, agent in list(self.agents.values()):
+            await agent.sync_time(timestamp)
+
+    async def run(self, start_static=True):
+        if start_static:
+            await self.start_static()
+        streams = [asyncio.ensure_future(self.manager.subscribe(self._demux)),
+                   asyncio.ensure_future(self.manager.subscribe_for_sync_time(self._sync_time))]
+        self.executor.start()
+        log.info(f"HOST {self.manager.agent.id} STARTED with {len(self.agents)} agents")
+        try:
+            await asyncio.wait(streams, return_when=asyncio.ALL_COMPLETED)
+        finally:
+            for task in streams + list(self.tasks):
+                task.cancel()
+
+    async def close(self):
+        for task in list(self.tasks):
+            task.cancel()
+        for inbox in self.inboxes.values():
+            # releases a demux blocked on a full inbox
+            inbox.close()
+        for manager, _ in self.agents.values():
+            await manager.close()
+        await self.manager.close()
+        await self.executor.close()
+        if self.pool is not None:
+            await self.pool.close()
+
+
+async def run(comm_server_url, agent_obj, agent_id, agent_name, pool_size=1, keepalive_ms=30000,
+              health_check_s=5.0, batch=False, batch_size=64, batch_linger_ms=5.0, codec="pickle",
+              reconnect_initial_s=0.1, reconnect_max_s=30.0, executor=None) -> None:
     async def run_agent_manager(agm: AgentManager, agent: AgentWrapper):
-        tasks = [agent.run(),
-                 agm.subscribe_for_sync_time(agent.sync_time),
-                 agm.subscribe_for_manager(agent.accept_message)]
+        # the agent runs once, the streams are supervised and reconnect on their own
+        tasks = [asyncio.ensure_future(agent.run()),
+                 asyncio.ensure_future(agm.subscribe_for_sync_time(agent.sync_time)),
+                 asyncio.ensure_future(agm.subscribe_for_manager(agent.accept_message, topics=agent.topics()))]
         tsk = asyncio.wait(tasks, return_when=asyncio.ALL_COMPLETED)
+        executor.start()
         log.info(f"AGENT {agent_id} STARTED")
         await tsk
 
-    agm = AgentManager(comm_server_url, agent_id=agent_id, agent_name=agent_name, retry=run_agent_manager)
-    agent = AgentWrapper(id=id, agent=agent_obj,
+    agm = AgentManager(comm_server_url, agent_id=agent_id, agent_name=agent_name,
+                       pool_size=pool_size, keepalive_ms=keepalive_ms, health_check_s=health_check_s,
+                       batch=batch, batch_size=batch_size, batch_linger_ms=batch_linger_ms, codec=codec,
+                       reconnect_initial_s=reconnect_initial_s, reconnect_max_s=reconnect_max_s)
+    executor = executor or AgentExecutor()
+    agent = AgentWrapper(id=agent_id, agent=agent_obj,
                          publish=agm.publish,
                          dynamic_agent=agm.dynamic_agent,
+                         publish_stream=agm.publish_stream,
+                         flow_control=agm.flow_control,
+                         executor=executor,
                          exit=exit)
-    await run_agent_manager(agm, agent)
+    try:
+        await run_agent_manager(agm, agent)
+    finally:
+        await agm.close()
+        await executor.close()
 
 
 @click.command()
+@click.option('--config', default=None, help='RakunConfig to host: run all its agents in this process')
+@click.option('--loopback/--no-loopback', default=False,
+              help='With --config, pass messages between the hosted agents in process, without a broker')
 @click.option('--stack-name', help='Agent Stack Name')
 @click.option('--id', help='Agent ID')
 @click.option('--host', help='Rakun Service URL')
 @click.option('--name', help='Agent Name')
 @click.option('--source', help='Agent Source')
 @click.option("--init-params", multiple=True, default=[("name", "agent_init")], type=click.Tuple([str, str]))
-def main(stack_name, id, host, name, source, init_params):
+@click.option('--pool-size', default=1, help='Number of gRPC channels shared by publish and subscriptions')
+@click.option('--keepalive-ms', default=30000, help='gRPC keepalive ping interval in milliseconds')
+@click.option('--health-check-s', default=5.0, help='Channel health check interval in seconds (0 disables)')
+@click.option('--batch/--no-batch', default=False, help='Batch every publish, not only agents that opt in')
+@click.option('--batch-size', default=64, help='Flush a publish batch after this many messages')
+@click.option('--batch-linger-ms', default=5.0, help='Flush a publish batch after this many milliseconds')
+@click.option('--codec', default="pickle", type=click.Choice(["auto", *sorted(CODECS)]),
+              help='Payload codec for published fields, auto picks one per value so arrays and scalars skip pickle')
+@click.option('--reconnect-initial-s', default=0.1, help='First delay before reopening a dropped stream')
+@click.option('--reconnect-max-s', default=30.0, help='Longest delay between two attempts to reopen a stream')
+@click.option('--executor-threads', default=2, help='CPU bound calls agents run at once on threads')
+@click.option('--executor-processes', default=1, help='CPU bound calls agents run at once in processes')
+@click.option('--lag-warn-ms', default=50.0, help='Report event loop stalls longer than this')
+def main(config, loopback, stack_name, id, host, name, source, init_params, pool_size, keepalive_ms, health_check_s,
+         batch, batch_size, batch_linger_ms, codec, reconnect_initial_s, reconnect_max_s, executor_threads,
+         executor_processes, lag_warn_ms):
+    def executor():
+        return AgentExecutor(threads=executor_threads, processes=executor_processes, lag_warn_ms=lag_warn_ms)
+
+    if config:
+        async def run_host():
+            agent_host = AgentHost(host, config, loopback=loopback, executor=executor(), pool_size=pool_size,
+                                   keepalive_ms=keepalive_ms, health_check_s=health_check_s, batch=batch,
+                                   batch_size=batch_size, batch_linger_ms=batch_linger_ms, codec=codec,
+                                   reconnect_initial_s=reconnect_initial_s, reconnect_max_s=reconnect_max_s)
+            # agents find their files relative to the stack, like the ones the broker launches
+            os.chdir(agent_host.workdir)
+            try:
+                await agent_host.run()
+            finally:
+                await agent_host.close()
+
+        asyncio.run(run_host())
+        return
     source = f"{os.path.abspath(source)}"
     log.info(source)
     if os.path.exists(source):
@@ -240,7 +577,10 @@ def main(stack_name, id, host, name, source, init_params):
         params = {k: v for k, v in init_params}
         log.info(f"{type(init_params)}")
         agent_obj = agent_class(**params)
-        asyncio.run(run(host, agent_obj, id, name))
+        asyncio.run(run(host, agent_obj, id, name, pool_size=pool_size, keepalive_ms=keepalive_ms,
+                        health_check_s=health_check_s, batch=batch, batch_size=batch_size,
+                        batch_linger_ms=batch_linger_ms, codec=codec, reconnect_initial_s=reconnect_initial_s,
+                        reconnect_max_s=reconnect_max_s, executor=executor()))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,35 @@
+import os
+from abc import ABC, abstractmethod
+
+import yaml
+
+
+class AgentStack(ABC):
+    # a RakunConfig: the agents of a stack, looked up by name. broker.AgentLauncher starts them as processes and
+    # run.AgentHost in its own process, each through its launch(name, params)
+
+    def __init__(self, config_path):
+        self.config_path = os.path.abspath(config_path)
+        # agents find their files relative to the stack
+        self.workdir = os.path.dirname(self.config_path)
+        with open(self.config_path) as f:
+            self.config = yaml.safe_load(f)
+
+    @property
+    def name(self):
+        return self.config.get("name", "")
+
+    def find(self, name):
+        for agent in (self.config.get("agents") or {}).values():
+            if agent.get("name") == name:
+                return agent
+        raise ValueError(f"agent {name} is not listed in {self.config_path}")
+
+    @abstractmethod
+    async def launch(self, name, params):
+        pass
+
+    async def start_static(self):
+        for agent in (self.config.get("agents") or {}).values():
+            if agent.get("type") == "static":
+                await self.launch(agent["name"], {})
@@ -0,0 +1,58 @@
+import asyncio
+
+from topics import topic_matches
+
+DROP = "drop"
+BLOCK = "block"
+
+
+class Subscription:
+    # a subscriber's queue, in broker.Broker and transport.LoopbackBroker alike. Once closed, offers are dropped
+    # and publishers blocked on it are released
+
+    def __init__(self, user, topics, queue_size, policy):
+        self.user = user
+        self.topics = set(topics)
+        self.policy = policy
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.closed = False
+        self._closed = asyncio.Event()
+
+    async def offer(self, message):
+        # True once the message is queued
+        if not self.closed:
+            try:
+                self.queue.put_nowait(message)
+                return True
+            except asyncio.QueueFull:
+                if self.policy == BLOCK and await self._wait_put(message):
+                    return True
+        self.dropped += 1
+        return False
+
+    async def _wait_put(self, message):
+        put = asyncio.ensure_future(self.queue.put(message))
+        closed = asyncio.ensure_future(self._closed.wait())
+        try:
+            await asyncio.wait((put, closed), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+            put.cancel()
+        return put.done() and not put.cancelled()
+
+    def close(self):
+        self.closed = True
+        self._closed.set()
+
+
+async def route(subscriptions, message, topics):
+    # offers message to the subscriptions on its topics, in every broker alike. (routed, dropped) offers
+    routed = dropped = 0
+    for sub in list(subscriptions):
+        if topic_matches(sub.topics, topics):
+            if await sub.offer(message):
+                routed += 1
+            else:
+                dropped += 1
+    return routed, dropped
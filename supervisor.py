@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import random
+import time
+
+log = logging.getLogger("RAKUN-MAS")
+
+
+class Backoff:
+    # exponential backoff with jitter, each delay is drawn from [(1 - jitter) * d, d] so reconnecting agents spread out
+
+    def __init__(self, initial_s=0.1, max_s=30.0, multiplier=2.0, jitter=0.5):
+        self.initial_s = initial_s
+        self.max_s = max_s
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.attempt = 0
+
+    def next(self):
+        delay = min(self.max_s, self.initial_s * self.multiplier ** self.attempt)
+        self.attempt += 1
+        return delay * (1 - self.jitter * random.random())
+
+    def reset(self):
+        self.attempt = 0
+
+
+class StreamSupervisor:
+    # keeps one server stream alive. connect(up) opens the stream and consumes it, calling up() once it is healthy.
+    # when it fails or the server ends it, only this stream is opened again, after a backoff that resets
+    # once a connection has stayed up for healthy_s. restart() reopens it right away, e.g. to resubscribe
+
+    def __init__(self, name, connect, backoff=None, healthy_s=5.0):
+        self.name = name
+        self.connect = connect
+        self.backoff = backoff or Backoff()
+        self.healthy_s = healthy_s
+        self.connected = False
+        self.reconnects = 0
+        self.failures = 0
+        self.downtime = 0.0
+        self.last_error = None
+        self.restarts = 0
+        self._up_since = None
+        self._down_since = None
+        self._attempt = None
+        self._restarting = False
+
+    def _up(self):
+        now = time.monotonic()
+        self.connected = True
+        self._up_since = now
+        # the error that took the stream down is history once it is back
+        self.last_error = None
+        if self._down_since is not None:
+            down = now - self._down_since
+            self.downtime += down
+            self._down_since = None
+            log.info(f"{self.name} stream back after {down:.2f}s, {self.reconnects} reconnects, "
+                     f"{self.downtime:.2f}s down in total")
+
+    def restart(self):
+        if self._attempt is not None and not self._attempt.done():
+            self._restarting = True
+            self._attempt.cancel()
+
+    async def run(self):
+        while True:
+            self._attempt = asyncio.ensure_future(self.connect(self._up))
+            try:
+                await self._attempt
+                self.last_error = None
+                log.warning(f"{self.name} stream ended by the server")
+            except asyncio.CancelledError:
+                if not self._restarting:
+                    self._attempt.cancel()
+                    raise
+                self._restarting = False
+                self.restarts += 1
+                self.connected = False
+                log.info(f"{self.name} stream restarting")
+                continue
+            except Exception as e:
+                self.failures += 1
+                self.last_error = repr(e)
+                log.warning(f"{self.name} stream failed: {e!r}")
+            now = time.monotonic()
+            if self.connected and now - self._up_since >= self.healthy_s:
+                self.backoff.reset()
+            if self._down_since is None:
+                self._down_since = now
+            self.connected = False
+            delay = self.backoff.next()
+            log.info(f"{self.name} stream reconnecting in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            self.reconnects += 1
+
+    def stats(self):
+        downtime = self.downtime
+        if self._down_since is not None:
+            downtime += time.monotonic() - self._down_since
+        return {"connected": self.connected, "reconnects": self.reconnects, "failures": self.failures,
+                "restarts": self.restarts, "downtime_s": round(downtime, 3), "last_error": self.last_error}
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from batching import MessageBatcher
+
+
+class FlakySend:
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    async def __call__(self, batch):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("broker unavailable")
+        self.sent.append(list(batch))
+
+
+def test_failed_flush_keeps_batch():
+    async def run():
+        send = FlakySend(failures=1)
+        batcher = MessageBatcher(send, batch_size=2)
+        await batcher.add(1)
+        with pytest.raises(ConnectionError):
+            await batcher.add(2)
+        assert batcher.pending == [1, 2]
+        await batcher.add(3)
+        await batcher.close()
+        return send.sent
+
+    assert asyncio.run(run()) == [[1, 2, 3]]
+
+
+def test_failed_linger_flush_is_retried_on_add():
+    async def run():
+        send = FlakySend(failures=1)
+        batcher = MessageBatcher(send, batch_size=10, linger_ms=1)
+        await batcher.add(1)
+        await asyncio.sleep(0.05)
+        assert batcher.pending == [1]
+        await batcher.add(2)
+        await batcher.close()
+        return send.sent
+
+    assert asyncio.run(run()) == [[1], [2]]
+
+
+def test_pending_is_capped_while_flushes_fail():
+    async def run():
+        send = FlakySend(failures=10 ** 6)
+        batcher = MessageBatcher(send, batch_size=2, max_pending=4)
+        await batcher.add(1)
+        for n in range(2, 11):
+            with pytest.raises(ConnectionError):
+                await batcher.add(n)
+            assert len(batcher.pending) <= 4
+        # the broker is back, the newest messages go out
+        send.failures = 0
+        await batcher.close()
+        return send.sent, batcher.dropped
+
+    assert asyncio.run(run()) == ([[7, 8, 9, 10]], 6)
@@ -0,0 +1,51 @@
+import asyncio
+
+from subscription import BLOCK, DROP, Subscription, route
+
+
+def test_closing_a_subscription_releases_blocked_publishers():
+    async def run():
+        sub = Subscription(None, [], queue_size=1, policy=BLOCK)
+        assert await sub.offer(b"first")
+        blocked = asyncio.ensure_future(sub.offer(b"second"))
+        await asyncio.sleep(0.01)
+        assert not blocked.done()
+        sub.close()
+        delivered = await asyncio.wait_for(blocked, 1)
+        return delivered, await sub.offer(b"third"), sub.dropped
+
+    assert asyncio.run(run()) == (False, False, 2)
+
+
+def test_blocked_publisher_resumes_when_the_subscriber_reads():
+    async def run():
+        sub = Subscription(None, [], queue_size=1, policy=BLOCK)
+        await sub.offer(b"first")
+        blocked = asyncio.ensure_future(sub.offer(b"second"))
+        await asyncio.sleep(0.01)
+        assert await sub.queue.get() == b"first"
+        return await asyncio.wait_for(blocked, 1), sub.queue.get_nowait(), sub.dropped
+
+    assert asyncio.run(run()) == (True, b"second", 0)
+
+
+def test_drop_policy_counts_full_queue():
+    async def run():
+        sub = Subscription(None, [], queue_size=1, policy=DROP)
+        return await sub.offer(b"first"), await sub.offer(b"second"), sub.dropped
+
+    assert asyncio.run(run()) == (True, False, 1)
+
+
+def test_route_offers_to_the_subscriptions_on_the_topic():
+    async def run():
+        work = Subscription(None, ["work"], queue_size=1, policy=DROP)
+        other = Subscription(None, ["other"], queue_size=1, policy=DROP)
+        everything = Subscription(None, [], queue_size=1, policy=DROP)
+        subs = {work, other, everything}
+        first = await route(subs, b"first", {"work"})
+        # a full queue drops, untagged messages go to everyone
+        second = await route(subs, b"second", set())
+        return first, second, [s.queue.qsize() for s in (work, other, everything)]
+
+    assert asyncio.run(run()) == ((2, 0), (1, 2), [1, 1, 1])
@@ -0,0 +1,132 @@
+import asyncio
+
+import grpc
+import pytest
+
+import agent_pb2
+from channel_pool import ChannelPool
+from transport import GrpcTransport
+
+READY = grpc.ChannelConnectivity.READY
+TRANSIENT_FAILURE = grpc.ChannelConnectivity.TRANSIENT_FAILURE
+
+
+class FakeChannel:
+    # unary calls answer Close, or fail with UNAVAILABLE and leave the channel in TRANSIENT_FAILURE while failing
+
+    def __init__(self, failing):
+        self.failing = failing
+        self.state = READY
+        self.calls = []
+        self.closed = False
+
+    def get_state(self, try_to_connect=False):
+        return self.state
+
+    def unary_unary(self, path, **kwargs):
+        async def call(request, **options):
+            self.calls.append(path.rsplit("/", 1)[1])
+            if self.failing:
+                self.state = TRANSIENT_FAILURE
+                raise grpc.aio.AioRpcError(grpc.StatusCode.UNAVAILABLE, grpc.aio.Metadata(), grpc.aio.Metadata())
+            return agent_pb2.Close()
+
+        return call
+
+    unary_stream = stream_unary = stream_stream = unary_unary
+
+    async def close(self):
+        self.closed = True
+        self.state = grpc.ChannelConnectivity.SHUTDOWN
+
+
+@pytest.fixture
+def channels(monkeypatch):
+    # every channel the pool opens, the first one failing
+    opened = []
+
+    def insecure_channel(address, options=None):
+        opened.append(FakeChannel(failing=not opened))
+        return opened[-1]
+
+    monkeypatch.setattr(grpc.aio, "insecure_channel", insecure_channel)
+    return opened
+
+
+def test_unavailable_start_agent_is_retried_on_a_new_channel(channels):
+    async def run():
+        transport = GrpcTransport("localhost:0", health_check_s=0)
+        await transport.start_agent("ColorAgent", {"name": "colors"})
+        return transport.pool.reconnects
+
+    assert asyncio.run(run()) == 1
+    assert [c.calls for c in channels] == [["StartDynamicAgent"], ["StartDynamicAgent"]]
+    assert channels[0].closed and not channels[1].closed
+
+
+def test_unavailable_publish_is_not_retried(channels):
+    async def run():
+        transport = GrpcTransport("localhost:0", health_check_s=0)
+        with pytest.raises(ConnectionError):
+            await transport.broadcast(agent_pb2.Message(id="1"))
+        failed = [c.calls for c in channels]
+        # the channel went down with the call, the next publish gets a new one
+        await transport.broadcast(agent_pb2.Message(id="2"))
+        return failed, transport.pool.reconnects
+
+    assert asyncio.run(run()) == ([["BroadcastMessage"]], 1)
+    assert [c.calls for c in channels] == [["BroadcastMessage"], ["BroadcastMessage"]]
+
+
+def test_reset_keeps_a_healthy_channel(channels):
+    async def run():
+        pool = ChannelPool("localhost:0", health_check_s=0)
+        stub = pool.stub()
+        # a call failed, but the channel itself is up, e.g. the broker dropped one stream
+        await pool.reset(stub)
+        return pool.stub() is stub, pool.reconnects, pool.closed(stub)
+
+    assert asyncio.run(run()) == (True, 0, False)
+    assert len(channels) == 1 and not channels[0].closed
+
+
+def test_reset_replaces_an_unhealthy_channel(channels):
+    async def run():
+        pool = ChannelPool("localhost:0", health_check_s=0)
+        stub = pool.stub()
+        channels[0].state = TRANSIENT_FAILURE
+        await pool.reset(stub)
+        return pool.stub() is stub, pool.reconnects, pool.closed(stub)
+
+    assert asyncio.run(run()) == (False, 1, True)
+    assert len(channels) == 2 and channels[0].closed
+
+
+def test_reset_with_a_stale_stub_keeps_the_fresh_channel(channels):
+    async def run():
+        pool = ChannelPool("localhost:0", health_check_s=0)
+        stale = pool.stub()
+        channels[0].state = TRANSIENT_FAILURE
+        await pool.reset(stale)
+        fresh = pool.stub()
+        # still connecting, and a second call that failed on the old channel resets late
+        channels[1].state = TRANSIENT_FAILURE
+        await pool.reset(stale)
+        return pool.stub() is fresh, pool.reconnects
+
+    assert asyncio.run(run()) == (True, 1)
+    assert len(channels) == 2 and not channels[1].closed
+
+
+def test_health_check_resets_only_a_failing_channel(channels):
+    async def run():
+        pool = ChannelPool("localhost:0", size=2, health_check_s=0.01)
+        failing, healthy = pool.stub(), pool.stub()
+        channels[0].state = TRANSIENT_FAILURE
+        await asyncio.sleep(0.1)
+        stubs = pool.stub(), pool.stub()
+        await pool.close()
+        return failing in stubs, healthy in stubs, pool.reconnects
+
+    assert asyncio.run(run()) == (False, True, 1)
+    assert channels[0].closed and len(channels) == 3
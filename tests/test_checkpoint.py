@@ -0,0 +1,123 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+
+import numpy as np
+
+from agents.checkpoint import Checkpoint
+from agents.drawing_agent import DrawingAgent
+from agents.flow import WatermarkQueue
+from agents.metrics import make_fitness
+
+WIDTH, HEIGHT, CELL = 16, 8, 4
+
+
+def painted(n):
+    canvas = np.full((HEIGHT, WIDTH, 3), n, dtype=np.uint8)
+    covered = np.zeros((HEIGHT // CELL) * (WIDTH // CELL), dtype=bool)
+    covered[:n] = True
+    return canvas, covered
+
+
+def save_and_die(root, saves):
+    checkpoint = Checkpoint(root, "run", WIDTH, HEIGHT, CELL)
+    for n in range(1, saves + 1):
+        checkpoint.save(*painted(n), consumed=100 * n)
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def killed_after(root, saves):
+    process = multiprocessing.get_context("spawn").Process(target=save_and_die, args=(root, saves))
+    process.start()
+    process.join()
+    assert process.exitcode == -signal.SIGKILL
+    return Checkpoint(root, "run", WIDTH, HEIGHT, CELL)
+
+
+def test_resume_after_kill_loads_the_last_save(tmp_path):
+    checkpoint = killed_after(str(tmp_path), 3)
+    canvas, covered, consumed = checkpoint.load()
+    expected_canvas, expected_covered = painted(3)
+    assert consumed == 300
+    assert np.array_equal(canvas, expected_canvas) and np.array_equal(covered, expected_covered)
+
+
+def test_truncated_slot_falls_back_to_the_save_before(tmp_path):
+    checkpoint = killed_after(str(tmp_path), 3)
+    newest = Checkpoint.read_meta(checkpoint.path)["slot"]
+    with open(os.path.join(checkpoint.path, f"canvas.{newest}"), "r+b") as f:
+        f.truncate(10)
+    canvas, covered, consumed = checkpoint.load()
+    assert consumed == 200 and np.array_equal(canvas, painted(2)[0])
+    # the next save must not overwrite the slot that was just read
+    checkpoint.save(*painted(4), consumed=400)
+    assert Checkpoint(str(tmp_path), "run", WIDTH, HEIGHT, CELL).load()[2] == 400
+    os.remove(os.path.join(checkpoint.path, f"canvas.{newest}"))
+    assert Checkpoint(str(tmp_path), "run", WIDTH, HEIGHT, CELL).load()[2] == 200
+
+
+def test_missing_slots_load_nothing(tmp_path):
+    checkpoint = killed_after(str(tmp_path), 1)
+    os.remove(os.path.join(checkpoint.path, "covered.0"))
+    assert checkpoint.load() is None
+
+
+def test_no_directory_before_the_first_save(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), "run", WIDTH, HEIGHT, CELL)
+    assert checkpoint.load() is None
+    assert os.listdir(tmp_path) == []
+    checkpoint.save(*painted(1), consumed=1)
+    assert os.listdir(tmp_path) == ["run"]
+
+
+def drawing_agent(root, colors):
+    drawing = DrawingAgent(checkpoint_dir=root, checkpoint_interval_s="0", scheduler="permutation", seed="3",
+                           image="x", draw_batch="10")
+    drawing.basic_colors = WatermarkQueue(10 ** 6, 0, None)
+    for color in colors:
+        drawing.basic_colors.put_nowait([int(c) for c in color])
+    return drawing
+
+
+def test_cancelled_drawing_resumes_from_its_checkpoint(tmp_path):
+    size, cell_size = 32, 4
+    cells = (size // cell_size) ** 2
+    rng = np.random.default_rng(0)
+    target = rng.integers(0, 256, (size, size, 3), dtype=np.uint8)
+    colors = rng.integers(1, 256, (cells, 3))
+
+    async def run():
+        first = drawing_agent(str(tmp_path), colors[:cells // 2])
+        task = asyncio.ensure_future(first.draw_image(size, size, cell_size, make_fitness("incremental", target)))
+        while not first.basic_colors.empty() or not os.listdir(tmp_path):
+            await asyncio.sleep(0.01)
+        # one more batch gives the last save time to land
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        resumed = Checkpoint.read_meta(os.path.join(str(tmp_path), first.run_id))["consumed"]
+
+        second = drawing_agent(str(tmp_path), colors[resumed:])
+        run_id, canvas = await second.draw_image(size, size, cell_size, make_fitness("incremental", target))
+        return first.run_id, run_id, canvas, resumed
+
+    first_id, second_id, canvas, resumed = asyncio.run(run())
+    assert second_id == first_id and resumed > 0
+    # every cell painted between the two runs, and the finished run cleaned up after itself
+    assert (canvas.cells.reshape(-1, 3).sum(1) > 0).all()
+    assert os.listdir(tmp_path) == []
+
+
+def test_cancelled_drawing_before_a_save_leaves_no_directory(tmp_path):
+    async def run():
+        drawing = drawing_agent(str(tmp_path), [])
+        drawing.checkpoint_interval_s = 60.0
+        task = asyncio.ensure_future(drawing.draw_image(32, 32, 4, make_fitness("incremental",
+                                                                               np.zeros((32, 32, 3), np.uint8))))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    asyncio.run(run())
+    assert os.listdir(tmp_path) == []
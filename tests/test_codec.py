@@ -0,0 +1,60 @@
+import numpy as np
+
+import agent_pb2
+from codec import LazyContent, encode_fields
+
+
+def test_auto_encodes_nested_data_fields():
+    colors = np.arange(12, dtype=np.uint8).reshape(4, 3)
+    message = {"agent": "colors", "data": {"colors": colors, "count": 4, "extra": [1, 2]}}
+    fields, tags = encode_fields(message, "auto")
+    assert "codec:data=fields" in tags
+
+    decoded = LazyContent(agent_pb2.Message(content=[agent_pb2.Data(key=k, value=v) for k, v in fields], tags=tags))
+    data = decoded["data"]
+    assert data["count"] == 4 and data["extra"] == [1, 2]
+    np.testing.assert_array_equal(data["colors"], colors)
+
+
+def test_auto_pickles_plain_dicts_whole():
+    _, tags = encode_fields({"data": {"items": [1, 2], "name": None}}, "auto")
+    assert tags == []
+
+
+def test_pickle_is_the_default():
+    message = {"agent": "colors", "data": {"colors": np.zeros((2, 3), dtype=np.uint8)}}
+    _, tags = encode_fields(message, "pickle")
+    assert tags == []
+
+
+def test_named_codec_falls_back_to_pickle_for_values_it_cannot_encode():
+    message = {"agent": "colors", "data": {"colors": [1, 2]}, "objects": np.array([{}, None], dtype=object),
+               "colors": np.zeros((2, 3), dtype=np.uint8)}
+    fields, tags = encode_fields(message, "ndarray")
+    assert tags == ["codec:colors=ndarray"]
+    decoded = LazyContent(agent_pb2.Message(content=[agent_pb2.Data(key=k, value=v) for k, v in fields], tags=tags))
+    assert decoded["agent"] == "colors" and decoded["data"] == {"colors": [1, 2]}
+    assert list(decoded["objects"]) == [{}, None]
+    np.testing.assert_array_equal(decoded["colors"], message["colors"])
+
+
+def decode(fields, tags):
+    return LazyContent(agent_pb2.Message(content=[agent_pb2.Data(key=k, value=v) for k, v in fields], tags=tags))
+
+
+def test_msgpack_leaves_values_with_a_nested_array_to_pickle():
+    colors = np.zeros((4, 3), dtype=np.uint8)
+    message = {"agent": "colors", "data": {"sender_id": "0", "colors": colors}, "items": [1, (2, 3)]}
+    fields, tags = encode_fields(message, "msgpack")
+    assert tags == ["codec:agent=msgpack"]
+    decoded = decode(fields, tags)
+    assert decoded["data"]["sender_id"] == "0" and decoded["items"] == [1, (2, 3)]
+    np.testing.assert_array_equal(decoded["data"]["colors"], colors)
+
+
+def test_msgpack_round_trips_non_str_keys():
+    message = {"data": {1: 2, b"raw": {"n": [1.5, None, True]}}, "big": {"n": 2 ** 64}}
+    fields, tags = encode_fields(message, "msgpack")
+    assert tags == ["codec:data=msgpack"]
+    decoded = decode(fields, tags)
+    assert decoded["data"] == message["data"] and decoded["big"] == message["big"]
@@ -0,0 +1,54 @@
+import asyncio
+
+import numpy as np
+
+from agents.drawing_agent import DrawingAgent
+from agents.flow import WatermarkQueue
+
+
+def agent(**kwargs):
+    drawing = DrawingAgent(**kwargs)
+    drawing.basic_colors = WatermarkQueue(10 ** 6, 0, None)
+    return drawing
+
+
+def colors_message(**data):
+    return {"content": {"agent": "colors", "data": {"sender_id": "0", **data}}}
+
+
+def test_drain_returns_singles_and_batches_as_one_array():
+    async def run():
+        drawing = agent()
+        await drawing.get_colors(colors_message(r=1, g=2, b=3))
+        await drawing.get_colors(colors_message(colors=np.full((4, 3), 7, dtype=np.uint8)))
+        await drawing.get_colors(colors_message(r=4, g=5, b=6))
+        # a batched message is one queue entry
+        depth = drawing.basic_colors.qsize()
+        return depth, await drawing.drain_colors(), drawing.basic_colors.qsize()
+
+    depth, batch, left = asyncio.run(run())
+    assert depth == 3 and left == 0
+    assert batch.dtype == np.uint8 and batch.shape == (6, 3)
+    assert sorted(map(tuple, batch.tolist())) == [(1, 2, 3), (4, 5, 6)] + [(7, 7, 7)] * 4
+
+
+def test_drain_stops_at_draw_batch():
+    async def run():
+        drawing = agent(draw_batch=5)
+        for n in range(12):
+            drawing.basic_colors.put_nowait([n, n, n])
+        return [len(await drawing.drain_colors()) for _ in range(3)]
+
+    assert asyncio.run(run()) == [5, 5, 2]
+
+
+def test_drain_waits_for_the_first_color():
+    async def run():
+        drawing = agent()
+        drain = asyncio.ensure_future(drawing.drain_colors())
+        await asyncio.sleep(0.02)
+        waiting = not drain.done()
+        drawing.basic_colors.put_nowait([1, 1, 1])
+        return waiting, (await asyncio.wait_for(drain, 1)).tolist()
+
+    assert asyncio.run(run()) == (True, [[1, 1, 1]])
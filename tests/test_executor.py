@@ -0,0 +1,130 @@
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import agents.drawing_agent as drawing_agent
+from agents.drawing_agent import DrawingAgent
+from agents.flow import WatermarkQueue
+from executor import AgentExecutor
+
+
+def shm_segments():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_threads_run_off_the_loop_and_within_their_limit():
+    running = []
+    peak = []
+
+    def work(n):
+        running.append(n)
+        peak.append(len(running))
+        time.sleep(0.05)
+        running.remove(n)
+        return threading.current_thread().name, n * n
+
+    async def run():
+        executor = AgentExecutor(threads=2)
+        try:
+            results = await asyncio.gather(*(executor.run(work, n) for n in range(6)))
+            return results, executor.stats()["threads"]
+        finally:
+            await executor.close()
+
+    results, stats = asyncio.run(run())
+    assert [square for _, square in results] == [n * n for n in range(6)]
+    assert all(name.startswith("rakun-executor") for name, _ in results)
+    assert max(peak) <= 2
+    assert stats["submitted"] == stats["completed"] == 6 and stats["running"] == 0 and stats["wait_s"] > 0
+
+
+def test_failures_are_raised_and_counted():
+    async def run():
+        executor = AgentExecutor()
+        try:
+            try:
+                await executor.run(int, "not a number")
+            except ValueError:
+                pass
+            return executor.stats()["threads"]
+        finally:
+            await executor.close()
+
+    stats = asyncio.run(run())
+    assert stats["failed"] == 1 and stats["completed"] == 0
+
+
+def test_processes_get_large_arrays_through_shared_memory():
+    before = shm_segments()
+    big = np.arange(1 << 16, dtype=np.int64).reshape(256, -1)
+    small = np.arange(10)
+
+    async def run():
+        executor = AgentExecutor(processes=1)
+        try:
+            total = await executor.run(np.sum, big, process=True)
+            # a view of the shared block comes back as a copy of its own
+            flat = await executor.run(np.ravel, big, process=True)
+            pid = await executor.run(os.getpid, process=True)
+            small_total = await executor.run(np.sum, small, process=True)
+            return total, flat, pid, small_total, executor.stats()["processes"]
+        finally:
+            await executor.close()
+
+    total, flat, pid, small_total, stats = asyncio.run(run())
+    assert total == big.sum() and small_total == 45
+    assert np.array_equal(flat, big.ravel())
+    assert pid != os.getpid()
+    assert stats["completed"] == 4
+    assert shm_segments() <= before
+
+
+def test_lag_monitor_sees_a_blocked_loop():
+    async def run():
+        executor = AgentExecutor(lag_interval_ms=10, lag_warn_ms=50)
+        executor.start()
+        try:
+            await asyncio.sleep(0.05)
+            time.sleep(0.2)
+            await asyncio.sleep(0.05)
+            return executor.stats()["lag_ms"]
+        finally:
+            await executor.close()
+
+    lag = asyncio.run(run())
+    assert lag["max"] >= 150 and lag["over_warn"] >= 1
+
+
+@pytest.mark.parametrize("hosted", [True, False])
+def test_drawing_offloads_and_shows_only_when_not_hosted(tmp_path, monkeypatch, hosted):
+    shown = []
+    monkeypatch.setattr(drawing_agent.plt, "show", lambda: shown.append(True))
+    image = tmp_path / "target.png"
+    Image.fromarray(np.random.default_rng(0).integers(0, 256, (32, 32, 3), dtype=np.uint8)).save(image)
+
+    async def run():
+        executor = AgentExecutor(threads=1, processes=1)
+        drawing = DrawingAgent(image=str(image), image_width=32, image_height=32, pixel_size=8,
+                               output=str(tmp_path / "out.png"))
+        drawing.executor = executor
+        drawing.hosted = hosted
+        drawing.basic_colors = WatermarkQueue(10 ** 6, 0, None)
+        for n in range(16):
+            drawing.basic_colors.put_nowait([n, n, n])
+        try:
+            await drawing.execute()
+            return executor.stats()
+        finally:
+            await executor.close()
+
+    stats = asyncio.run(run())
+    # the window would hold the loop the other hosted agents run on
+    assert shown == ([] if hosted else [True])
+    assert os.path.exists(tmp_path / "out.png")
+    # the target build on a thread, the saved image and the final score in a process
+    assert stats["threads"]["completed"] >= 1 and stats["processes"]["completed"] == 2
@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+import agent_pb2
+from agents.flow import WatermarkQueue
+from run import FLOW, AgentManager
+from transport import LoopbackBroker, LoopbackTransport
+
+
+def test_watermark_queue_pauses_at_high_and_resumes_at_low():
+    async def run():
+        signals = []
+
+        async def on_pause(paused):
+            signals.append(paused)
+
+        queue = WatermarkQueue(4, 1, on_pause, repause_s=0)
+        for n in range(4):
+            queue.put_nowait(n)
+        await asyncio.sleep(0)
+        paused = list(signals)
+        for _ in range(3):
+            queue.get_nowait()
+        await asyncio.sleep(0)
+        return paused, signals
+
+    assert asyncio.run(run()) == ([True], [True, False])
+
+
+def test_watermark_queue_repeats_the_pause_until_resumed():
+    async def run():
+        signals = []
+
+        async def on_pause(paused):
+            signals.append(paused)
+
+        queue = WatermarkQueue(1, 0, on_pause, repause_s=0.02)
+        queue.put_nowait(0)
+        await asyncio.sleep(0.07)
+        repeated = list(signals)
+        queue.get_nowait()
+        await asyncio.sleep(0.05)
+        return repeated, signals[len(repeated):]
+
+    repeated, after = asyncio.run(run())
+    assert len(repeated) >= 3 and set(repeated) == {True}
+    assert after == [False]
+
+
+def test_watermark_queue_sends_a_failed_resume_again():
+    async def run():
+        signals = []
+
+        async def on_pause(paused):
+            signals.append(paused)
+            if len(signals) == 2:
+                raise ConnectionError("broker unavailable")
+
+        queue = WatermarkQueue(1, 0, on_pause, repause_s=0, retry_s=0.02)
+        queue.put_nowait(0)
+        queue.get_nowait()
+        await asyncio.sleep(0.05)
+        return signals, queue.paused, queue.stats()["failed_signals"]
+
+    assert asyncio.run(run()) == ([True, False, False], False, 1)
+
+
+def test_watermark_queue_drops_a_failed_signal_a_newer_one_replaced():
+    async def run():
+        signals = []
+
+        async def on_pause(paused):
+            signals.append(paused)
+            if paused:
+                await asyncio.sleep(0.01)
+                raise ConnectionError("broker unavailable")
+
+        queue = WatermarkQueue(1, 0, on_pause, repause_s=0, retry_s=0.02)
+        queue.put_nowait(0)
+        await asyncio.sleep(0)
+        # resumed before the pause failed, sending the pause again would throttle the producers for nothing
+        queue.get_nowait()
+        await asyncio.sleep(0.05)
+        return signals, queue.failed_signals
+
+    assert asyncio.run(run()) == ([True, False], 1)
+
+
+def manager(flow_timeout_s):
+    return AgentManager("loopback", agent_id="colors-0", agent_name="ColorAgent",
+                        transport=LoopbackTransport(LoopbackBroker()), flow_timeout_s=flow_timeout_s)
+
+
+def flow(paused):
+    return agent_pb2.Agent(id="drawing"), {"type": FLOW, "topic": "colors", "paused": paused}
+
+
+def test_publish_waits_for_the_resume():
+    async def run():
+        agm = manager(flow_timeout_s=5)
+        agm._on_flow(*flow(True))
+        publish = asyncio.ensure_future(agm.publish({"agent": "colors", "data": {}}))
+        await asyncio.sleep(0.05)
+        waiting = not publish.done()
+        agm._on_flow(*flow(False))
+        await asyncio.wait_for(publish, 1)
+        return waiting, agm.stalls
+
+    assert asyncio.run(run()) == (True, 1)
+
+
+def test_an_unrepeated_pause_times_out():
+    async def run():
+        agm = manager(flow_timeout_s=0.05)
+        agm._on_flow(*flow(True))
+        await asyncio.wait_for(agm.publish({"agent": "colors", "data": {}}), 1)
+        return agm.flow_holds["colors"], agm.flow_open["colors"].is_set()
+
+    assert asyncio.run(run()) == (set(), True)
+
+
+def test_a_repeated_pause_keeps_holding_past_the_timeout():
+    async def run():
+        agm = manager(flow_timeout_s=0.05)
+        agm._on_flow(*flow(True))
+        publish = asyncio.ensure_future(agm.publish({"agent": "colors", "data": {}}))
+        for _ in range(8):
+            await asyncio.sleep(0.02)
+            agm._on_flow(*flow(True))
+        waiting = not publish.done()
+        agm._on_flow(*flow(False))
+        await asyncio.wait_for(publish, 1)
+        return waiting
+
+    assert asyncio.run(run())
+
+
+class DownTransport(LoopbackTransport):
+    # a broker that went away, every publish is lost
+
+    async def broadcast(self, message):
+        raise ConnectionError("broker unavailable")
+
+
+def test_a_lost_flow_signal_is_raised_for_the_queue_to_send_again():
+    async def run():
+        agm = AgentManager("loopback", agent_id="drawing-0", agent_name="DrawingAgent",
+                           transport=DownTransport(LoopbackBroker()))
+        # an agent's publish carries on, the flow signal it failed to send is an error
+        published = await agm.publish({"agent": "colors", "data": {}})
+        with pytest.raises(ConnectionError):
+            await agm.flow_control("colors", False)
+        return published, agm.lost
+
+    assert asyncio.run(run()) == (False, 2)
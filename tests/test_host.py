@@ -0,0 +1,112 @@
+import asyncio
+import multiprocessing
+import os
+
+import pytest
+
+from run import AgentHost
+from stack import AgentStack
+
+AGENTS = '''
+import asyncio
+import os
+
+
+class Producer:
+    def __init__(self, **params):
+        self.pid = None
+
+    async def execute(self):
+        self.pid = os.getpid()
+        await self.dynamic_agent("Consumer", {"name": "late"})
+        await asyncio.sleep(0.05)
+        for n in range(50):
+            await self.publish({"agent": "work", "data": {"n": n}})
+            await self.publish({"agent": "other", "data": {"n": n}})
+
+
+class Consumer:
+    topics = ("work",)
+
+    def __init__(self, name="static"):
+        self.name = name
+        self.pid = os.getpid()
+        self.got = []
+
+    async def accept_message(self, message):
+        # untagged messages, like the CONNECT every stream publishes, reach everyone
+        if message["content"].get("agent") == "work":
+            self.got.append(message["content"]["data"]["n"])
+
+
+class Stuck:
+    topics = ("work",)
+
+    def __init__(self, **params):
+        self.got = 0
+
+    async def accept_message(self, message):
+        self.got += 1
+        await asyncio.Event().wait()
+'''
+
+CONFIG = '''
+name: test
+agents:
+  producer: {name: Producer, code: agents.py, type: static}
+  consumer: {name: Consumer, code: agents.py, type: static}
+  stuck: {name: Stuck, code: agents.py, type: static}
+'''
+
+
+def hosted(tmp_path):
+    (tmp_path / "agents.py").write_text(AGENTS)
+    (tmp_path / "RakunConfig").write_text(CONFIG)
+
+    async def run():
+        host = AgentHost(None, str(tmp_path / "RakunConfig"), loopback=True)
+        task = asyncio.ensure_future(host.run())
+        try:
+            consumers = []
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                consumers = [a._agent_ for _, a in host.agents.values() if type(a._agent_).__name__ == "Consumer"]
+                if len(consumers) == 2 and all(len(c.got) == 50 for c in consumers):
+                    break
+            agents = {type(a._agent_).__name__ + ":" + getattr(a._agent_, "name", ""): a._agent_
+                      for _, a in host.agents.values()}
+            waiting = {type(a._agent_).__name__: host.inboxes[agent_id].queue.qsize()
+                       for agent_id, (_, a) in host.agents.items()}
+            return agents, waiting, multiprocessing.active_children()
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await host.close()
+
+    return asyncio.run(run())
+
+
+def test_messages_reach_only_the_agents_on_their_topic(tmp_path):
+    agents, _, _ = hosted(tmp_path)
+    assert agents["Consumer:static"].got == list(range(50))
+    # started by another agent after the host subscribed, and still on the topic
+    assert agents["Consumer:late"].got == list(range(50))
+
+
+def test_a_stuck_agent_does_not_hold_up_the_others(tmp_path):
+    agents, waiting, _ = hosted(tmp_path)
+    # the stuck agent took one message and the rest wait in its inbox, everyone else got everything
+    assert agents["Stuck:"].got == 1 and waiting["Stuck"] > 0
+    assert agents["Consumer:static"].got == list(range(50))
+
+
+def test_the_whole_stack_runs_in_one_process(tmp_path):
+    agents, _, children = hosted(tmp_path)
+    assert {agent.pid for name, agent in agents.items() if name != "Stuck:"} == {os.getpid()}
+    assert children == []
+
+
+def test_a_stack_needs_a_launcher(tmp_path):
+    (tmp_path / "RakunConfig").write_text(CONFIG)
+    with pytest.raises(TypeError):
+        AgentStack(str(tmp_path / "RakunConfig"))
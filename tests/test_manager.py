@@ -0,0 +1,200 @@
+import asyncio
+import pickle
+
+import grpc
+
+import agent_pb2
+from broker import Broker, serve
+import run as rakun
+from run import AgentManager
+from topics import topic_tag
+from transport import PUBLISH_STREAM_ACCEPTED, GrpcTransport
+
+
+def grpc_manager(transport=None):
+    return AgentManager("localhost:0", agent_id="drawing-0", agent_name="DrawingAgent",
+                        transport=transport or GrpcTransport("localhost:0", health_check_s=0))
+
+
+def undecodable(agent, tags=()):
+    # a data field that fails as soon as anything decodes it
+    return agent_pb2.Message(content=[agent_pb2.Data(key="agent", value=pickle.dumps(agent)),
+                                      agent_pb2.Data(key="data", value=b"not a pickle")], tags=list(tags))
+
+
+def test_messages_for_other_agents_are_never_decoded():
+    async def run():
+        agm = grpc_manager()
+        agm.topics = {"colors"}
+        handled = []
+
+        async def processor(message):
+            # what an agent does with traffic that is not for it: read the agent key and ignore the rest
+            if message["content"]["agent"] == "colors":
+                handled.append(message["content"]["data"])
+
+        # dropped by the topic filter, and untagged but for another agent
+        await agm.process_message(undecodable("work", [topic_tag("work")]), processor)
+        await agm.process_message(undecodable("work"), processor)
+        return handled, agm.message_stats()
+
+    assert asyncio.run(run()) == ([], {"decodes": 1, "skipped_decodes": 3, "dropped": 1, "lost": 0,
+                                          "batch_dropped": 0})
+
+
+class FakeCall:
+    # a PublishStream call whose initial metadata arrives after delay_s
+
+    def __init__(self, metadata, delay_s=0.0):
+        self.metadata = metadata
+        self.delay_s = delay_s
+        self.cancelled = False
+        self.written = []
+
+    async def initial_metadata(self):
+        await asyncio.sleep(self.delay_s)
+        return grpc.aio.Metadata(*self.metadata)
+
+    async def write(self, message):
+        self.written.append(message)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeStub:
+
+    def __init__(self, call):
+        self.call = call
+        self.broadcast = []
+
+    def PublishStream(self):
+        return self.call
+
+    async def BroadcastMessage(self, message, **options):
+        self.broadcast.append(message)
+
+
+class FakePool:
+
+    def __init__(self, stub):
+        self._stub = stub
+
+    def stub(self):
+        return self._stub
+
+
+def publish_through(call, timeout_s=1.0):
+    stub = FakeStub(call)
+
+    async def run():
+        agm = grpc_manager(GrpcTransport("localhost:0", pool=FakePool(stub), publish_stream_timeout_s=timeout_s))
+        async with agm.publish_stream() as stream:
+            streaming = stream.call is not None
+            await stream.send({"agent": "colors", "data": {"n": 0}})
+        return streaming, stream.sent
+
+    streaming, sent = asyncio.run(run())
+    return streaming, sent, stub.broadcast
+
+
+def test_publish_stream_is_used_when_the_broker_accepts_it():
+    async def run():
+        broker = Broker()
+        server, port = await serve("127.0.0.1:0", broker)
+        subscriber = GrpcTransport(f"127.0.0.1:{port}", health_check_s=0)
+        agm = grpc_manager(GrpcTransport(f"127.0.0.1:{port}", health_check_s=0))
+        received = []
+
+        async def on_message(m):
+            received.append(agm.transport.content(m)["data"]["n"])
+
+        connect = agent_pb2.Connect(user=agent_pb2.Agent(id="drawing"), topics=["colors"])
+        task = asyncio.ensure_future(subscriber.messages(connect, on_message))
+        try:
+            while not broker.subscriptions:
+                await asyncio.sleep(0.01)
+            async with agm.publish_stream() as stream:
+                streaming = stream.call is not None
+                for n in range(10):
+                    await stream.send({"agent": "colors", "data": {"n": n}})
+            for _ in range(100):
+                if len(received) == 10:
+                    break
+                await asyncio.sleep(0.01)
+            return streaming, received
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await agm.close()
+            await subscriber.close()
+            await server.stop(None)
+
+    assert asyncio.run(run()) == (True, list(range(10)))
+
+
+def test_publish_stream_falls_back_without_the_broker_marker():
+    call = FakeCall([("other", "accepted")])
+    streaming, sent, broadcast = publish_through(call)
+    assert (streaming, sent, len(broadcast)) == (False, 1, 1)
+    assert call.cancelled and call.written == []
+
+
+def test_publish_stream_falls_back_when_the_broker_does_not_answer():
+    call = FakeCall([PUBLISH_STREAM_ACCEPTED], delay_s=1.0)
+    streaming, sent, broadcast = publish_through(call, timeout_s=0.05)
+    assert (streaming, sent, len(broadcast)) == (False, 1, 1)
+    assert call.cancelled and call.written == []
+
+
+class Producer:
+
+    def __init__(self):
+        self.sent = 0
+
+    async def execute(self):
+        while True:
+            await self.publish({"agent": "colors", "data": {"n": self.sent}})
+            self.sent += 1
+            await asyncio.sleep(0.001)
+
+
+def test_publishing_resumes_after_a_broker_restart():
+    async def run():
+        server, port = await serve("127.0.0.1:0", Broker())
+        address = f"127.0.0.1:{port}"
+        producer = Producer()
+        agent = asyncio.ensure_future(rakun.run(address, producer, "colors-0", "Producer", health_check_s=0,
+                                                reconnect_initial_s=0.05, reconnect_max_s=0.05))
+        consumer = AgentManager(address, agent_id="drawing-0", agent_name="DrawingAgent", health_check_s=0,
+                                reconnect_initial_s=0.05, reconnect_max_s=0.05)
+        received = []
+
+        async def on_message(message):
+            if message["content"].get("agent") == "colors":
+                received.append(message["content"]["data"]["n"])
+
+        subscriber = asyncio.ensure_future(consumer.subscribe_for_manager(on_message, topics=("colors",)))
+
+        async def delivered(count):
+            for _ in range(1000):
+                if len(received) >= count:
+                    return True
+                await asyncio.sleep(0.01)
+            return False
+
+        try:
+            assert await delivered(50)
+            await server.stop(None)
+            await asyncio.sleep(0.5)
+            before = len(received)
+            server, _ = await serve(address, Broker())
+            return await delivered(before + 50), agent.done()
+        finally:
+            for task in (agent, subscriber):
+                task.cancel()
+            await asyncio.gather(agent, subscriber, return_exceptions=True)
+            await consumer.close()
+            await server.stop(None)
+
+    assert asyncio.run(run()) == (True, False)
@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+from sewar import full_ref
+
+from agents import metrics
+from agents.canvas import Canvas
+from agents.metrics import IncrementalUQI
+
+
+def painted_canvas(rng, width, height, cell_size, fraction=0.5):
+    canvas = Canvas(width, height, cell_size)
+    cells = rng.choice(canvas.rows * canvas.columns, int(canvas.rows * canvas.columns * fraction), replace=False)
+    canvas.paint(cells, rng.integers(0, 256, (len(cells), 3)))
+    return canvas
+
+
+def paint(canvas, fitness, rng, cells):
+    cells = np.asarray(cells)
+    canvas.paint(cells, rng.integers(0, 256, (len(cells), 3)))
+    fitness.painted(cells)
+
+
+@pytest.mark.parametrize("width,height,cell_size,ws", [(64, 48, 4, 8), (60, 40, 5, 7), (32, 32, 2, 8)])
+def test_incremental_uqi_matches_sewar_after_random_paints(width, height, cell_size, ws):
+    rng = np.random.default_rng(width * ws)
+    target = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    canvas = painted_canvas(rng, width, height, cell_size)
+    fitness = IncrementalUQI(target, ws=ws)
+    fitness.attach(canvas)
+    for _ in range(20):
+        paint(canvas, fitness, rng, rng.integers(canvas.rows * canvas.columns, size=rng.integers(1, 6)))
+        assert fitness.score() == pytest.approx(full_ref.uqi(target, canvas.array, ws=ws), abs=1e-6)
+
+
+def test_incremental_uqi_matches_sewar_on_edges_and_overlapping_windows():
+    rng = np.random.default_rng(1)
+    width, height, cell_size, ws = 96, 80, 4, 8
+    target = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    canvas = painted_canvas(rng, width, height, cell_size)
+    fitness = IncrementalUQI(target, ws=ws)
+    fitness.attach(canvas)
+    columns, rows = canvas.columns, canvas.rows
+    last = rows * columns - 1
+    batches = [
+        # corners
+        [0], [columns - 1], [last - columns + 1], [last],
+        # whole edges
+        list(range(columns)), list(range(last - columns + 1, last + 1)),
+        list(range(0, last + 1, columns)), list(range(columns - 1, last + 1, columns)),
+        # neighbours share the windows between them, once in one batch and once across batches
+        [columns + 1, columns + 2, 2 * columns + 1, 2 * columns + 2],
+        [columns + 2], [2 * columns + 1],
+        # the same cell twice in a batch
+        [3 * columns + 3, 3 * columns + 3],
+        # big enough to be rescored in one pass
+        list(range(last + 1)),
+    ]
+    for cells in batches:
+        paint(canvas, fitness, rng, cells)
+        assert fitness.score() == pytest.approx(full_ref.uqi(target, canvas.array, ws=ws), abs=1e-6)
+
+
+def test_incremental_uqi_bands_add_up_to_the_whole_map():
+    rng = np.random.default_rng(2)
+    width, height, cell_size, ws = 80, 96, 4, 8
+    target = rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+    canvas = painted_canvas(rng, width, height, cell_size)
+    rows = IncrementalUQI(target, ws=ws).last_row
+    bands = [IncrementalUQI(target, ws=ws, window_rows=(r0, r1)) for r0, r1 in ((0, 10), (10, 27), (27, rows))]
+    for band in bands:
+        band.attach(canvas)
+    for _ in range(10):
+        cells = rng.integers(canvas.rows * canvas.columns, size=4)
+        canvas.paint(cells, rng.integers(0, 256, (len(cells), 3)))
+        for band in bands:
+            band.painted(cells)
+        score = sum(band.total for band in bands) / sum(band.q.size for band in bands)
+        assert score == pytest.approx(full_ref.uqi(target, canvas.array, ws=ws), abs=1e-6)
+
+
+@pytest.fixture
+def images():
+    rng = np.random.default_rng(3)
+    target = rng.integers(0, 256, (72, 96, 3), dtype=np.uint8)
+    # a blurred copy, closer to a painted canvas than unrelated noise
+    painted = ((target.astype(np.int32) + np.roll(target, 3, axis=(0, 1))) // 2).astype(np.uint8)
+    return target, painted
+
+
+@pytest.mark.parametrize("ws", [7, 8])
+def test_uqi_matches_sewar(images, ws):
+    target, painted = images
+    assert metrics.uqi(target, painted, ws=ws) == pytest.approx(full_ref.uqi(target, painted, ws=ws), rel=1e-6)
+
+
+def test_uqi_matches_sewar_on_grayscale(images):
+    target, painted = images[0][:, :, 0], images[1][:, :, 0]
+    assert metrics.uqi(target, painted) == pytest.approx(full_ref.uqi(target, painted), rel=1e-6)
+
+
+def test_ssim_matches_sewar(images):
+    target, painted = images
+    assert metrics.ssim(target, painted) == pytest.approx(full_ref.ssim(target, painted), rel=1e-6)
+
+
+def test_mse_and_psnr_match_sewar(images):
+    target, painted = images
+    assert metrics.mse(target, painted) == pytest.approx(full_ref.mse(target, painted), rel=1e-6)
+    assert metrics.psnr(target, painted) == pytest.approx(full_ref.psnr(target, painted), rel=1e-6)
+    assert metrics.psnr(target, target) == full_ref.psnr(target, target) == np.inf
+
+
+@pytest.mark.parametrize("fitness", ["full", "sewar"])
+def test_whole_canvas_fitness_matches_sewar(fitness):
+    rng = np.random.default_rng(4)
+    target = rng.integers(0, 256, (48, 64, 3), dtype=np.uint8)
+    canvas = painted_canvas(rng, 64, 48, 4)
+    scorer = metrics.make_fitness(fitness, target)
+    scorer.attach(canvas)
+    assert scorer.score() == pytest.approx(full_ref.uqi(target, canvas.array), rel=1e-6)
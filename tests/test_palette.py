@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from agents.color_agent import ColorAgent
+from agents.palette import (BASIC, WEB, ColorSource, NormalColors, PaletteColors, UniformColors, make_colors,
+                            parse_color, parse_palette)
+
+
+@pytest.mark.parametrize("name", ["uniform", "normal", "palette"])
+def test_same_seed_draws_the_same_colors(name):
+    first, second = make_colors(name, seed=7), make_colors(name, seed=7)
+    colors = first.draw(100)
+    assert colors.dtype == np.uint8 and colors.shape == (100, 3)
+    assert np.array_equal(colors, second.draw(100))
+    assert not np.array_equal(colors, make_colors(name, seed=8).draw(100))
+
+
+def test_uniform_covers_every_channel_value():
+    colors = UniformColors(seed=0).draw(20000)
+    assert colors.min() == 0 and colors.max() == 255
+    assert np.allclose(colors.mean(axis=0), 127.5, atol=3)
+
+
+def test_normal_centers_on_its_mean_and_stays_in_range():
+    colors = NormalColors(seed=0, mean="#204060", std="10").draw(20000).astype(float)
+    assert np.allclose(colors.mean(axis=0), [0x20, 0x40, 0x60], atol=0.5)
+    assert np.allclose(colors.std(axis=0), 10, atol=0.5)
+    # clipped, not wrapped around
+    dark = NormalColors(seed=0, mean="0", std=50).draw(1000)
+    assert dark.max() < 250 and (dark == 0).mean() > 0.4
+
+
+def test_palette_draws_only_its_colors():
+    colors = PaletteColors(seed=0, palette="#ff0000,#00ff00").draw(1000)
+    assert {tuple(c) for c in colors.tolist()} == {(255, 0, 0), (0, 255, 0)}
+    assert {tuple(c) for c in PaletteColors(seed=0, palette="basic").draw(1000).tolist()} == \
+        {tuple(c) for c in BASIC.tolist()}
+
+
+def test_parse_color_and_palette():
+    assert parse_color("#0a0b0c").tolist() == [10, 11, 12]
+    assert parse_color("1,2,3").tolist() == [1, 2, 3]
+    assert parse_color(9).tolist() == [9, 9, 9]
+    assert parse_palette("web") is WEB and len(WEB) == 216
+    assert parse_palette("#000000,#ffffff").tolist() == [[0, 0, 0], [255, 255, 255]]
+    with pytest.raises(ValueError, match="unknown palette"):
+        parse_palette("sepia")
+
+
+def test_make_colors_rejects_unknown_distributions_and_ignores_foreign_options():
+    with pytest.raises(ValueError, match="unknown color distribution"):
+        make_colors("poisson")
+    # the options of other sources, like the ColorAgent's own, are not passed on
+    source = make_colors("palette", seed=0, palette="gray", mean="#000000", batch_size="4")
+    assert isinstance(source, PaletteColors) and len(source.palette) == 256
+    with pytest.raises(TypeError):
+        ColorSource()
+
+
+def test_color_agents_with_one_seed_still_differ():
+    first = ColorAgent("a", seed="3", distribution="normal", std="30")
+    again = ColorAgent("a", seed="3", distribution="normal", std="30")
+    other = ColorAgent("b", seed="3", distribution="normal", std="30")
+    colors = first.colors.draw(50)
+    assert np.array_equal(colors, again.colors.draw(50))
+    assert not np.array_equal(colors, other.colors.draw(50))
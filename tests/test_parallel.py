@@ -0,0 +1,73 @@
+import asyncio
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from agents.canvas import Canvas
+from agents.drawing_agent import DrawingAgent
+from agents.flow import WatermarkQueue
+from agents.metrics import IncrementalUQI, make_fitness
+from agents.parallel import TileWorkers
+
+
+@pytest.mark.parametrize("score_factor", [1, 2])
+def test_tiled_score_matches_in_process(score_factor):
+    rng = np.random.default_rng(0)
+    size, cell_size = 96, 4
+    target = rng.integers(0, 256, (size // score_factor, size // score_factor, 3), dtype=np.uint8)
+    canvas = Canvas(size // score_factor, size // score_factor, cell_size // score_factor)
+    fitness = IncrementalUQI(target)
+    fitness.attach(canvas)
+    tiles = TileWorkers(size, size, cell_size, target, 3, score_factor=score_factor)
+    try:
+        tiles.attach()
+        # small batches leave most bands untouched, cells near a band edge reach into the band before
+        for _ in range(30):
+            cells = rng.integers(canvas.rows * canvas.columns, size=rng.integers(1, 4))
+            colors = rng.integers(0, 256, (len(cells), 3), dtype=np.uint8)
+            canvas.paint(cells, colors)
+            fitness.painted(cells)
+            tiles.paint(cells, colors)
+            assert tiles.score() == pytest.approx(fitness.score(), abs=1e-12)
+    finally:
+        tiles.close()
+
+
+def test_workers_need_the_incremental_fitness():
+    with pytest.raises(ValueError):
+        DrawingAgent(workers=2, fitness="full")
+
+
+def shm_segments():
+    return set(os.listdir("/dev/shm")) if os.path.isdir("/dev/shm") else set()
+
+
+def test_tile_workers_leave_nothing_behind():
+    before = shm_segments()
+    target = np.zeros((32, 32, 3), dtype=np.uint8)
+    with TileWorkers(32, 32, 4, target, 2) as tiles:
+        tiles.attach()
+        processes = list(tiles.processes)
+    assert not any(p.is_alive() for p in processes)
+    assert shm_segments() <= before
+
+
+@pytest.mark.parametrize("delay", [0.0, 0.5, 3.0])
+def test_cancelled_tiled_draw_leaves_nothing_behind(delay):
+    async def run():
+        drawing = DrawingAgent(workers=2, seed="1")
+        drawing.basic_colors = WatermarkQueue(10 ** 6, 0, None)
+        target = np.random.default_rng(0).integers(0, 256, (64, 64, 3), dtype=np.uint8)
+        task = asyncio.ensure_future(drawing.draw_image(64, 64, 4, make_fitness("incremental", target)))
+        # during setup, or waiting for colors once the workers are up
+        await asyncio.sleep(delay)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    before = shm_segments()
+    asyncio.run(run())
+    assert multiprocessing.active_children() == []
+    assert shm_segments() <= before
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from agents.scheduler import CellScheduler, OrderedScheduler, make_scheduler
+
+
+def colors(n, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (n, 3), dtype=np.uint8)
+
+
+def run(scheduler, batch=7):
+    cells = []
+    while not scheduler.done:
+        assigned, assigned_colors = scheduler.assign(colors(batch))
+        assert len(assigned) == len(assigned_colors)
+        cells.extend(assigned.tolist())
+    return cells
+
+
+@pytest.mark.parametrize("name", ["permutation", "stratified"])
+def test_ordered_schedulers_paint_every_cell_once(name):
+    scheduler = make_scheduler(name, 12, 10, seed=1)
+    cells = run(scheduler)
+    assert sorted(cells) == list(range(120))
+    assert scheduler.covered == 120
+
+
+def test_random_scheduler_never_paints_a_cell_twice():
+    scheduler = make_scheduler("random", 6, 5, seed=1)
+    cells = run(scheduler, batch=4)
+    assert sorted(cells) == list(range(30))
+
+
+def test_order_is_fixed_by_the_seed():
+    assert run(make_scheduler("permutation", 8, 8, seed=3)) == run(make_scheduler("permutation", 8, 8, seed=3))
+    assert run(make_scheduler("permutation", 8, 8, seed=3)) != run(make_scheduler("permutation", 8, 8, seed=4))
+
+
+def test_stratified_covers_every_block_before_any_block_twice():
+    columns, rows, stratum = 32, 24, 8
+    order = make_scheduler("stratified", columns, rows, seed=2).order
+    blocks = (order // columns // stratum) * (columns // stratum) + (order % columns) // stratum
+    count = (columns // stratum) * (rows // stratum)
+    for first in range(0, len(order), count):
+        assert sorted(blocks[first:first + count]) == list(range(count))
+
+
+def test_restore_puts_painted_cells_first():
+    scheduler = make_scheduler("permutation", 8, 8, seed=5)
+    covered = np.zeros(64, dtype=bool)
+    covered[[3, 10, 40]] = True
+    scheduler.restore(covered, np.zeros((64, 3), dtype=np.uint8), 3)
+    assert scheduler.covered == 3
+    rest = run(scheduler)
+    assert sorted(rest) == sorted(set(range(64)) - {3, 10, 40})
+
+
+def gray_targets(columns, rows, step=8):
+    # cell n has the mean target color (step * n) * (1, 1, 1)
+    return np.repeat(step * np.arange(columns * rows, dtype=np.float32), 3).reshape(rows, columns, 3)
+
+
+def gray(*levels):
+    return np.repeat(np.array(levels, dtype=np.uint8), 3).reshape(-1, 3)
+
+
+def test_nearest_scheduler_paints_every_cell_once():
+    scheduler = make_scheduler("nearest", 12, 10, seed=1, target_cells=gray_targets(12, 10, step=2))
+    # batches bigger than a chunk, and the same colors over and over
+    cells = run(scheduler, batch=100)
+    assert sorted(cells) == list(range(120))
+    assert scheduler.covered == 120
+
+
+def test_nearest_scheduler_picks_the_closest_unpainted_cell():
+    scheduler = make_scheduler("nearest", 6, 5, seed=1, target_cells=gray_targets(6, 5))
+    cells, assigned = scheduler.assign(gray(8 * 17))
+    assert cells.tolist() == [17]
+    np.testing.assert_array_equal(assigned, gray(8 * 17))
+    # 17 is taken, two equal colors in one chunk take the next closest cells, in order
+    cells, _ = scheduler.assign(gray(8 * 17 + 1, 8 * 17 + 1))
+    assert cells.tolist() == [18, 16]
+    cells, _ = scheduler.assign(gray(8 * 17 + 1))
+    assert cells.tolist() == [19]
+
+
+def test_nearest_scheduler_drops_painted_cells_from_its_index():
+    scheduler = make_scheduler("nearest", 6, 5, seed=1, target_cells=gray_targets(6, 5))
+    painted, _ = scheduler.assign(gray(*range(0, 8 * 20, 8)))
+    assert sorted(painted.tolist()) == list(range(20))
+    # more than half painted compacts the index to the unpainted cells
+    assert sorted(scheduler.remaining.tolist()) == list(range(20, 30))
+    assert len(scheduler.means) == len(scheduler.norms) == len(scheduler.alive) == 10
+    cells, _ = scheduler.assign(gray(0))
+    assert cells.tolist() == [20]
+
+
+def test_nearest_scheduler_restore_skips_painted_cells():
+    scheduler = make_scheduler("nearest", 6, 5, seed=1, target_cells=gray_targets(6, 5))
+    covered = np.zeros(30, dtype=bool)
+    covered[[3, 4, 5]] = True
+    scheduler.restore(covered, np.zeros((30, 3), dtype=np.uint8), 3)
+    assert scheduler.covered == 3
+    cells, _ = scheduler.assign(gray(8 * 4))
+    assert cells.tolist() in ([2], [6])
+    rest = run(scheduler)
+    assert sorted(cells.tolist() + rest) == sorted(set(range(30)) - {3, 4, 5})
+
+
+def gated(**options):
+    # one cell with a black target, so every color is tried on it
+    return make_scheduler("gated", 1, 1, seed=1, target_cells=gray_targets(1, 1), **options)
+
+
+def test_gated_scheduler_keeps_only_colors_closer_to_the_target():
+    scheduler = gated()
+    kept = [scheduler.assign(gray(level))[0].tolist() for level in (100, 150, 50, 50, 20)]
+    assert kept == [[0], [], [0], [], [0]]
+    stats = scheduler.stats()
+    assert stats["covered"] == 1 and stats["evaluated"] == 5 and stats["acceptance_rate"] == 0.6
+    # 20 per channel off the target
+    assert stats["cell_error"] == 400.0
+
+
+def test_gated_scheduler_stops_at_max_messages():
+    scheduler = make_scheduler("gated", 4, 4, seed=1, target_cells=gray_targets(4, 4), max_messages=25)
+    run(scheduler)
+    assert scheduler.evaluated == 25 and scheduler.done
+    assert 0 < scheduler.accepted <= 25 and scheduler.covered <= 16
+    assert scheduler.stats()["acceptance_rate"] == round(scheduler.accepted / 25, 4)
+    assert make_scheduler("gated", 4, 4, target_cells=gray_targets(4, 4)).max_messages == 160
+
+
+def test_gated_scheduler_restore_keeps_the_painted_error():
+    scheduler = gated(max_messages=10)
+    scheduler.restore(np.ones(1, dtype=bool), gray(40), 8)
+    assert scheduler.covered == 1 and scheduler.evaluated == 8
+    assert scheduler.assign(gray(60))[0].tolist() == []
+    assert scheduler.assign(gray(30, 10))[0].tolist() == [0]
+    # the second color of that batch was past max_messages
+    assert scheduler.done and scheduler.stats()["cell_error"] == 900.0
+
+
+def test_unknown_scheduler_and_abstract_bases():
+    with pytest.raises(ValueError):
+        make_scheduler("spiral", 4, 4)
+    with pytest.raises(TypeError):
+        CellScheduler(4, 4)
+    with pytest.raises(TypeError):
+        OrderedScheduler(4, 4)
@@ -0,0 +1,94 @@
+import asyncio
+import random
+
+from supervisor import Backoff, StreamSupervisor
+
+
+def test_backoff_is_jittered_below_the_exponential_delay():
+    random.seed(0)
+    backoff = Backoff(initial_s=0.1, max_s=1.0, multiplier=2.0, jitter=0.5)
+    delays = [backoff.next() for _ in range(8)]
+    for attempt, delay in enumerate(delays):
+        ceiling = min(1.0, 0.1 * 2 ** attempt)
+        assert 0.5 * ceiling <= delay <= ceiling
+    # two agents dropped together do not come back in step
+    assert len(set(delays[4:])) == 4
+    backoff.reset()
+    assert backoff.next() <= 0.1
+
+
+def flaky(failures, stay_up_s=None):
+    # a connect that fails `failures` times, then comes up and stays up, or drops again after stay_up_s
+    attempts = []
+
+    async def connect(up):
+        attempts.append(asyncio.get_running_loop().time())
+        if len(attempts) <= failures:
+            raise ConnectionError(f"attempt {len(attempts)}")
+        up()
+        await asyncio.sleep(stay_up_s if stay_up_s is not None else 3600)
+        if stay_up_s is not None:
+            raise ConnectionError("dropped")
+
+    return connect, attempts
+
+
+def test_reconnects_with_backoff_and_clears_the_error():
+    async def run():
+        connect, attempts = flaky(3)
+        supervisor = StreamSupervisor("test", connect, Backoff(initial_s=0.02, max_s=1.0, jitter=0.5))
+        task = asyncio.ensure_future(supervisor.run())
+        while not supervisor.connected:
+            await asyncio.sleep(0.005)
+        stats = supervisor.stats()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return stats, attempts
+
+    stats, attempts = asyncio.run(run())
+    assert stats["connected"] and stats["reconnects"] == 3 and stats["failures"] == 3
+    assert stats["last_error"] is None and stats["downtime_s"] > 0
+    gaps = [b - a for a, b in zip(attempts, attempts[1:])]
+    # every gap is the jittered delay of its attempt, and the delays grow
+    for attempt, gap in enumerate(gaps):
+        assert gap >= 0.5 * 0.02 * 2 ** attempt
+    assert gaps[2] > gaps[0]
+
+
+def test_failed_stream_keeps_its_error():
+    async def run():
+        connect, _ = flaky(10 ** 6)
+        supervisor = StreamSupervisor("test", connect, Backoff(initial_s=0.001, max_s=0.001))
+        task = asyncio.ensure_future(supervisor.run())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return supervisor.stats()
+
+    stats = asyncio.run(run())
+    assert not stats["connected"] and stats["failures"] > 1
+    assert "ConnectionError" in stats["last_error"]
+
+
+def test_reconnects_do_not_pile_up_tasks():
+    async def run():
+        connect, attempts = flaky(0, stay_up_s=0.001)
+        supervisor = StreamSupervisor("test", connect, Backoff(initial_s=0.001, max_s=0.001))
+        task = asyncio.ensure_future(supervisor.run())
+        await asyncio.sleep(0.02)
+        counts = []
+        for _ in range(5):
+            supervisor.restart()
+            await asyncio.sleep(0.02)
+            counts.append(len(asyncio.all_tasks()))
+        reconnects = supervisor.reconnects
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await asyncio.sleep(0)
+        return counts, reconnects, supervisor.restarts, len(asyncio.all_tasks())
+
+    counts, reconnects, restarts, left = asyncio.run(run())
+    assert reconnects > 5 and restarts >= 1
+    # the runner, the supervisor and at most one attempt, however many times the stream came back
+    assert max(counts) <= 3
+    assert left == 1
@@ -0,0 +1,120 @@
+import os
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from agents.canvas import Canvas
+from agents.target import TargetCache, TargetPyramid, area_downsample, cell_stats
+
+
+def image(height=64, width=96, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("cell_size,factors", [(8, [1, 2, 4, 8]), (6, [1, 2, 6]), (1, [1])])
+def test_pyramid_levels_are_area_downsamples(cell_size, factors):
+    target = image(48, 96)
+    pyramid = TargetPyramid(target, cell_size)
+    assert pyramid.factors == factors
+    for level, factor in enumerate(factors):
+        expected = np.rint(area_downsample(target.astype(np.float64), factor)).astype(np.uint8)
+        np.testing.assert_array_equal(pyramid.image(level), expected)
+    assert pyramid.level("grid") == len(factors) - 1
+    assert pyramid.factor(pyramid.level("grid")) == cell_size
+
+
+def test_pyramid_level_names():
+    pyramid = TargetPyramid(image(), 8)
+    assert pyramid.level(None) == pyramid.level("") == 3
+    assert pyramid.level("1") == 1
+    with pytest.raises(ValueError):
+        pyramid.level(4)
+
+
+def test_grid_level_is_the_cell_mean():
+    target = image()
+    mean, variance = cell_stats(target, 8)
+    np.testing.assert_array_equal(TargetPyramid(target, 8).image(3), np.rint(mean).astype(np.uint8))
+    pixels = target.astype(np.float64).reshape(8, 8, 12, 8, 3)
+    np.testing.assert_allclose(variance, pixels.var(axis=(1, 3)), rtol=1e-5, atol=1e-3)
+
+
+def test_a_canvas_painted_with_shrunk_cells_is_the_downsample_of_the_full_one():
+    # what lets draw_image score at a pyramid level without rendering the full canvas
+    rng = np.random.default_rng(1)
+    full, small = Canvas(96, 64, 8), Canvas(24, 16, 2)
+    cells = rng.choice(full.rows * full.columns, 40, replace=False)
+    colors = rng.integers(0, 256, (40, 3))
+    full.paint(cells, colors)
+    small.paint(cells, colors)
+    np.testing.assert_array_equal(area_downsample(full.array, 4), small.array)
+
+
+def test_area_downsample_rejects_partial_blocks():
+    with pytest.raises(ValueError):
+        area_downsample(image(30, 32), 4)
+
+
+def write_image(path, seed):
+    Image.fromarray(image(40, 40, seed)).save(path)
+    return str(path)
+
+
+def test_cache_hit_maps_the_prepared_target_read_only(tmp_path):
+    source = write_image(tmp_path / "target.png", 0)
+    cache = TargetCache(str(tmp_path / "cache"))
+    built = cache.get(source, 32, 32, 8)
+    loaded = cache.get(source, 32, 32, 8)
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert isinstance(loaded.image, np.memmap) and not loaded.image.flags.writeable
+    np.testing.assert_array_equal(loaded.image, built.image)
+    np.testing.assert_array_equal(loaded.cell_mean, built.cell_mean)
+    assert loaded.pyramid.factors == built.pyramid.factors
+    for level in range(len(built.pyramid.levels)):
+        np.testing.assert_array_equal(loaded.pyramid.image(level), built.pyramid.image(level))
+
+
+def test_cache_key_follows_the_file_and_the_settings(tmp_path):
+    source = write_image(tmp_path / "target.png", 0)
+    cache = TargetCache(str(tmp_path / "cache"))
+    cache.get(source, 32, 32, 8)
+    cache.get(source, 32, 32, 4)
+    cache.get(source, 32, 32, 8, resample="nearest")
+    write_image(tmp_path / "target.png", 1)
+    cache.get(source, 32, 32, 8)
+    assert (cache.hits, cache.misses) == (0, 4)
+
+
+def test_cache_rebuilds_a_broken_entry(tmp_path):
+    source = write_image(tmp_path / "target.png", 0)
+    cache = TargetCache(str(tmp_path / "cache"))
+    cache.get(source, 32, 32, 8)
+    entry = cache.entries()[0][2]
+    os.remove(os.path.join(entry, "cell_mean.npy"))
+    cache.get(source, 32, 32, 8)
+    assert (cache.hits, cache.misses) == (0, 2)
+    cache.get(source, 32, 32, 8)
+    assert cache.hits == 1
+
+
+def test_cache_evicts_the_least_recently_used_entry(tmp_path):
+    sources = [write_image(tmp_path / f"target_{n}.png", n) for n in range(3)]
+    cache = TargetCache(str(tmp_path / "cache"))
+    cache.get(sources[0], 32, 32, 8)
+    entry_size = cache.entries()[0][1]
+    cache.max_bytes = 2 * entry_size
+    cache.get(sources[1], 32, 32, 8)
+    # touching the first entry makes the second the least recently used
+    time.sleep(0.01)
+    cache.get(sources[0], 32, 32, 8)
+    time.sleep(0.01)
+    cache.get(sources[2], 32, 32, 8)
+    assert len(cache.entries()) == 2
+    hits = cache.hits
+    cache.get(sources[0], 32, 32, 8)
+    cache.get(sources[2], 32, 32, 8)
+    assert cache.hits == hits + 2
+    cache.get(sources[1], 32, 32, 8)
+    assert cache.misses == 4
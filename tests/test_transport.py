@@ -0,0 +1,121 @@
+import asyncio
+
+import agent_pb2
+from broker import Broker, serve
+from subscription import BLOCK
+from supervisor import Backoff, StreamSupervisor
+from topics import message_topics, topic_matches
+from transport import GrpcTransport, LoopbackBroker, LoopbackTransport
+
+
+def connect(topic):
+    return agent_pb2.Connect(user=agent_pb2.Agent(id=topic, name=topic), topics=[topic])
+
+
+def message(transport, topic, n):
+    return transport.message(None, {"agent": topic, "data": {"n": n}}, "AGENT", f"{n}", f"{n}", [], None)
+
+
+def test_loopback_publish_loop_lets_other_tasks_run():
+    async def run():
+        transport = LoopbackTransport(LoopbackBroker())
+        received = []
+        ticks = 0
+
+        async def on_message(m):
+            received.append(m.content["data"]["n"])
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0)
+
+        subscriber = asyncio.ensure_future(transport.messages(connect("colors"), on_message))
+        other = asyncio.ensure_future(ticker())
+        await asyncio.sleep(0)
+        # what ColorAgent.execute does: publish in a loop with nothing else to wait on
+        for n in range(100):
+            await transport.broadcast(message(transport, "colors", n))
+        seen = len(received), ticks
+        subscriber.cancel()
+        other.cancel()
+        await asyncio.wait([subscriber, other])
+        return seen
+
+    received, ticks = asyncio.run(run())
+    assert received >= 99
+    assert ticks >= 99
+
+
+def test_loopback_releases_publishers_blocked_on_a_closed_subscriber():
+    async def run():
+        broker = LoopbackBroker(queue_size=1, policy=BLOCK)
+        transport = LoopbackTransport(broker)
+        stuck = asyncio.Event()
+
+        async def on_message(m):
+            await stuck.wait()
+
+        subscriber = asyncio.ensure_future(transport.messages(connect("colors"), on_message))
+        await asyncio.sleep(0)
+        # one message held by on_message, one in the queue, the third waits for room
+        await transport.broadcast(message(transport, "colors", 0))
+        await transport.broadcast(message(transport, "colors", 1))
+        publisher = asyncio.ensure_future(transport.broadcast(message(transport, "colors", 2)))
+        await asyncio.sleep(0.01)
+        assert not publisher.done()
+        subscriber.cancel()
+        await asyncio.wait_for(publisher, 1)
+        return broker.routed, broker.dropped, broker.subscriptions
+
+    assert asyncio.run(run()) == (2, 1, set())
+
+
+def test_batch_with_an_untagged_member_goes_to_everyone():
+    transport = GrpcTransport("localhost:0")
+    sender = agent_pb2.Agent(id="a", name="a")
+    colors = transport.message(sender, {"agent": "colors", "data": {"r": 1}}, "AGENT", "1", "1", [], "pickle")
+    connect = transport.message(sender, {"type": "CONNECT"}, "AGENT", "2", "2", [], "pickle")
+    mixed = transport.batch(sender, [colors, connect])
+    assert message_topics(mixed.tags) == set()
+    assert topic_matches({"work"}, message_topics(mixed.tags))
+    assert [m.id for m in transport.unbatch(mixed)] == ["1", "2"]
+    assert message_topics(transport.batch(sender, [colors]).tags) == {"colors"}
+
+
+def test_stream_reconnects_when_the_pool_resets_its_channel():
+    async def run():
+        server, port = await serve("127.0.0.1:0", Broker())
+        transport = GrpcTransport(f"127.0.0.1:{port}", health_check_s=0)
+
+        async def on_message(m):
+            pass
+
+        async def stream(up):
+            async def opened():
+                up()
+
+            await transport.messages(connect("colors"), on_message, opened)
+
+        supervisor = StreamSupervisor("messages", stream, Backoff(initial_s=0.01, max_s=0.01))
+        task = asyncio.ensure_future(supervisor.run())
+        try:
+            while not supervisor.connected:
+                await asyncio.sleep(0.01)
+            # what the health check does to a failing channel, under the live stream
+            await transport.pool._reset(0)
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if supervisor.reconnects and supervisor.connected:
+                    break
+            return task.done(), supervisor.stats()
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await transport.close()
+            await server.stop(None)
+
+    done, stats = asyncio.run(run())
+    assert not done
+    assert stats["connected"] and stats["reconnects"] == 1 and stats["failures"] == 1
@@ -0,0 +1,21 @@
+TOPIC_TAG_PREFIX = "topic:"
+
+
+def topic_tag(topic):
+    return f"{TOPIC_TAG_PREFIX}{topic}"
+
+
+def agent_topic(agent_id):
+    # every subscriber listens on its own id, which also marks it as topic aware
+    return f"agent:{agent_id}"
+
+
+def message_topics(tags):
+    return {t[len(TOPIC_TAG_PREFIX):] for t in tags if t.startswith(TOPIC_TAG_PREFIX)}
+
+
+def topic_matches(subscribed, topics):
+    # untagged messages go to everyone, subscribers that declared nothing get everything
+    if not topics or not subscribed:
+        return True
+    return not subscribed.isdisjoint(topics)
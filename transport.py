@@ -0,0 +1,300 @@
+import asyncio
+import datetime
+import logging
+import time
+from abc import ABC, abstractmethod
+
+import grpc
+from google.protobuf.timestamp_pb2 import Timestamp
+
+import agent_pb2 as agent_pb2
+from batching import BATCH_TAG
+from channel_pool import ChannelPool
+from codec import LazyContent, encode_fields
+from subscription import DROP, Subscription, route
+from topics import message_topics, topic_tag
+
+log = logging.getLogger("RAKUN-MAS")
+
+PUBLISH_STREAM_ACCEPTED = ("rakun-publish-stream", "accepted")
+# calls sent again after UNAVAILABLE. A publish may have reached the broker before the error, so it is not one,
+# it fails with a ConnectionError instead
+RETRIED = ("StartDynamicAgent",)
+
+
+def timestamp():
+    now = time.time()
+    seconds = int(now)
+    nanos = int((now - seconds) * 10 ** 9)
+    return Timestamp(seconds=seconds, nanos=nanos)
+
+
+class Transport(ABC):
+    # how an AgentManager reaches the other agents. message() builds what a publish sends, the other methods move
+    # it. Received messages have the sender, type, timestamp and tags fields of agent_pb2.Message
+
+    @abstractmethod
+    def message(self, sender, message, msg_type, id, request_id, tags, codec):
+        pass
+
+    def batch(self, sender, messages):
+        # one message carrying several, None if they go one by one
+        return None
+
+    def unbatch(self, message):
+        # the messages a batch carries, None if it is not a batch
+        return None
+
+    @abstractmethod
+    def content(self, message):
+        pass
+
+    @abstractmethod
+    async def broadcast(self, message):
+        # a ConnectionError means the broker went away and the message may be lost
+        pass
+
+    @abstractmethod
+    async def start_agent(self, name, params):
+        pass
+
+    @abstractmethod
+    async def messages(self, connect, on_message, opened=None):
+        # consumes the subscription described by the agent_pb2.Connect until it fails
+        pass
+
+    @abstractmethod
+    async def sync_time(self, connect, on_time):
+        pass
+
+    async def open_publish_stream(self):
+        # a call to write() messages to, None if publishing one at a time is all there is
+        return None
+
+    async def close(self):
+        pass
+
+
+class GrpcTransport(Transport):
+    # protobuf messages through a broker, their fields encoded by the codec
+
+    def __init__(self, address, pool_size=1, keepalive_ms=30000, health_check_s=5.0, pool=None,
+                 publish_stream_timeout_s=5.0, publish_timeout_s=30.0):
+        self.address = address
+        self.publish_stream_timeout_s = publish_stream_timeout_s
+        # how long a publish waits for a broker that is down, it only fails after that
+        self.publish_timeout_s = publish_timeout_s
+        # agents hosted in one process share their host's pool
+        self.owns_pool = pool is None
+        self.pool = pool or ChannelPool(address, size=pool_size, keepalive_ms=keepalive_ms,
+                                        health_check_s=health_check_s)
+
+    async def _call(self, method, request, **options):
+        stub = self.pool.stub()
+        try:
+            return await getattr(stub, method)(request, **options)
+        except grpc.aio.AioRpcError as e:
+            if e.code() == grpc.StatusCode.DEADLINE_EXCEEDED and options.get("wait_for_ready"):
+                # waited out the whole timeout for a broker that did not come back
+                raise ConnectionError(f"{method} timed out waiting for {self.address}") from e
+            if e.code() == grpc.StatusCode.CANCELLED and method not in RETRIED:
+                # a broker going down cancels the calls it was serving
+                raise ConnectionError(f"{method} was cancelled by {self.address}, it may or may not have it") from e
+            if e.code() != grpc.StatusCode.UNAVAILABLE:
+                raise e
+            await self.pool.reset(stub)
+            if method not in RETRIED:
+                raise ConnectionError(f"{method} failed, {self.address} may or may not have it: {e.details()}") from e
+        except asyncio.CancelledError:
+            # closing a channel cancels the calls on it, that is a dropped connection, not this task being cancelled
+            if not self.pool.closed(stub):
+                raise
+            if method not in RETRIED:
+                raise ConnectionError(f"{method} was cancelled, its channel closed")
+        stub = self.pool.stub()
+        try:
+            return await getattr(stub, method)(request, **options)
+        except asyncio.CancelledError:
+            if not self.pool.closed(stub):
+                raise
+            raise ConnectionError(f"{method} was cancelled, its channel closed")
+
+    async def _open_stream(self, method, request, on_item, opened=None):
+        stub = self.pool.stub()
+        try:
+            stream = getattr(stub, method)(request)
+            if opened is not None:
+                await opened()
+            async for item in stream:
+                await on_item(item)
+        except grpc.aio.AioRpcError as e:
+            if e.code() == grpc.StatusCode.UNAVAILABLE:
+                await self.pool.reset(stub)
+            raise
+        except asyncio.CancelledError:
+            if not self.pool.closed(stub):
+                raise
+            raise ConnectionError(f"{method} was cancelled, its channel closed")
+
+    def message(self, sender, message, msg_type, id, request_id, tags, codec):
+        fields, codec_tags = encode_fields(message, codec)
+        content = [agent_pb2.Data(key=k, value=v) for k, v in fields]
+        if isinstance(message.get("agent"), str):
+            # create_message() payloads are routed by their agent key
+            codec_tags.append(topic_tag(message["agent"]))
+
+        return agent_pb2.Message(
+            id=id if id else f"{datetime.datetime.utcnow().timestamp()}",
+            sender=sender,
+            content=content,
+            type=msg_type,
+            timestamp=timestamp(),
+            request_id=request_id if request_id else f"{datetime.datetime.utcnow().timestamp()}",
+            tags=list(tags) + codec_tags
+        )
+
+    def batch(self, sender, messages):
+        topics = set()
+        for m in messages:
+            member = message_topics(m.tags)
+            if not member:
+                # an untagged member goes to everyone, so does the batch carrying it
+                topics = set()
+                break
+            topics.update(member)
+        return agent_pb2.Message(
+            id=f"{datetime.datetime.utcnow().timestamp()}",
+            sender=sender,
+            content=[agent_pb2.Data(key=m.id, value=m.SerializeToString()) for m in messages],
+            type="AGENT",
+            timestamp=timestamp(),
+            tags=[BATCH_TAG] + [topic_tag(t) for t in sorted(topics)]
+        )
+
+    def unbatch(self, message):
+        if BATCH_TAG not in message.tags:
+            return None
+        return (agent_pb2.Message.FromString(c.value) for c in message.content)
+
+    def content(self, message):
+        return LazyContent(message)
+
+    async def broadcast(self, message):
+        # a call that cannot reach the broker waits for it instead of failing, it was never sent so nothing is
+        # duplicated once the broker is back
+        await self._call("BroadcastMessage", message, wait_for_ready=True, timeout=self.publish_timeout_s)
+
+    async def start_agent(self, name, params):
+        await self._call("StartDynamicAgent", agent_pb2.DynamicAgent(
+            name=name,
+            initConfigs=[agent_pb2.InitData(key=k, value=v) for k, v in params.items()]
+        ))
+
+    async def messages(self, connect, on_message, opened=None):
+        await self._open_stream("CreateStream", connect, on_message, opened)
+
+    async def sync_time(self, connect, on_time):
+        async def on_delta(td):
+            await on_time(datetime.datetime.fromtimestamp(td.timestamp.seconds + td.timestamp.nanos / 1e9))
+
+        await self._open_stream("SyncTime", connect, on_delta)
+
+    async def open_publish_stream(self):
+        call = self.pool.stub().PublishStream()
+        # brokers accept the stream with a marker in the initial metadata, anything else is a broker without it
+        try:
+            metadata = await asyncio.wait_for(call.initial_metadata(), self.publish_stream_timeout_s)
+        except asyncio.TimeoutError:
+            log.warning(f"{self.address} did not answer PublishStream in {self.publish_stream_timeout_s}s, "
+                        f"falling back to unary publish")
+            call.cancel()
+            return None
+        if tuple(metadata.get_all(PUBLISH_STREAM_ACCEPTED[0])) != PUBLISH_STREAM_ACCEPTED[1:]:
+            log.warning(f"{self.address} has no PublishStream, falling back to unary publish")
+            call.cancel()
+            return None
+        return call
+
+    async def close(self):
+        if self.owns_pool:
+            await self.pool.close()
+
+
+class LoopbackMessage:
+    # the in-process counterpart of agent_pb2.Message, content is the published dict itself
+
+    __slots__ = ("id", "sender", "content", "type", "timestamp", "request_id", "tags")
+
+    def __init__(self, id, sender, content, type, timestamp, request_id, tags):
+        self.id = id
+        self.sender = sender
+        self.content = content
+        self.type = type
+        self.timestamp = timestamp
+        self.request_id = request_id
+        self.tags = tags
+
+
+class LoopbackBroker:
+    # routes messages between the agents of one process by topic, like broker.Broker, without serializing them.
+    # Every subscriber gets the same objects, so received content is read only. A full subscriber queue drops
+    # the message or, with the block policy, makes the publisher wait. launcher(name, params) starts dynamic agents
+
+    def __init__(self, queue_size=1024, policy=DROP, sync_interval_s=1.0, launcher=None):
+        self.queue_size = queue_size
+        self.policy = policy
+        self.sync_interval_s = sync_interval_s
+        self.launcher = launcher
+        self.subscriptions = set()
+        self.routed = 0
+        self.dropped = 0
+
+    async def route(self, message):
+        routed, dropped = await route(self.subscriptions, message, message_topics(message.tags))
+        self.routed += routed
+        self.dropped += dropped
+        # an offer that fits returns without suspending, a publish loop would otherwise never give the
+        # subscribers, or anything else on the loop, a turn
+        await asyncio.sleep(0)
+
+
+class LoopbackTransport(Transport):
+    # agents of one process talking through a LoopbackBroker, no broker process, no channel and no codec
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def message(self, sender, message, msg_type, id, request_id, tags, codec):
+        tags = list(tags)
+        if isinstance(message.get("agent"), str):
+            tags.append(topic_tag(message["agent"]))
+        return LoopbackMessage(id, sender, message, agent_pb2.Message.Type.Value(msg_type), timestamp(), request_id,
+                               tags)
+
+    def content(self, message):
+        return message.content
+
+    async def broadcast(self, message):
+        await self.broker.route(message)
+
+    async def start_agent(self, name, params):
+        if self.broker.launcher is None:
+            raise ValueError(f"cannot start {name}, the loopback broker has no launcher")
+        await self.broker.launcher(name, params)
+
+    async def messages(self, connect, on_message, opened=None):
+        sub = Subscription(connect.user, connect.topics, self.broker.queue_size, self.broker.policy)
+        self.broker.subscriptions.add(sub)
+        try:
+            if opened is not None:
+                await opened()
+            while True:
+                await on_message(await sub.queue.get())
+        finally:
+            self.broker.subscriptions.discard(sub)
+            sub.close()
+
+    async def sync_time(self, connect, on_time):
+        while True:
+            await on_time(datetime.datetime.now())
+            await asyncio.sleep(self.broker.sync_interval_s)